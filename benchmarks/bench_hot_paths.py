@@ -0,0 +1,319 @@
+'''
+Benchmarks for the parts of fixture that don't need a simulator: sampling,
+regression, pole/zero fitting, results processing, checkpoints and plots.
+Everything runs on synthetic data (fake signals, fake reads, generated
+DataFrames), at a few sizes each, so it's easy to see how things scale.
+
+    python benchmarks/bench_hot_paths.py                 # print timings
+    python benchmarks/bench_hot_paths.py --record        # also save them
+    python benchmarks/bench_hot_paths.py --compare HEAD~3
+    python benchmarks/bench_hot_paths.py --only regression --quick
+
+--record saves to benchmarks/results/<commit>.json, and --compare takes a
+commit (or a json file) recorded earlier and exits with an error if any
+case got slower by more than --tolerance (default 30%)
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+import numpy as np
+import pandas
+
+from fixture.sampler import Sampler
+from fixture.signals import SignalIn, SignalOut, SignalArray, SignalManager, \
+    create_input_domain_signal
+from fixture.regression import Regression
+from fixture.modal_analysis import ModalAnalysis
+from fixture.template_creation_utils import make_nondecreasing
+from fixture.create_testbench import Testbench
+from fixture.checkpoints import Checkpoint
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'results')
+
+
+# synthetic fixtures
+
+def analog_inputs(n, optional=False):
+    return [create_input_domain_signal(f'in{i}', (0.0, 1.2), spice_pin=f'in{i}',
+                                       optional_expr=optional)
+            for i in range(n)]
+
+
+def qa_bus(name, num_bits):
+    bits = [SignalIn(None, 'binary_analog', True, True, f'{name}<{i}>',
+                     f'{name}<{i}>', None, False)
+            for i in range(num_bits)]
+    return SignalArray(np.array(bits), {'bus_type': 'any'}, spice_name=name)
+
+
+class FakeTest:
+    '''
+    Just enough of a TemplateMaster.Test for Regression, Testbench.get_results
+    and Checkpoint: out = gain*in + offset, with gain and offset depending
+    on the optional inputs
+    '''
+    def __init__(self, num_optional):
+        self.input = create_input_domain_signal('in_single', (0.0, 1.2), spice_pin='in_single')
+        self.optional = analog_inputs(num_optional, optional=True)
+        self.output = SignalOut('real', 'out_single', 'out_single', 'out_single', False)
+        self.signals = SignalManager([self.input, *self.optional, self.output], {})
+        # what _expand_parameter_algebra makes of {'out': {'gain': 'in_single', 'offset': '1'}}
+        self.parameter_algebra_vectored = {'out': {'gain': (self.input,),
+                                                   'offset': (Regression.one_literal,)}}
+        self.num_samples = 0
+
+    def analysis(self, reads):
+        return {'out': reads.value, 'out_squared': reads.value**2}
+
+    def __str__(self):
+        return 'FakeTest'
+
+
+def fake_template(test):
+    return types.SimpleNamespace(extras={}, signals=test.signals, tests=[test])
+
+
+def regression_data(test, num_samples, rng):
+    data = {s: rng.uniform(0, 1.2, num_samples) for s in test.optional}
+    gain = 2 + sum(0.1 * data[s] for s in test.optional)
+    offset = 0.5 - sum(0.05 * data[s] for s in test.optional)
+    data[test.input] = rng.uniform(0, 1.2, num_samples)
+    data['out'] = gain * data[test.input] + offset + rng.normal(0, 1e-3, num_samples)
+    data[Regression.one_literal] = 1
+    return pandas.DataFrame(data)
+
+
+class FakeRead:
+    # stands in for a tester.GetValueReturnObject after the sim is done
+    def __init__(self, value):
+        self.value = value
+
+
+# benchmark cases: each setup(size) returns the function to time
+
+def setup_get_samples(size):
+    dims = analog_inputs(4) + [qa_bus('adj', 8)]
+    return lambda: Sampler.get_samples(dims, size)
+
+
+def setup_convert_qa_therm_random(size):
+    # it expects one sample per LHS row
+    rng = np.random.default_rng(0)
+    samples = (rng.permutation(size) + rng.random(size)) / size
+    return lambda: Sampler.convert_qa_therm_random(samples, 16)
+
+
+def setup_regression(size):
+    test = FakeTest(num_optional=3)
+    template = fake_template(test)
+    template.extras['analog_order'] = 2
+    data = regression_data(test, size, np.random.default_rng(0))
+    return lambda: Regression(template, test, data)
+
+
+def setup_extract_pzs(size):
+    t = np.linspace(0, 5e-9, size)
+    h_step = 1 - 0.6*np.exp(-2e9*t) - 0.4*np.exp(-20e9*t)
+    return lambda: ModalAnalysis(t, h_step).extract_pzs(2, 1, [])
+
+
+def setup_make_nondecreasing(size):
+    rng = np.random.default_rng(0)
+    ys = np.cumsum(rng.normal(0.01, 0.1, size))
+    return lambda: make_nondecreasing(ys)
+
+
+def setup_get_results(size):
+    test = FakeTest(num_optional=2)
+    test.num_samples = size
+    rng = np.random.default_rng(0)
+    test_vectors = {s: list(rng.uniform(0, 1.2, size)) for s in [test.input, *test.optional]}
+    tester = types.SimpleNamespace(circuit=types.SimpleNamespace(circuit=None))
+    tb = Testbench(fake_template(test), tester, test, test_vectors)
+    tb.result_processing_list = [((), i, (FakeRead(rng.normal()), {}))
+                                 for i in range(size)]
+    return tb.get_results
+
+
+def setup_checkpoint(storage_format):
+    def setup(size):
+        test = FakeTest(num_optional=2)
+        data = regression_data(test, size, np.random.default_rng(0))
+        data['mode_id'] = [(0, 1)] * size
+        folder = tempfile.mkdtemp(prefix='bench_checkpoint_')
+        checkpoint = Checkpoint(fake_template(test), folder, storage_format)
+
+        def run():
+            # it prints a line every time it overwrites the file
+            with contextlib.redirect_stdout(io.StringIO()):
+                checkpoint.save_extracted_data(test, data)
+            checkpoint.data[test]['extracted_data'] = None
+            return checkpoint.load_extracted_data(test)
+        return run
+    return setup
+
+
+def setup_plot_helper(size):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    from fixture.plot_helper import PlotHelper
+    test = FakeTest(num_optional=2)
+    template = fake_template(test)
+    data = regression_data(test, size, np.random.default_rng(0))
+    regression = Regression(template, test, data)
+    folder = tempfile.mkdtemp(prefix='bench_plots_')
+
+    def run():
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            ph = PlotHelper(regression.regression_dataframe,
+                            test.parameter_algebra_vectored, regression.results)
+            ph.plot_regression()
+        finally:
+            plt.close('all')
+            os.chdir(cwd)
+    return run
+
+
+def setup_plot_helper_columns(size):
+    # the get_column calls plot_regression makes, without drawing anything
+    from fixture.plot_helper import PlotHelper
+    test = FakeTest(num_optional=3)
+    template = fake_template(test)
+    template.extras['analog_order'] = 2
+    data = regression_data(test, size, np.random.default_rng(0))
+    regression = Regression(template, test, data)
+
+    def run():
+        ph = PlotHelper(regression.regression_dataframe,
+                        test.parameter_algebra_vectored, regression.results)
+        for input in [test.input, *test.optional]:
+            nominal = {opt: 0.6 for opt in test.optional if opt is not input}
+            for overrides in [{}, nominal]:
+                ph.get_column(input, overrides=overrides)
+                ph.get_column('out', overrides=overrides)
+                ph.get_column('out', overrides=overrides, lhs_pred=True)
+    return run
+
+
+# name: (setup, sizes, quick sizes)
+CASES = {
+    'sampler_get_samples': (setup_get_samples, [100, 1000, 10000], [100]),
+    'convert_qa_therm_random': (setup_convert_qa_therm_random, [100, 1000, 10000, 100000], [100]),
+    'regression': (setup_regression, [100, 1000, 10000], [100]),
+    'extract_pzs': (setup_extract_pzs, [100, 1000, 5000], [100]),
+    'make_nondecreasing': (setup_make_nondecreasing, [1000, 10000, 100000], [1000]),
+    'testbench_get_results': (setup_get_results, [100, 1000, 10000], [100]),
+    'checkpoint_npy': (setup_checkpoint('npy'), [100, 10000, 100000], [100]),
+    'checkpoint_csv': (setup_checkpoint('csv'), [100, 10000, 100000], [100]),
+    'plot_helper_columns': (setup_plot_helper_columns, [100, 10000, 100000], [100]),
+    'plot_helper': (setup_plot_helper, [100, 1000], [100]),
+}
+
+
+def time_case(fn, min_time=0.2, max_repeats=50):
+    # best of several runs, after one warmup run
+    fn()
+    times = []
+    start = time.perf_counter()
+    while len(times) < max_repeats and (len(times) < 3 or time.perf_counter() - start < min_time):
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+    return {'best': min(times), 'median': float(np.median(times)), 'repeats': len(times)}
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], check=True,
+                              capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+
+
+def load_results(name):
+    path = name if os.path.exists(name) else os.path.join(RESULTS_DIR, f'{name}.json')
+    if not os.path.exists(path):
+        # maybe a ref like HEAD~3 rather than a hash
+        commit = subprocess.run(['git', 'rev-parse', '--short', name], check=True,
+                                capture_output=True, text=True).stdout.strip()
+        path = os.path.join(RESULTS_DIR, f'{commit}.json')
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(results, baseline, tolerance):
+    problems = []
+    for name, by_size in results['cases'].items():
+        for size, timing in by_size.items():
+            old = baseline['cases'].get(name, {}).get(size)
+            if old is None:
+                continue
+            ratio = timing['best'] / old['best']
+            marker = '  SLOWER' if ratio > 1 + tolerance else ''
+            print(f'{name:26s} {size:>8s} {old["best"]*1e3:10.3f} ms -> '
+                  f'{timing["best"]*1e3:10.3f} ms  x{ratio:.2f}{marker}')
+            if marker:
+                problems.append(f'{name}[{size}] x{ratio:.2f}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--only', nargs='*', help='only run cases with these names')
+    parser.add_argument('--quick', action='store_true', help='only the smallest size of each case')
+    parser.add_argument('--record', nargs='?', const='', default=None,
+                        help='save results, by default to benchmarks/results/<commit>.json')
+    parser.add_argument('--compare', help='commit or json file recorded earlier')
+    parser.add_argument('--tolerance', type=float, default=0.3)
+    args = parser.parse_args()
+
+    results = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'numpy': np.__version__,
+        'pandas': pandas.__version__,
+        'machine': platform.node(),
+        'cases': {},
+    }
+    for name, (setup, sizes, quick_sizes) in CASES.items():
+        if args.only and name not in args.only:
+            continue
+        results['cases'][name] = {}
+        for size in (quick_sizes if args.quick else sizes):
+            timing = time_case(setup(size))
+            # json keys are strings anyway
+            results['cases'][name][str(size)] = timing
+            print(f'{name:26s} {size:>8d} {timing["best"]*1e3:10.3f} ms '
+                  f'(median {timing["median"]*1e3:.3f} ms, {timing["repeats"]} runs)')
+
+    if args.record is not None:
+        path = args.record or os.path.join(RESULTS_DIR, f'{results["commit"]}.json')
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(results, f, indent=2)
+        print('Saved results to', path)
+
+    if args.compare:
+        problems = compare(results, load_results(args.compare), args.tolerance)
+        if problems:
+            print('REGRESSION:', ', '.join(problems))
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,113 @@
+'''
+Startup benchmark: how long "import fixture" takes and how much memory it
+uses, each measured in a fresh interpreter.
+
+    python benchmarks/bench_import.py                  # print results
+    python benchmarks/bench_import.py --record base.json
+    python benchmarks/bench_import.py --compare base.json
+
+With --compare, exits with an error if import time or peak RSS went up by
+more than --tolerance (default 25%) compared to the recorded results, or if
+"import fixture" now loads one of the modules that should stay lazy
+'''
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+
+# fixture should only import these when a template or plot needs them.
+# fault imports matplotlib itself, so that one isn't checked
+LAZY_MODULES = ['statsmodels', 'dragonphy', 'dave', 'fixture.plot_helper',
+                'fixture.temp_channel_data_generator', 'fixture.mgenero_interface',
+                'fixture.templates.amplifier', 'fixture.templates.sampler']
+
+MEASURE = '''
+import json, resource, sys, time
+rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+rss_after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+print(json.dumps({{
+    'time': elapsed,
+    'rss_kb': rss_after,
+    'rss_delta_kb': rss_after - rss_before,
+    'modules': len(sys.modules),
+    'loaded_lazy': [m for m in {lazy!r} if m in sys.modules],
+}}))
+'''
+
+
+def measure(statement, repeats):
+    code = MEASURE.format(statement=statement, lazy=LAZY_MODULES)
+    runs = []
+    for _ in range(repeats):
+        out = subprocess.run([sys.executable, '-c', code], check=True,
+                             capture_output=True, text=True).stdout
+        runs.append(json.loads(out.strip().splitlines()[-1]))
+    return {
+        'statement': statement,
+        'time': statistics.median(r['time'] for r in runs),
+        'time_min': min(r['time'] for r in runs),
+        'rss_kb': statistics.median(r['rss_kb'] for r in runs),
+        'rss_delta_kb': statistics.median(r['rss_delta_kb'] for r in runs),
+        'modules': runs[0]['modules'],
+        'loaded_lazy': runs[0]['loaded_lazy'],
+    }
+
+
+def compare(results, baseline, tolerance):
+    problems = []
+    for name, result in results.items():
+        if result['loaded_lazy'] and name == 'fixture':
+            problems.append(f'"{result["statement"]}" loaded {result["loaded_lazy"]}')
+        if name not in baseline:
+            continue
+        old = baseline[name]
+        for key in ['time', 'rss_delta_kb']:
+            if result[key] > old[key] * (1 + tolerance):
+                problems.append(f'{name} {key} went from {old[key]:.4g} to {result[key]:.4g}')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--record', help='save results to this json file')
+    parser.add_argument('--compare', help='compare against results saved with --record')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    # fault is measured too, since most of fixture's startup is fault's
+    statements = {
+        'fault': 'import fault',
+        'fixture': 'import fixture',
+        'fixture_amplifier': 'import fixture; fixture.AmplifierTemplate',
+    }
+    results = {name: measure(statement, args.repeats)
+               for name, statement in statements.items()}
+
+    for name, r in results.items():
+        print(f'{name:20s} {r["time"]*1e3:8.1f} ms  rss {r["rss_kb"]/1024:7.1f} MB '
+              f'(+{r["rss_delta_kb"]/1024:.1f} MB)  {r["modules"]} modules')
+        if r['loaded_lazy']:
+            print(f'{"":20s} loaded {r["loaded_lazy"]}')
+
+    if args.record:
+        with open(args.record, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        problems = compare(results, baseline, args.tolerance)
+        for problem in problems:
+            print('REGRESSION:', problem)
+        if problems:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
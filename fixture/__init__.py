@@ -1,16 +1,43 @@
 import collections.abc
 # TODO this solves a problem where magma tries to use collections.abc before
 # importing it. Strangely, importing collections alone is not good enough
+import importlib
 
+from .waveform import Waveform
 from .representation import Representation
-from .temp_channel_data_generator import ChannelUtil
 from .tester import Tester
 from .regression import Regression
 from .template_master import TemplateMaster
 from .sampler import Sampler
-from .plot_helper import PlotHelper
-from .templates import *
 from .create_testbench import Testbench
 from .dump_yaml import dummy_dump
-from .mgenero_interface import dump_yaml
 from .run import run
+from . import templates
+
+
+def dump_yaml(*args, **kwargs):
+    # mgenero_interface needs DaVE, so wait until someone actually dumps
+    from .mgenero_interface import dump_yaml
+    return dump_yaml(*args, **kwargs)
+
+
+# These pull in matplotlib, dragonphy, or a template's dependencies, so
+# they are only imported the first time someone asks for them
+_lazy_attributes = {
+    'ChannelUtil': '.temp_channel_data_generator',
+    'PlotHelper': '.plot_helper',
+    **{name: '.templates' for name in templates.__all__},
+}
+
+
+def __getattr__(name):
+    if name not in _lazy_attributes:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
+    module = importlib.import_module(_lazy_attributes[name], __name__)
+    value = getattr(module, name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_lazy_attributes))
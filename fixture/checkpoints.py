@@ -1,13 +1,193 @@
+import ast
 import csv
+import glob
 import os
+import pickle
+import numpy as np
 import pandas
 import yaml
+from fixture.signals import SignalIn, SignalOut
+
+
+class CSVStorage:
+    '''
+    One csv file per table, with the string version of each column name as
+    the header. Easy to read by hand, but slow to parse for wide tables and
+    it loses dtypes, so mode_id tuples have to be parsed back from strings
+    '''
+    extension = '.csv'
+
+    @staticmethod
+    def exists(filename):
+        return os.path.isfile(filename)
+
+    @staticmethod
+    def save(filename, data):
+        with open(filename, 'w') as f:
+            if isinstance(data, pandas.DataFrame):
+                data.to_csv(f)
+            else:
+                writer = csv.writer(f)
+                keys = list(data.keys())
+                writer.writerow([str(key) for key in keys])
+                column_major = [data[key] for key in keys]
+                row_major = zip(*column_major)
+                writer.writerows(row_major)
+
+    @staticmethod
+    def load(filename, str_to_signal):
+        with open(filename, 'r') as f:
+            try:
+                data = pandas.read_csv(f)
+            except pandas.errors.EmptyDataError:
+                data = pandas.DataFrame({})
+        data.rename(str_to_signal, axis='columns', inplace=True)
+        if 'mode_id' in data.columns:
+            # written as e.g. "(0, 1)", but ModePlan needs the tuple back
+            data['mode_id'] = [ast.literal_eval(m) if isinstance(m, str) else m
+                               for m in data['mode_id']]
+        return data
+
+
+class NpyStorage:
+    '''
+    One folder per table, with one .npy file per column and a schema.yaml
+    that records the column order, which columns are Signals, and how to
+    rebuild columns that aren't plain arrays. Columns are memory-mapped on
+    load (copy-on-write, so edits never touch the files)
+    Column kinds:
+        array: any numeric or string column, saved as is
+        tuple: a column of equal-length int tuples like mode_id, saved as a
+            2D array and turned back into tuples on load
+        object: anything else, pickled and not memory-mapped
+    A DataFrame's index is saved the same way as a column.
+    Column names that aren't strings or Signals (ints, tuples) and columns
+    that were object dtype are noted in the schema, so they load back as
+    they were saved
+    '''
+    extension = ''
+    schema_filename = 'schema.yaml'
+
+    @classmethod
+    def exists(cls, filename):
+        return os.path.isfile(os.path.join(filename, cls.schema_filename))
+
+    @staticmethod
+    def _to_array(values):
+        values = values.to_numpy() if isinstance(values, pandas.Series) else values
+        if isinstance(values, np.ndarray) and values.dtype != object:
+            return 'array', values
+        values = list(values)
+        if (len(values) > 0 and all(isinstance(v, tuple) for v in values)
+                and len(set(len(v) for v in values)) == 1
+                and all(isinstance(x, (int, np.integer)) for v in values for x in v)):
+            return 'tuple', np.array(values, dtype=int).reshape(len(values), -1)
+        try:
+            array = np.array(values)
+        except ValueError:
+            array = None
+        if array is not None and array.ndim == 1 and array.dtype.kind in 'biufcUS':
+            return 'array', array
+        array = np.empty(len(values), dtype=object)
+        array[:] = values
+        return 'object', array
+
+    @classmethod
+    def _save_column(cls, filename, column_file, values):
+        kind, array = cls._to_array(values)
+        np.save(os.path.join(filename, column_file), array,
+                allow_pickle=(kind == 'object'))
+        column = {'kind': kind, 'dtype': str(array.dtype), 'file': column_file}
+        if kind == 'array' and getattr(values, 'dtype', None) == object:
+            # e.g. strings, which numpy would give back as a '<U' array
+            column['object'] = True
+        return column
+
+    @staticmethod
+    def _load_column(filename, column):
+        path = os.path.join(filename, column['file'])
+        if column['kind'] == 'object':
+            return np.load(path, allow_pickle=True)
+        values = np.load(path, mmap_mode='c')
+        if column['kind'] == 'tuple':
+            values = [tuple(int(x) for x in row) for row in values]
+        elif column.get('object', False):
+            values = values.astype(object)
+        return values
+
+    @staticmethod
+    def _literal_key(key):
+        # repr of a key that ast.literal_eval gives back exactly, or None
+        if isinstance(key, (str, SignalIn, SignalOut)):
+            return None
+        try:
+            if ast.literal_eval(repr(key)) == key:
+                return repr(key)
+        except (ValueError, SyntaxError):
+            pass
+        return None
+
+    @classmethod
+    def save(cls, filename, data):
+        os.makedirs(filename, exist_ok=True)
+        for old in glob.glob(os.path.join(filename, '*.npy')):
+            os.remove(old)
+
+        columns = []
+        for i, (key, values) in enumerate(data.items()):
+            column = {
+                'name': str(key),
+                'signal': isinstance(key, (SignalIn, SignalOut))
+            }
+            literal = cls._literal_key(key)
+            if literal is not None:
+                column['literal'] = literal
+            column.update(cls._save_column(filename, f'column_{i}.npy', values))
+            columns.append(column)
+
+        schema = {'columns': columns, 'index': None}
+        if isinstance(data, pandas.DataFrame):
+            schema['index'] = cls._save_column(filename, 'index.npy', data.index.to_numpy())
+        with open(os.path.join(filename, cls.schema_filename), 'w') as f:
+            yaml.dump(schema, f, sort_keys=False)
+
+    @classmethod
+    def load(cls, filename, str_to_signal):
+        with open(os.path.join(filename, cls.schema_filename)) as f:
+            schema = yaml.safe_load(f)
+
+        data = {}
+        for column in schema['columns']:
+            values = cls._load_column(filename, column)
+            name = column['name']
+            if column['signal']:
+                assert name in str_to_signal, f'Checkpoint column {name} does not match any signal'
+                name = str_to_signal[name]
+            elif 'literal' in column:
+                name = ast.literal_eval(column['literal'])
+            data[name] = values
+
+        index = schema['index']
+        if isinstance(index, str):
+            # older checkpoints only saved the file name of a plain array
+            index = {'kind': 'array', 'file': index}
+        if index is not None:
+            index = cls._load_column(filename, index)
+        return pandas.DataFrame(data, index=index, copy=False)
 
 
 class Checkpoint:
-    def __init__(self, template, filepath):
+    storage_formats = {
+        'csv': CSVStorage,
+        'npy': NpyStorage
+    }
+
+    def __init__(self, template, filepath, storage_format='npy'):
         self.template = template
         self.filepath = filepath
+        assert storage_format in self.storage_formats, \
+            f'Unknown checkpoint format {storage_format}, options are {list(self.storage_formats)}'
+        self.storage = self.storage_formats[storage_format]
         self.data = {}
         for test in self.template.tests:
             test_data = {
@@ -42,73 +222,113 @@ class Checkpoint:
         f = open(filename, 'r')
         return f
 
+    def _save_table(self, test, name, data):
+        folder = os.path.join(self.filepath, str(test))
+        os.makedirs(folder, exist_ok=True)
+        filename = os.path.join(folder, name + self.storage.extension)
+        if os.path.exists(filename):
+            print(f'Overwriting {filename}')
+        self.storage.save(filename, data)
+
+    def _load_table(self, test, name):
+        folder = os.path.join(self.filepath, str(test))
+        str_to_signal = {str(s): s for s in test.signals.flat()}
+        # a checkpoint folder saved in another format still loads, e.g. csv
+        # checkpoints from before npy was the default
+        others = [s for s in self.storage_formats.values() if s is not self.storage]
+        for storage in [self.storage] + others:
+            filename = os.path.join(folder, name + storage.extension)
+            if storage.exists(filename):
+                return storage.load(filename, str_to_signal)
+        filename = os.path.join(folder, name + self.storage.extension)
+        return self.storage.load(filename, str_to_signal)
+
 
     def save_input_vectors(self, test, input_vectors):
         self.data[test]['input_vectors'] = input_vectors
-        f = self._get_save_file(test, 'input_vectors.csv')
-        writer = csv.writer(f)
-        keys = list(input_vectors.keys())
-        writer.writerow([str(key) for key in keys])
-        column_major = [input_vectors[key] for key in keys]
-        row_major = zip(*column_major)
-        writer.writerows(row_major)
-        f.close()
+        self._save_table(test, 'input_vectors', input_vectors)
 
     def load_input_vectors(self, test):
         if self.data[test]['input_vectors'] is None:
-            f = self._get_load_file(test, 'input_vectors.csv')
-            try:
-                input_vectors = pandas.read_csv(f)
-            except pandas.errors.EmptyDataError:
-                input_vectors = pandas.DataFrame({})
-            self.convert_df_columns(test, input_vectors)
-            f.close()
+            input_vectors = self._load_table(test, 'input_vectors')
             self.data[test]['input_vectors'] = input_vectors
 
         iv = self.data[test]['input_vectors']
         return iv
 
 
-    def suggest_run_dir(self, test):
-        return os.path.join(self.filepath, str(test))
+    def suggest_run_dir(self, test, shard=None):
+        run_dir = os.path.join(self.filepath, str(test))
+        if shard is not None:
+            run_dir = os.path.join(run_dir, f'shard_{shard}')
+        return run_dir
 
     def save_run_dir(self, test, run_dir):
         self.data[test]['sim_result_folder'] = run_dir
 
     def save_extracted_data_unprocessed(self, test, data):
         self.data[test]['extracted_data_unprocessed'] = data
-        f = self._get_save_file(test, 'extracted_data_unprocessed.csv')
-        data.to_csv(f)
-        f.close()
+        self._save_table(test, 'extracted_data_unprocessed', data)
 
     def load_extracted_data_unprocessed(self, test):
         if self.data[test]['extracted_data_unprocessed'] is None:
-            f = self._get_load_file(test, 'extracted_data_unprocessed.csv')
-            data = pandas.read_csv(f)
-            self.convert_df_columns(test, data)
+            data = self._load_table(test, 'extracted_data_unprocessed')
             self.data[test]['extracted_data_unprocessed'] = data
-            f.close()
 
         data = self.data[test]['extracted_data_unprocessed']
         return data
 
     def save_extracted_data(self, test, data):
         self.data[test]['extracted_data'] = data
-        f = self._get_save_file(test, 'extracted_data.csv')
-        data.to_csv(f)
-        f.close()
+        self._save_table(test, 'extracted_data', data)
 
     def load_extracted_data(self, test):
-        if True or self.data[test]['extracted_data'] is None:
-            f = self._get_load_file(test, 'extracted_data.csv')
-            data = pandas.read_csv(f)
-            self.convert_df_columns(test, data)
+        if self.data[test]['extracted_data'] is None:
+            data = self._load_table(test, 'extracted_data')
             self.data[test]['extracted_data'] = data
-            f.close()
 
         data = self.data[test]['extracted_data']
         return data
 
+    def save_fingerprints(self, test, fingerprints):
+        f = self._get_save_file(test, 'fingerprints.yaml')
+        yaml.dump(fingerprints, f)
+        f.close()
+
+    def load_fingerprints(self, test):
+        try:
+            f = self._get_load_file(test, 'fingerprints.yaml')
+        except FileNotFoundError:
+            return {}
+        fingerprints = yaml.safe_load(f) or {}
+        f.close()
+        return fingerprints
+
+    def save_plot_data(self, test, mode, data, parameter_algebra, regression_results):
+        # everything PlotHelper needs, so plots can be drawn later or in
+        # another process. mode is the group of true_digital bits the
+        # regression was for
+        folder = os.path.join(self.filepath, str(test))
+        os.makedirs(folder, exist_ok=True)
+        suffix = ''.join(str(x) for x in mode)
+        filename = os.path.join(folder, f'plot_data_{suffix}.pickle' if suffix
+                                else 'plot_data.pickle')
+        with open(filename, 'wb') as f:
+            pickle.dump((data, parameter_algebra, regression_results), f)
+        return filename
+
+    def save_post_regression_results(self, test, results):
+        # one dict per regression group, in ModePlan.regression_groups order
+        folder = os.path.join(self.filepath, str(test))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, 'post_regression.pickle'), 'wb') as f:
+            pickle.dump(results, f)
+
+    def load_post_regression_results(self, test):
+        filename = os.path.join(self.filepath, str(test), 'post_regression.pickle')
+        with open(filename, 'rb') as f:
+            return pickle.load(f)
+
     def save_regression_results(self, test, rr):
         # TODO doesn't work with multiple modes
         self.data[test]['regression_results'] = rr
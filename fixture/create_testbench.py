@@ -3,21 +3,114 @@ from collections import defaultdict
 import pandas
 
 import fixture
-from itertools import product
 import numpy as np
 from fixture.signals import SignalIn, SignalOut, SignalArray, parse_bus, \
     parse_name
+from fixture.mode_plan import ModePlan
 
 
 def add_vectors():
     raise NotImplemented
 
+class ResultsBuilder:
+    '''
+    Collects results into numpy columns with one entry per row, allocated
+    the first time a name shows up, with a dtype based on that first value.
+    Array values (e.g. results for vectored inputs) get a 2D column.
+    A column is widened (int to float, or anything to object) when a value
+    doesn't fit, and finish() gives object columns the same dtype pandas
+    would have picked for a list of those values
+    '''
+
+    def __init__(self, num_rows):
+        self.num_rows = num_rows
+        self.columns = {}
+
+    @staticmethod
+    def _scalar(value):
+        if isinstance(value, np.ndarray) and value.ndim == 0:
+            return value.item()
+        return value
+
+    def _new_column(self, value):
+        if isinstance(value, np.ndarray):
+            return np.full((self.num_rows, *value.shape), np.nan,
+                           dtype=np.result_type(value.dtype, np.float64))
+        if isinstance(value, (bool, np.bool_)):
+            return np.zeros(self.num_rows, dtype=bool)
+        if isinstance(value, (int, np.integer)):
+            return np.zeros(self.num_rows, dtype=np.int64)
+        if isinstance(value, (float, np.floating)):
+            return np.full(self.num_rows, np.nan)
+        return np.full(self.num_rows, None, dtype=object)
+
+    def _fits(self, column, value):
+        if column.dtype == object:
+            return True
+        if column.ndim > 1:
+            return isinstance(value, np.ndarray) and value.shape == column.shape[1:]
+        if column.dtype == bool:
+            return isinstance(value, (bool, np.bool_))
+        if column.dtype == np.int64:
+            return isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+        return value is None or (isinstance(value, (int, float, np.integer, np.floating))
+                                 and not isinstance(value, (bool, np.bool_)))
+
+    def _widen(self, name, value):
+        column = self.columns[name]
+        if (column.dtype == np.int64
+                and isinstance(value, (float, np.floating, type(None)))):
+            self.columns[name] = column.astype(np.float64)
+        else:
+            widened = np.full(self.num_rows, None, dtype=object)
+            for i in range(self.num_rows):
+                widened[i] = column[i]
+            self.columns[name] = widened
+
+    def set(self, name, row, value):
+        value = self._scalar(value)
+        if name not in self.columns:
+            self.columns[name] = self._new_column(value)
+        if not self._fits(self.columns[name], value):
+            self._widen(name, value)
+        column = self.columns[name]
+        if value is None and column.dtype != object:
+            value = np.nan
+        column[row] = value
+
+    def set_row(self, row, results_row):
+        if row > 0:
+            for name in results_row:
+                assert name in self.columns, f'Result {name} was not in the first row'
+        for name, value in results_row.items():
+            self.set(name, row, value)
+
+    def set_column(self, name, values):
+        assert len(values) == self.num_rows, f'Wrong number of rows for {name}'
+        values = np.asarray(values)
+        if values.dtype == object and values.ndim == 1:
+            for row, value in enumerate(values):
+                self.set(name, row, value)
+        else:
+            self.columns[name] = values
+
+    def finish(self):
+        for name, column in self.columns.items():
+            if column.dtype == object and column.ndim == 1:
+                self.columns[name] = pandas.Series(column).infer_objects().to_numpy()
+        return self.columns
+
+
 class Testbench():
     def __init__(self, template, tester, test, test_vectors,
-                 do_optional_out=False):
+                 do_optional_out=False, sample_indices=None, modes=None):
         '''
         tester: fault tester object
         test: TemplateMaster Test subclass object
+        sample_indices: which entries of test_vectors go in this testbench,
+            default is all of them. Used when a test is split into shards
+        modes: which of the mode plan's true_digital modes go in this
+            testbench, default is all of them
         '''
 
         self.template = template
@@ -26,6 +119,14 @@ class Testbench():
         self.test = test
         self.test_vectors = test_vectors
         self.do_optional_out = do_optional_out
+        if sample_indices is None:
+            sample_indices = range(self.test.num_samples)
+        self.sample_indices = list(sample_indices)
+        self.mode_plan = ModePlan.from_test(template, test)
+        # every mode this test simulates, in order, even if this testbench
+        # only has some of them
+        self.true_digital_modes = self.mode_plan.sim_modes
+        self.modes = self.true_digital_modes if modes is None else [tuple(m) for m in modes]
 
     @staticmethod
     def scale_vector(vec, limits):
@@ -129,154 +230,157 @@ class Testbench():
         self.set_pinned_inputs()
 
         #true_digital = [s for s in self.test.signals if isinstance(s, SignalIn) and s.type_ == 'true_digital']
-        true_digital = self.test.signals.true_digital()
-        num_digital = len(true_digital)
-        self.true_digital_modes = list(product(range(2), repeat=num_digital))
-        for digital_mode in self.true_digital_modes:
+        for digital_mode in self.modes:
             self.set_digital_mode(digital_mode)
             #for v_optional, v_test in zip(self.optional_vectors, self.test_vectors):
             #    reads = self.run_test_vector(v_test, v_optional)
             #    self.result_processing_list.append((digital_mode, v_test, v_optional, reads))
-            for i in range(self.test.num_samples):
+            for i in self.sample_indices:
                 reads = self.run_test_point(i)
                 self.result_processing_list.append((digital_mode, i, reads))
 
     def condense_results_analysis(self, results):
-        # look at raw results to find input and output vectors
-        # Output vectors: value changes between output modes
-        # Input vectors: value is an ndarray
+        # results = {output_vec: {name: column}}, with output_vec None when
+        # there are no vectored outputs
         # deal with results derived from vectored inputs/outputs
         if None in results:
             assert len(results) == 1
             results_out = results[None]
         else:
             # sort of want to transpose the order of the dicts
+            # TODO had some issues with pole/zero extraction where a result
+            # happened to be the same for every vectored output even though
+            # the user did not expect it, so always vector the name
             output_vecs = list(results)
-            names = list(results[output_vecs[0]])
-            examples = {k: np.array(v) for k, v in results[output_vecs[0]].items()}
             results_out = {}
-            for name in names:
-                perfect_match = True
-                for ov in output_vecs[1:]:
-                    # issues with equality when the result is a list of ndarrays
-                    result_ndarray = np.array(results[ov][name])
-                    if not np.all(result_ndarray == examples[name]):
-                        perfect_match = False
-                        break
-
-                # TODO had some issues with pole/zero extraction where things
-                # happened to be a perfect match even though the user did not
-                # expect it
-                if False and perfect_match:
-                    # doesn't change with respect to vectored output
-                    results_out[name] = results[output_vecs[0]][name]
-                else:
-                    # does change, we need to vector name based on vectored output
-                    for vec_i, ov in enumerate(output_vecs):
-                        name_vec = fixture.Regression.vector_parameter_name_output(name, vec_i, ov)
-                        results_out[name_vec] = results[ov][name]
-
-        # we've done output vectoring, now look for vectored inputs
+            for name in results[output_vecs[0]]:
+                for vec_i, ov in enumerate(output_vecs):
+                    name_vec = fixture.Regression.vector_parameter_name_output(name, vec_i, ov)
+                    results_out[name_vec] = results[ov][name]
+
+        # we've done output vectoring, now look for vectored inputs, which
+        # ResultsBuilder stores as 2D columns
         results_out_in = {}
-        for name in results_out:
-            entry = results_out[name][0]
-            if isinstance(entry, np.ndarray) and len(entry.shape) > 0:
+        for name, column in results_out.items():
+            if column.ndim > 1:
                 # each entry is vectored
                 parent_input_name = self.test.input_vector_mapping[name]
                 parent_input = self.test.signals.from_template_name(parent_input_name)
-                assert parent_input.shape == entry.shape, f'Vector length for {name} does not match {parent_input}'
+                assert parent_input.shape == column.shape[1:], f'Vector length for {name} does not match {parent_input}'
                 for vec_i, parent_input_entry in enumerate(parent_input):
-                    data = [x[vec_i] for x in results_out[name]]
                     name_vec = fixture.Regression.vector_input_name(name, vec_i)
-                    results_out_in[name_vec] = data
+                    results_out_in[name_vec] = column[:, vec_i]
             else:
-                results_out_in[name] = results_out[name]
+                results_out_in[name] = column
 
         return results_out_in
 
-
-
-
-
-
+    def analyze_all(self, reads_all, keys):
+        '''
+        Run the test's analysis on every row, returning {name: column}.
+        Tests can define analysis_batch(list_of_reads) to do every row at
+        once, returning either one dict per row or a dict of columns.
+        keys are the (mode, sample index) of each row, which analysis can
+        see as test.analysis_key
+        '''
+        builder = ResultsBuilder(len(reads_all))
+        if hasattr(self.test, 'analysis_batch'):
+            results_batch = self.test.analysis_batch(reads_all)
+            if isinstance(results_batch, dict):
+                for name, values in results_batch.items():
+                    builder.set_column(name, values)
+            else:
+                assert len(results_batch) == len(reads_all), \
+                    'analysis_batch should return one dict per row'
+                for row, results_row in enumerate(results_batch):
+                    assert isinstance(results_row, dict), 'Return from analysis_batch should be a list of dicts'
+                    builder.set_row(row, results_row)
+        else:
+            for row, reads_template in enumerate(reads_all):
+                self.test.analysis_key = keys[row]
+                results_row = self.test.analysis(reads_template)
+                if not isinstance(results_row, dict):
+                    assert False, 'Return from process_single_test should be a dict'
+                builder.set_row(row, results_row)
+        return builder.finish()
+
+    def get_test_vector_column(self, s, rows):
+        column = self.test_vectors[s]
+        if isinstance(column, pandas.Series):
+            return column.loc[rows].to_numpy()
+        column_array = np.asarray(column)
+        if column_array.ndim == 1:
+            return column_array[rows]
+        # entries are themselves lists or arrays; keep them whole
+        column_out = np.empty(len(rows), dtype=object)
+        for j, i in enumerate(rows):
+            column_out[j] = column[i]
+        return column_out
 
     def get_results(self):
-        ''' Return results in the following format:
-        for mode: for [in, out]: {pin:[x1, x2, x3, ...], }
+        ''' Return results as a DataFrame with one row per (mode, sample),
+        with columns for the test vectors, the test's analysis results, the
+        optional outputs, mode_id and sample_id
         '''
-        # results_analysis holds any results from self.test.analysis()
-        # results_analysis = {output_mode: {name: [value0, value1]}}
-        # results_other holds the rest, which is optional reads and mode_id
-        # results_other = {name: [value0, value1]}
-        results_analysis = {}
-        results_other = {}
-        for m, result_i, (reads_template, reads_optional) in self.result_processing_list:
-
-            vectored_outputs = self.test.signals.vectored_out()
-            #out_vec_name_mapping = {}
-            if len(vectored_outputs) == 0:
-                # no vectored output
-                results_out_req = self.test.analysis(reads_template)
-                if not isinstance(results_out_req, dict):
-                    assert False, 'Return from process_single_test should be a dict'
-                results_out_req_vec = {None: results_out_req}
-            else:
-                # yes vectored output
-                assert len(vectored_outputs) == 1, 'TODO multiple vectored outputs'
-                vectored_output = vectored_outputs[0]
-                results_out_req_vec = {}
-                for vec_i, component in enumerate(vectored_output):
-                    self.tester.set_vector_read_mode(vectored_output, component)
-                    results_out_req = self.test.analysis(reads_template)
-                    results_out_req_vec[component] = results_out_req
-                self.tester.clear_vector_read_mode(vectored_output)
-
-
-            #for k,v in results_out_req.items():
-            #    if type(v) == np.ndarray:
-            #        results_out_req[k] = float(v)
-
-            results_out_opt = self.process_optional_outputs(reads_optional)
-            # TODO this loop is copy/pasted from a few lines above
-            #for k,v in results_out_opt.items():
-            #    if type(v) == np.ndarray:
-            #        results_out_opt[k] = float(v)
-
-            # put results_analysis into lists
-            if result_i == 0:
-                # first time; set up new dictionaries and lists
-                for output_vec, result_dict in results_out_req_vec.items():
-                    results_analysis[output_vec] = {}
-                    for name, value in result_dict.items():
-                        results_analysis[output_vec][name] = [value]
-            else:
-                for output_vec, result_dict in results_out_req_vec.items():
-                    assert output_vec in results_analysis
-                    for name, value in result_dict.items():
-                        assert name in results_analysis[output_vec]
-                        results_analysis[output_vec][name].append(value)
-
-            # put results_other into list
-            if result_i == 0:
-                # first time; set up new dictionaries and lists
-                for name, value in results_out_opt.items():
-                    results_other[name] = [value]
-                results_other['mode_id'] = [m]
-            else:
-                for name, value in results_out_opt.items():
-                    assert name in results_other
-                    results_other[name].append(value)
-                assert 'mode_id' in results_other
-                results_other['mode_id'].append(m)
+        num_rows = len(self.result_processing_list)
+        reads_all = [reads_template for _, _, (reads_template, _)
+                     in self.result_processing_list]
+        keys = [(m, i) for m, i, _ in self.result_processing_list]
 
+        # results_analysis holds any results from self.test.analysis()
+        # results_analysis = {output_mode: {name: column}}
+        vectored_outputs = self.test.signals.vectored_out()
+        if len(vectored_outputs) == 0:
+            # no vectored output
+            results_analysis = {None: self.analyze_all(reads_all, keys)}
+        else:
+            # yes vectored output
+            # switch the read mode once per component, not once per row
+            assert len(vectored_outputs) == 1, 'TODO multiple vectored outputs'
+            vectored_output = vectored_outputs[0]
+            results_analysis = {}
+            for component in vectored_output:
+                self.tester.set_vector_read_mode(vectored_output, component)
+                results_analysis[component] = self.analyze_all(reads_all, keys)
+            self.tester.clear_vector_read_mode(vectored_output)
         results_analysis_vec = self.condense_results_analysis(results_analysis)
 
-        results_comb = {**self.test_vectors,
+        # pick out the test vectors for each row, since this testbench might
+        # only have some of the samples, or repeat them for several modes
+        rows = np.array([result_i for _, result_i, _ in self.result_processing_list],
+                        dtype=int)
+
+        # results_other holds the rest, which is optional reads, mode_id,
+        # and sample_id (which sample of the test vectors the row is)
+        builder = ResultsBuilder(num_rows)
+        mode_id = np.empty(num_rows, dtype=object)
+        for row, (m, _, (_, reads_optional)) in enumerate(self.result_processing_list):
+            builder.set_row(row, self.process_optional_outputs(reads_optional))
+            mode_id[row] = m
+        results_other = {**builder.finish(), 'mode_id': mode_id, 'sample_id': rows}
+        results_vectors = {s: self.get_test_vector_column(s, rows)
+                           for s in self.test_vectors.keys()}
+
+        results_comb = {**results_vectors,
                         **results_analysis_vec,
                         **results_other}
         results = pandas.DataFrame(results_comb)
         return results
 
+    @staticmethod
+    def stitch_results(testbenches, results_list):
+        '''
+        Combine the get_results DataFrames from several shards of one test
+        into the same row order a single unsharded testbench would give
+        '''
+        order = []
+        for tb in testbenches:
+            for m, result_i, _ in tb.result_processing_list:
+                order.append((tb.true_digital_modes.index(m), result_i))
+        combined = pandas.concat(results_list, ignore_index=True)
+        positions = sorted(range(len(order)), key=lambda j: order[j])
+        return combined.iloc[positions].reset_index(drop=True)
+
     def post_process(self, results):
         # run through post-processing and append new columns
         results_processed = results.copy()
@@ -0,0 +1,74 @@
+import numpy as np
+
+
+def find_crossings(t, v, height):
+    '''
+    Every time the waveform crosses height, found with one scan for sign
+    changes and linear interpolation between the samples on either side.
+    Returns (rising_times, falling_times), each sorted
+    '''
+    t = np.asarray(t, dtype=float)
+    v = np.asarray(v, dtype=float)
+    above = v > height
+    k = np.nonzero(above[1:] != above[:-1])[0] + 1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        frac = (height - v[k-1]) / (v[k] - v[k-1])
+    times = t[k-1] + np.nan_to_num(frac) * (t[k] - t[k-1])
+    rising = above[k]
+    return times[rising], times[~rising]
+
+
+def search_edges(edges, times, forward=False, count=1):
+    '''
+    For each of times, the count nearest edges after it (forward) or before
+    it, nearest first, relative to that time. An edge exactly at the time
+    counts in either direction.
+    Returns a (len(times), count) array with NaN where there aren't enough
+    edges
+    '''
+    edges = np.asarray(edges, dtype=float)
+    times = np.asarray(times, dtype=float)
+    if len(edges) == 0:
+        return np.full((len(times), count), float('nan'))
+    steps = np.arange(count)
+    if forward:
+        indices = np.searchsorted(edges, times, side='left')[:, None] + steps
+    else:
+        indices = np.searchsorted(edges, times, side='right')[:, None] - 1 - steps
+    valid = (indices >= 0) & (indices < len(edges))
+    found = np.where(valid, edges[np.clip(indices, 0, len(edges) - 1)], float('nan'))
+    return found - times[:, None]
+
+
+
+class EdgeReadError(Exception):
+    pass
+
+
+def resolve_edge_reads(reads, name, get_crossings, edge_height):
+    '''
+    Fill in action.value for every (time, action, params) edge read of the
+    signal name, with one search for each height, direction and count.
+    get_crossings(height) gives (rising_times, falling_times) for the signal.
+    Each value is a list of the count nearest edge times relative to the
+    read time, or an EdgeReadError if there aren't that many
+    '''
+    searches = {}
+    for read in reads:
+        params = read[2]
+        key = (params.get('height', edge_height),
+               params.get('rising', True),
+               params.get('forward', False),
+               params.get('count', 1))
+        searches.setdefault(key, []).append(read)
+    for (height, rising, forward, count), edge_reads in searches.items():
+        rising_times, falling_times = get_crossings(height)
+        edges = rising_times if rising else falling_times
+        edge_times = [time for time, _, _ in edge_reads]
+        found = search_edges(edges, edge_times, forward, count)
+        for (time, action, _), row in zip(edge_reads, found):
+            if np.any(np.isnan(row)):
+                action.value = EdgeReadError(
+                    f'Found {np.sum(~np.isnan(row))} of {count} edges on {name} at {time}')
+            else:
+                action.value = list(row)
@@ -0,0 +1,164 @@
+import ast
+import hashlib
+import inspect
+import textwrap
+import numpy as np
+import fixture
+from fixture.mode_plan import ModePlan
+from fixture.sim_cache import SimCache
+
+
+class StageTracker:
+    '''
+    Decides which stages of TemplateMaster.go have to run again. Each stage
+    gets a fingerprint of everything it depends on, including the
+    fingerprint of the stage before it, and a stage is only re-run when its
+    fingerprint differs from the one saved in the checkpoint the last time
+    that stage finished.
+    Regression always runs, it's cheap and its results are what go() returns.
+    post_regression is skipped and its saved results used instead when
+    nothing it depends on changed. It can use whatever analysis left on the
+    test or template (e.g. DelayTest.blocks), which isn't saved, so running
+    it means running analysis again too
+    '''
+    stages = ['choose_inputs', 'run_sim', 'run_analysis', 'run_post_process',
+              'run_post_regression']
+
+    # these don't change what gets simulated, so editing them shouldn't
+    # cause a new simulation
+    not_sim_methods = ['analysis', 'analysis_batch', 'post_process', 'post_regression']
+    not_sim_attributes = ['parameter_algebra']
+
+    def __init__(self, template, checkpoint, num_shards=1):
+        self.template = template
+        self.checkpoint = checkpoint
+        self.num_shards = num_shards
+        self.fingerprints = {test: {} for test in template.tests}
+        self.saved = {test: checkpoint.load_fingerprints(test)
+                      for test in template.tests}
+
+    @staticmethod
+    def _hash(*parts):
+        return hashlib.sha256(repr(parts).encode()).hexdigest()
+
+    @staticmethod
+    def _module_source(obj):
+        # source of the whole file obj is defined in
+        with open(inspect.getsourcefile(obj)) as f:
+            return hashlib.sha256(f.read().encode()).hexdigest()
+
+    @classmethod
+    def code_dump(cls, obj, skip_class_items=False):
+        # compare the AST rather than the text so comments and formatting
+        # don't count as changes
+        try:
+            source = textwrap.dedent(inspect.getsource(obj))
+        except (OSError, TypeError):
+            return None
+        node = ast.parse(source).body[0]
+        if skip_class_items and isinstance(node, ast.ClassDef):
+            def keep(item):
+                if isinstance(item, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                    return item.name not in cls.not_sim_methods
+                if isinstance(item, ast.Assign):
+                    names = [t.id for t in item.targets if isinstance(t, ast.Name)]
+                    return not any(n in cls.not_sim_attributes for n in names)
+                return True
+            node.body = [item for item in node.body if keep(item)]
+        return ast.dump(node)
+
+    def _compute(self, test, stage):
+        Test = type(test)
+        if stage == 'choose_inputs':
+            random_signals = [(str(s), repr(getattr(s, 'value', None)))
+                              for s in test.signals.random()]
+            return self._hash(str(test), getattr(test, 'num_samples', 10),
+                              random_signals,
+                              self._module_source(fixture.Sampler),
+                              self.checkpoint.storage.__name__)
+
+        elif stage == 'run_sim':
+            input_vectors = self.checkpoint.load_input_vectors(test)
+            vectors = [(str(k), np.asarray(input_vectors[k]).tolist())
+                       for k in input_vectors.keys()]
+            sim_cache = self.template.sim_cache or SimCache(self.checkpoint.filepath, self.template)
+            classes = [self.code_dump(C, skip_class_items=True)
+                       for C in Test.__mro__ if C is not object]
+            return self._hash(self.fingerprint(test, 'choose_inputs'),
+                              vectors, sim_cache.circuit_hash(), classes,
+                              self.num_shards)
+
+        elif stage == 'run_analysis':
+            # some templates pass information from one test's analysis to
+            # the next (e.g. SamplerTemplate.temp_inv), so chain them
+            i = self.template.tests.index(test)
+            previous = (None if i == 0 else
+                        self.fingerprint(self.template.tests[i-1], 'run_analysis'))
+            return self._hash(self.fingerprint(test, 'run_sim'), previous,
+                              self.code_dump(Test.analysis),
+                              self.code_dump(getattr(Test, 'analysis_batch', None)),
+                              repr(self.template.extras),
+                              self._module_source(fixture.Testbench))
+
+        elif stage == 'run_post_process':
+            post_process = getattr(Test, 'post_process', None)
+            return self._hash(self.fingerprint(test, 'run_analysis'),
+                              None if post_process is None else self.code_dump(post_process))
+
+        elif stage == 'run_post_regression':
+            # the regression in between always runs, so this covers its
+            # inputs as well
+            algebra = [(lhs, [(param, [str(f) for f in term]) for param, term in rhs.items()])
+                       for lhs, rhs in test.parameter_algebra_vectored.items()]
+            return self._hash(self.fingerprint(test, 'run_post_process'), algebra,
+                              self._module_source(fixture.Regression),
+                              self._module_source(ModePlan),
+                              self.code_dump(Test.post_regression))
+
+        assert False, f'Unknown stage {stage}'
+
+    def fingerprint(self, test, stage):
+        if stage not in self.fingerprints[test]:
+            self.fingerprints[test][stage] = self._compute(test, stage)
+        return self.fingerprints[test][stage]
+
+    def needs_run(self, test, stage):
+        return self.saved[test].get(stage) != self.fingerprint(test, stage)
+
+    def plan(self, checkpoint_controller):
+        '''
+        Fill in which stages after choose_inputs each test has to run.
+        run_post_regression is 'save' to run it, or 'load' to use the
+        results saved the last time it ran
+        '''
+        tests = self.template.tests
+        for test in tests:
+            controller = checkpoint_controller[str(test)]
+            for stage in ['run_sim', 'run_analysis', 'run_post_process']:
+                controller[stage] = self.needs_run(test, stage)
+            if self.needs_run(test, 'run_post_regression'):
+                controller['run_post_regression'] = 'save'
+                controller['run_analysis'] = True
+            else:
+                controller['run_post_regression'] = 'load'
+
+        # re-running one test's analysis means re-running the analysis
+        # of the tests before it, since it may depend on their side
+        # effects (e.g. SamplerTemplate.temp_inv)
+        last_analysis = max([i for i, test in enumerate(tests)
+                             if checkpoint_controller[str(test)]['run_analysis']],
+                            default=0)
+        for test in tests[:last_analysis]:
+            checkpoint_controller[str(test)]['run_analysis'] = True
+
+    def record(self, test, stage):
+        # only call this once the stage has finished and saved its results
+        self.saved[test][stage] = self.fingerprint(test, stage)
+        self.checkpoint.save_fingerprints(test, self.saved[test])
+
+    def report(self, checkpoint_controller):
+        print('Incremental run, stages that were re-run:')
+        for test in self.template.tests:
+            controller = checkpoint_controller[str(test)]
+            ran = [stage for stage in self.stages if controller[stage] in [True, 'save']]
+            print(f'\t{test}\t{", ".join(ran) if ran else "(none)"}')
@@ -0,0 +1,111 @@
+import numpy as np
+import pandas
+
+
+class LeastSquaresData:
+    '''
+    Same fields as statsmodels' model.data, for post_regression hooks that
+    look at the data used in the fit
+    '''
+    def __init__(self, frame, endog, exog, ynames, xnames):
+        self.frame = frame
+        self.endog = endog
+        self.exog = exog
+        self.ynames = ynames
+        self.xnames = xnames
+        self.param_names = xnames
+
+
+class LeastSquaresModel:
+    def __init__(self, data):
+        self.data = data
+        self.endog = data.endog
+        self.exog = data.exog
+        self.endog_names = data.ynames
+        self.exog_names = data.xnames
+        self.nobs = len(data.endog)
+
+    def predict(self, params, exog=None):
+        if exog is None:
+            exog = self.exog
+        return np.asarray(exog, dtype=float) @ np.asarray(params, dtype=float)
+
+
+class LeastSquaresResults:
+    '''
+    The parts of statsmodels' OLS results that fixture uses: params, bse,
+    predict, fittedvalues, resid, and model.{endog, exog, data, predict}
+    '''
+    def __init__(self, model, params, bse, normalized_cov_params, scale, rank):
+        names = model.exog_names
+        index = model.data.frame.index
+        self.model = model
+        self.params = pandas.Series(params, index=names)
+        self.bse = pandas.Series(bse, index=names)
+        self.normalized_cov_params = pandas.DataFrame(
+            normalized_cov_params, index=names, columns=names)
+        self.scale = scale
+        self.rank = rank
+        self.nobs = model.nobs
+        self.df_resid = model.nobs - rank
+        self.fittedvalues = pandas.Series(model.predict(params), index=index)
+        self.resid = pandas.Series(model.endog, index=index) - self.fittedvalues
+        self.ssr = float(np.sum(self.resid**2))
+
+    def cov_params(self):
+        return self.normalized_cov_params * self.scale
+
+    def predict(self, exog=None):
+        if exog is None:
+            return self.fittedvalues
+        if isinstance(exog, (pandas.DataFrame, dict)):
+            # new data with the same column names used in the fit
+            columns = [np.asarray(exog[name], dtype=float) for name in self.model.exog_names]
+            predictions = np.column_stack(columns) @ self.params.to_numpy()
+            if isinstance(exog, pandas.DataFrame):
+                return pandas.Series(predictions, index=exog.index)
+            return predictions
+        return self.model.predict(self.params.to_numpy(), exog)
+
+
+def fit_shared_design(frame, exog_names, endog_names):
+    '''
+    Ordinary least squares for several lhs columns of frame that all use the
+    same rhs columns exog_names, with one SVD for all of them.
+    Same pseudo-inverse solution as statsmodels OLS (method='pinv'), so rank
+    deficient designs give the minimum norm answer instead of an error.
+    frame should already have rows with missing data removed.
+    Returns {endog_name: LeastSquaresResults}
+    '''
+    exog = frame[exog_names].to_numpy(dtype=float)
+    endogs = frame[endog_names].to_numpy(dtype=float)
+    nobs, k = exog.shape
+
+    u, s, vt = np.linalg.svd(exog, full_matrices=False)
+    s_max = s.max(initial=0)
+    keep = s > 1e-15 * s_max
+    rank = int(np.sum(s > s_max * max(nobs, k) * np.finfo(float).eps))
+    s_inv = np.zeros_like(s)
+    s_inv[keep] = 1 / s[keep]
+
+    # pinv(exog) = V S^-1 U^T, and pinv(exog) pinv(exog)^T = V S^-2 V^T
+    pinv = (vt.T * s_inv) @ u.T
+    normalized_cov = (vt.T * s_inv**2) @ vt
+    params_all = pinv @ endogs
+
+    resid = endogs - exog @ params_all
+    ssr = np.sum(resid**2, axis=0)
+    df_resid = nobs - rank
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scales = ssr / df_resid if df_resid > 0 else np.full(len(endog_names), np.nan)
+    bse_all = np.sqrt(np.outer(np.diag(normalized_cov), scales))
+
+    fits = {}
+    for i, endog_name in enumerate(endog_names):
+        data = LeastSquaresData(frame[[endog_name] + list(exog_names)],
+                                endogs[:, i], exog, endog_name, list(exog_names))
+        model = LeastSquaresModel(data)
+        fits[endog_name] = LeastSquaresResults(
+            model, params_all[:, i], bse_all[:, i], normalized_cov,
+            scales[i], rank)
+    return fits
@@ -1,9 +1,11 @@
-import matplotlib.pyplot as plt
 import numpy as np
 import scipy.optimize
 
 class ModalAnalysis:
     debug = False
+    # fit poles with the variable projection error and its analytic gradient
+    # instead of finite differences of error_from_poles
+    use_varpro = True
 
     def __init__(self, t, h_step):
         self.scale = t[-1]/2.0
@@ -44,6 +46,7 @@ class ModalAnalysis:
         return t, h_step
 
     def debug_plot(self, ps, NZ):
+        import matplotlib.pyplot as plt
         zs, dc = self.get_zeros(ps, NZ)
         h_step_est = self.step_response_from_pz(ps, zs, dc)
         print('Plotting ps, zs, dc', ps, zs, dc)
@@ -140,6 +143,89 @@ class ModalAnalysis:
         error = np.sum((h_step_est - self.h_step)**2, 0)
         return error
 
+    @staticmethod
+    def varpro_error(poles, t, h_step, NZ, with_grad=False, return_numerators=False):
+        '''
+        Same error as error_from_poles, for a whole batch of pole sets at once
+        poles: (B, NP) poles, no repeats within a row
+        h_step: (T,) step response shared by every row, or (B, T)
+        Returns errors (B,), and if with_grad also d(error)/d(pole) (B, NP),
+        which is complex and meant for the chain rule.
+        With return_numerators, returns the fitted numerator coefficients
+        (B, NZ+1) instead, constant term first like get_zeros
+
+        The step response is sum_i c_i exp(p_i t), and the residue formula
+        gives c_i = N(p_i) / prod_{j!=i}(p_i - p_j) for numerator N with
+        coefficients n_k. So h_step ~= A n with
+        A[t, k] = sum_i exp(p_i t) p_i^k w_i,  w_i = 1/prod_{j!=i}(p_i - p_j)
+        which is exps.T @ Z_inv from get_zeros without inverting Z_tilde.
+        n is the least squares solution, so the error only depends on the
+        poles (variable projection), and because n is optimal the gradient
+        is just -2 r^T (dA/dp) n, with r the residual
+        '''
+        poles = np.atleast_2d(np.asarray(poles, dtype=complex))
+        B, NP = poles.shape
+        K = NZ + 1
+        h = np.broadcast_to(np.asarray(h_step, dtype=float), (B, len(t)))
+        not_diag = ~np.eye(NP, dtype=bool)
+
+        with np.errstate(all='ignore'):
+            diffs = np.where(not_diag, poles[:, :, None] - poles[:, None, :], 1)
+            w = 1 / np.prod(diffs, axis=2)
+            exps = np.exp(poles[:, :, None] * t)
+            powers = poles[:, :, None] ** np.arange(K)
+            # conjugate poles come in pairs, so A is real
+            A = np.einsum('bit,bik,bi->btk', exps, powers, w).real
+
+        bad = ~np.isfinite(A).all(axis=(1, 2))
+        A[bad] = 0
+        n = (np.linalg.pinv(A) @ h[:, :, None])[:, :, 0]
+        if return_numerators:
+            n[bad] = float('nan')
+            return n
+        r = h - (A @ n[:, :, None])[:, :, 0]
+        errors = np.sum(r**2, axis=1)
+        errors[bad] = float('inf')
+        if not with_grad:
+            return errors
+
+        with np.errstate(all='ignore'):
+            inv_diffs = np.where(not_diag, 1 / diffs, 0)
+            # d w_m / d p_m = -w_m sum_{j!=m} 1/(p_m - p_j)
+            # d w_i / d p_m = w_i / (p_i - p_m)
+            inv_sum = inv_diffs.sum(axis=2)
+            d_powers = np.zeros_like(powers)
+            d_powers[:, :, 1:] = np.arange(1, K) * powers[:, :, :-1]
+
+            r_exps = np.einsum('bt,bit->bi', r, exps)
+            r_t_exps = np.einsum('bt,bit->bi', r * t, exps)
+            powers_n = np.einsum('bik,bk->bi', powers, n)
+            d_powers_n = np.einsum('bik,bk->bi', d_powers, n)
+
+            same_pole = w * (r_t_exps * powers_n
+                             + r_exps * (d_powers_n - inv_sum * powers_n))
+            other_poles = np.einsum('bi,bim->bm', r_exps * powers_n * w, inv_diffs)
+            grad = -2 * (same_pole + other_poles)
+        grad[bad] = 0
+        return errors, grad
+
+    def error_from_poles_batch(self, poles, NZ):
+        return self.varpro_error(poles, self.t, self.h_step, NZ)
+
+    @staticmethod
+    def pole_derivatives(poles):
+        '''
+        For the monic polynomial with these roots and coefficients from
+        coefs_from_poles, d(pole_m)/d(coef_l) = -pole_m^(n-1-l) / q'(pole_m)
+        Returns (n, n) array indexed [m, l], or (B, n, n) for (B, n) poles
+        '''
+        poles = np.asarray(poles, dtype=complex)
+        n = poles.shape[-1]
+        not_diag = ~np.eye(n, dtype=bool)
+        diffs = np.where(not_diag, poles[..., :, None] - poles[..., None, :], 1)
+        q_prime = np.prod(diffs, axis=-1)
+        return -poles[..., :, None] ** np.arange(n-1, -1, -1) / q_prime[..., None]
+
     def get_scale(self, ps, zs, dc):
         # by default our rational polynomial has the high-order term 1,
         # because that lets us represent poles/zeros at 0
@@ -156,7 +242,40 @@ class ModalAnalysis:
         # np.poly puts the constant term last, and always returns a leading 1
         return np.poly(poles)[1:]
 
+    @staticmethod
+    def poles_from_coefs_batch(coefs):
+        # same as poles_from_coefs for each row, using the eigenvalues of a
+        # stack of companion matrices (which is what np.roots does)
+        B, n = coefs.shape
+        companion = np.zeros((B, n, n))
+        companion[:, 0, :] = -coefs
+        companion[:, np.arange(1, n), np.arange(n-1)] = 1
+        return np.linalg.eigvals(companion)
+
+    def get_poles_guess(self, NP, known_poles):
+        max_freq_guess = 2.0/self.t[-1]
+        num_poles_guess = NP - len(known_poles)
+        poles_guess = np.linspace(-max_freq_guess/num_poles_guess,
+                                  -max_freq_guess,
+                                  num_poles_guess)
+
+        poles_guess = np.array([-2e9, -20e9])*self.scale
+        return poles_guess
+
     def _fit_poles(self, NP, NZ, known_poles):
+        def err_and_grad(coefs):
+            free_poles = self.poles_from_coefs(coefs)
+            poles = np.concatenate((known_poles, free_poles))
+            with np.errstate(all='ignore'):
+                errors, grad_poles = self.varpro_error(poles, self.t, self.h_step, NZ,
+                                                       with_grad=True)
+                grad = (grad_poles[0, len(known_poles):]
+                        @ self.pole_derivatives(free_poles)).real
+            if not (np.isfinite(errors[0]) and np.all(np.isfinite(grad))):
+                # e.g. repeated poles
+                return float('inf'), np.zeros(len(coefs))
+            return errors[0], grad
+
         def err_minimizer(coefs):
             poles = np.concatenate((known_poles, self.poles_from_coefs(coefs)))
             err = self.error_from_poles(poles, NZ)
@@ -165,19 +284,16 @@ class ModalAnalysis:
                 return float('inf')
             return err
 
-        max_freq_guess = 2.0/self.t[-1]
-        num_poles_guess = NP - len(known_poles)
-        poles_guess = np.linspace(-max_freq_guess/num_poles_guess,
-                                  -max_freq_guess,
-                                  num_poles_guess)
-
-        poles_guess = np.array([-2e9, -20e9])*self.scale
+        poles_guess = self.get_poles_guess(NP, known_poles)
 
         if self.debug:
             print('guessing ps', poles_guess)
             self.debug_plot(np.concatenate((known_poles, poles_guess)), NZ)
         coefs_guess = self.coefs_from_poles(poles_guess)
-        minimizer = scipy.optimize.minimize(err_minimizer, coefs_guess)
+        if self.use_varpro:
+            minimizer = scipy.optimize.minimize(err_and_grad, coefs_guess, jac=True)
+        else:
+            minimizer = scipy.optimize.minimize(err_minimizer, coefs_guess)
         coefs_opt = minimizer.x
         poles_opt = np.concatenate((known_poles, self.poles_from_coefs(coefs_opt)))
 
@@ -203,6 +319,56 @@ class ModalAnalysis:
         scale = self.get_scale(ps, zs, dc)
         return ps, zs, scale
 
+    def _fit_poles_batch(self, h_steps, NP, NZ, known_poles):
+        # same as _fit_poles with varpro for each row on its own, so a row's
+        # result doesn't depend on what else is in the batch
+        B = len(h_steps)
+        known = np.asarray(known_poles, dtype=complex)
+        coefs_guess = self.coefs_from_poles(self.get_poles_guess(NP, known_poles))
+
+        coefs_opt = np.zeros((B, len(coefs_guess)))
+        for i, h_step in enumerate(h_steps):
+            def err_and_grad(coefs):
+                free_poles = self.poles_from_coefs(coefs)
+                poles = np.concatenate((known, free_poles))
+                with np.errstate(all='ignore'):
+                    errors, grad_poles = self.varpro_error(poles, self.t, h_step, NZ,
+                                                           with_grad=True)
+                    grad = (grad_poles[0, len(known):]
+                            @ self.pole_derivatives(free_poles)).real
+                if not (np.isfinite(errors[0]) and np.all(np.isfinite(grad))):
+                    # e.g. repeated poles
+                    return float('inf'), np.zeros(len(coefs))
+                return errors[0], grad
+
+            minimizer = scipy.optimize.minimize(err_and_grad, coefs_guess, jac=True)
+            coefs_opt[i] = minimizer.x
+
+        poles_opt = np.concatenate((np.broadcast_to(known, (B, len(known))),
+                                    self.poles_from_coefs_batch(coefs_opt)), axis=1)
+        numerators = self.varpro_error(poles_opt, self.t, h_steps, NZ,
+                                       return_numerators=True)
+        return poles_opt, numerators
+
+    def extract_pzs_batch(self, NP, NZ, known_poles):
+        '''
+        Like extract_pzs, but self.h_step is (B, T): B step responses that
+        share the time points self.t. Each row is fit on its own, and the
+        numerators for all of them are solved together.
+        Returns poles (B, NP) and zeros (B, NZ); a row with fewer zeros
+        (leading numerator coefficient of 0) is padded with inf
+        '''
+        h_steps = np.atleast_2d(self.h_step)
+        zs = np.full((len(h_steps), NZ), float('inf'), dtype=complex)
+        ps, numerators = self._fit_poles_batch(h_steps, NP, NZ, known_poles)
+        for i, n in enumerate(numerators):
+            if np.all(np.isfinite(n)):
+                zeros = np.roots(n[::-1])
+                zs[i, :len(zeros)] = zeros[np.lexsort((abs(zeros),))]
+            else:
+                zs[i] = float('nan')
+        return ps / self.scale, zs / self.scale
+
 
 
 if __name__ == '__main__':
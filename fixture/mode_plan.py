@@ -0,0 +1,154 @@
+from itertools import product
+import numpy as np
+
+
+class ModePlan:
+    '''
+    Which combinations of a test's true_digital pins (modes) get simulated,
+    and how the regression turns those into params_by_mode.
+    By default every one of the 2^N modes is simulated and fit on its own.
+    It can be declared in the circuit config extras, or as a mode_plan
+    attribute on a test, e.g.
+    mode_plan:
+        reachable: [[0, 1], [1, 1]]  # or [{en: 0, sel: 1}, ...]
+        independent: [sel, gain]
+        fractional: True
+    reachable: the only modes the circuit is used in; modes are tuples in
+        the order of test.signals.true_digital()
+    independent: bits whose effect on every parameter is the same no matter
+        what the other bits are
+    fractional: only simulate a two-level fractional factorial over the
+        independent bits, and fit those bits as regression factors. Every
+        mode still gets its own entry in params_by_mode. It cannot be
+        combined with reachable: the design needs to pick its own modes,
+        which may not be reachable, and folding would make entries for modes
+        that are not
+    '''
+
+    def __init__(self, bits, reachable=None, independent=None, fractional=False):
+        self.bits = list(bits)
+        self.independent = [self.bit_index(b) for b in (independent or [])]
+        self.dependent = [i for i in range(len(self.bits)) if i not in self.independent]
+        self.fractional = fractional and len(self.independent) > 0
+
+        if reachable is None:
+            self.modes = list(product(range(2), repeat=len(self.bits)))
+        else:
+            self.modes = [self.parse_mode(m) for m in reachable]
+            assert len(set(self.modes)) == len(self.modes), f'Duplicate reachable modes {reachable}'
+        assert not (self.fractional and reachable is not None), \
+            'Cannot use a fractional mode plan together with reachable modes'
+
+        if self.fractional:
+            design = self.two_level_design(len(self.independent))
+            self.sim_modes = []
+            for group in product(range(2), repeat=len(self.dependent)):
+                for row in design:
+                    mode = [0] * len(self.bits)
+                    for i, val in zip(self.dependent, group):
+                        mode[i] = val
+                    for i, val in zip(self.independent, row):
+                        mode[i] = int(val)
+                    self.sim_modes.append(tuple(mode))
+        else:
+            self.sim_modes = list(self.modes)
+
+    @classmethod
+    def from_test(cls, template, test):
+        spec = getattr(test, 'mode_plan', None)
+        if spec is None:
+            spec = template.extras.get('mode_plan', None)
+        return cls(test.signals.true_digital(), **(spec or {}))
+
+    def bit_index(self, bit):
+        for i, s in enumerate(self.bits):
+            if bit is s or bit in [s.spice_name, s.template_name]:
+                return i
+        assert False, f'Mode plan bit {bit} is not a true_digital pin'
+
+    def parse_mode(self, mode):
+        if isinstance(mode, dict):
+            values = [None] * len(self.bits)
+            for bit, val in mode.items():
+                values[self.bit_index(bit)] = val
+            assert None not in values, f'Mode {mode} does not give every true_digital pin'
+            mode = values
+        assert len(mode) == len(self.bits), f'Mode {mode} should have {len(self.bits)} bits'
+        return tuple(int(x) for x in mode)
+
+    @staticmethod
+    def two_level_design(k):
+        '''
+        Rows of 0/1 for k factors with every main effect estimable: columns
+        of a Sylvester Hadamard matrix, so 2^ceil(log2(k+1)) runs instead
+        of 2^k
+        '''
+        n = 1
+        while n < k + 1:
+            n *= 2
+        hadamard = np.ones((1, 1), dtype=int)
+        while len(hadamard) < n:
+            hadamard = np.block([[hadamard, hadamard], [hadamard, -hadamard]])
+        # column 0 is all ones
+        return (hadamard[:, 1:k+1] > 0).astype(int)
+
+    def factors(self):
+        # signals fit as regression factors instead of separately by mode
+        return [self.bits[i] for i in self.independent] if self.fractional else []
+
+    def group(self, mode):
+        # modes that are fit together have the same group
+        if not self.fractional:
+            return tuple(mode)
+        return tuple(mode[i] for i in self.dependent)
+
+    def regression_groups(self, results_each_mode):
+        '''
+        Split results into the sets of rows to fit together.
+        Returns a list of (modes, results), where modes are the entries of
+        params_by_mode that fit is for. With a fractional plan, results
+        also get a 0/1 column for each of the factors()
+        '''
+        mode_ids = list(results_each_mode.mode_id)
+        groups = []
+        for group in dict.fromkeys(self.group(m) for m in mode_ids):
+            rows = np.array([self.group(m) == group for m in mode_ids])
+            results = results_each_mode.loc[rows]
+            if self.fractional:
+                results = results.copy()
+                for i in self.independent:
+                    results[self.bits[i]] = [m[i] for m in results.mode_id]
+                modes = [m for m in self.modes if self.group(m) == group]
+            else:
+                modes = [group]
+            groups.append((modes, results))
+        return groups
+
+    def fold(self, regression_results, mode):
+        '''
+        Take regression results fit with factors() and substitute this mode's
+        bit values, giving results in the same format as a fit for that mode
+        alone: {lhs: {param: {opt: coef}}}
+        '''
+        from fixture.regression import Regression
+        factors = {id(self.bits[i]): mode[i] for i in self.independent}
+        results = {}
+        for lhs, params in regression_results.items():
+            results[lhs] = {}
+            for param, coefs in params.items():
+                folded = {}
+                for opt, coef in coefs.items():
+                    parts = opt if isinstance(opt, tuple) else (opt,)
+                    rest = tuple(p for p in parts if id(p) not in factors)
+                    for p in parts:
+                        if id(p) in factors:
+                            coef = coef * factors[id(p)]
+                    if len(rest) == 0:
+                        base = Regression.one_literal
+                    elif len(rest) == 1:
+                        base = rest[0]
+                    else:
+                        base = rest
+                    folded[base] = folded.get(base, 0) + coef
+                results[lhs][param] = folded
+        return results
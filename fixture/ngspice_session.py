@@ -0,0 +1,218 @@
+import os
+import re
+import queue
+import hashlib
+import subprocess
+from contextlib import contextmanager
+
+
+class NgspiceSessionError(Exception):
+    pass
+
+
+class NgspiceSession:
+    '''
+    One long-lived ngspice process in pipe mode (ngspice -p), driven by
+    writing commands to its stdin. The first testbench is sourced as a whole,
+    which is when ngspice parses the netlist and loads the models. After
+    that, a testbench that only differs in its stimuli is run by altering
+    the PWL sources and issuing a new tran, so the models stay loaded
+    '''
+    # .control commands that the session does itself, in its own way
+    session_commands = ['run', 'write', 'exit', 'quit']
+    # echoed after every command so we know when ngspice is done with it
+    SENTINEL = '__fixture_session_done__'
+
+    def __init__(self, flags=None, env=None):
+        flags = [] if flags is None else list(flags)
+        env = None if env is None else {**os.environ, **env}
+        self.process = subprocess.Popen(['ngspice', '-p', *flags],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        stderr=subprocess.STDOUT,
+                                        text=True, bufsize=1, env=env)
+        self.deck_key = None
+        self.command('set noaskquit')
+        self.command('set filetype=binary')
+
+    def command(self, line):
+        '''
+        Send one command and return the lines ngspice printed for it
+        '''
+        if self.process.poll() is not None:
+            raise NgspiceSessionError(f'ngspice session exited with code {self.process.returncode}')
+        try:
+            self.process.stdin.write(f'{line}\necho {self.SENTINEL}\n')
+            self.process.stdin.flush()
+        except BrokenPipeError:
+            raise NgspiceSessionError(f'ngspice session exited while sending "{line}"')
+
+        output = []
+        while True:
+            out = self.process.stdout.readline()
+            if out == '':
+                raise NgspiceSessionError(
+                    f'ngspice session exited during "{line}":\n' + ''.join(output))
+            if out.rstrip().endswith(self.SENTINEL):
+                return output
+            output.append(out)
+
+    def checked_command(self, line):
+        output = self.command(line)
+        errors = [out for out in output
+                  if re.match(r'\s*error', out, re.IGNORECASE) or 'aborted' in out]
+        if errors:
+            raise NgspiceSessionError(f'ngspice error during "{line}":\n' + ''.join(output))
+        return output
+
+    @staticmethod
+    def parse_deck(text):
+        '''
+        Split a testbench written by fault's SpiceTarget into the parts a
+        session treats differently.
+        Returns (key, circuit, pwls, tran, control):
+        key: hash of everything except the stimuli and tran, so two decks
+            with the same key can share one loaded circuit
+        circuit: the deck without its .control block, for sourcing
+        pwls: {instance name: 't0 v0 t1 v1 ...'} for each PWL source
+        tran: the tran command, e.g. 'tran 1e-11 1e-08 uic'
+        control: the other commands from the .control block, like option
+            and save, to send once the circuit is loaded
+        '''
+        circuit = []
+        skeleton = []
+        control = []
+        pwls = {}
+        tran = None
+        in_control = False
+        for line in text.splitlines():
+            stripped = line.strip()
+            lower = stripped.lower()
+            if lower == '.control':
+                in_control = True
+                continue
+            if in_control:
+                if lower == '.endc':
+                    in_control = False
+                elif stripped and not stripped.startswith('*') \
+                        and lower.split()[0] not in NgspiceSession.session_commands:
+                    control.append(stripped)
+                    skeleton.append(line)
+                continue
+            circuit.append(line)
+
+            if lower.startswith('.tran'):
+                tran = stripped[1:]
+                continue
+            pwl = re.match(r'(V\S+)\s+(\S+)\s+(\S+)\s+(?:DC\s+\S+\s+)?PWL\((.*)\)\s*$',
+                           stripped, re.IGNORECASE)
+            if pwl is not None:
+                name = pwl.group(1).lower()
+                pwls[name] = pwl.group(4).strip()
+                skeleton.append(f'{name} {pwl.group(2)} {pwl.group(3)} PWL')
+                continue
+            skeleton.append(line)
+
+        assert tran is not None, 'No .tran in testbench for ngspice session'
+        key = hashlib.sha1('\n'.join(skeleton).encode()).hexdigest()
+        return key, '\n'.join(circuit) + '\n', pwls, tran, control
+
+    def run(self, tb_file, raw_file):
+        '''
+        Simulate fault's testbench tb_file and write the results to raw_file
+        in the same format "ngspice -b -r raw_file" would
+        '''
+        with open(tb_file) as f:
+            key, circuit, pwls, tran, control = self.parse_deck(f.read())
+
+        if key != self.deck_key:
+            # new structure, so parse the whole thing (and load the models)
+            circuit_file = f'{tb_file}.session.sp'
+            with open(circuit_file, 'w') as f:
+                f.write(circuit)
+            if self.deck_key is not None:
+                self.command('remcirc')
+            self.deck_key = None
+            self.checked_command(f'source {circuit_file}')
+            # the key covers the control commands, so they only need to be
+            # sent when the circuit is loaded
+            for line in control:
+                self.checked_command(line)
+            self.deck_key = key
+        else:
+            for name, pwl in pwls.items():
+                self.checked_command(f'alter @{name}[pwl] = [ {pwl} ]')
+
+        try:
+            self.checked_command(tran)
+            self.checked_command(f'write {raw_file}')
+        finally:
+            # drop the results so memory doesn't grow with every testbench
+            self.command('destroy all')
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.write('quit\n')
+                self.process.stdin.close()
+                self.process.wait(timeout=10)
+            except (BrokenPipeError, subprocess.TimeoutExpired):
+                self.process.kill()
+
+
+class SessionPool:
+    '''
+    A pool of NgspiceSessions. There is one pool per process, so with
+    SimulationPool each worker process starts its own sessions the first
+    time it simulates and keeps them for every test after that
+    '''
+    _pools = {}
+
+    def __init__(self, num_sessions=1, flags=None, env=None):
+        self.num_sessions = num_sessions
+        self.flags = flags
+        self.env = env
+        self.sessions = []
+        self.idle = queue.Queue()
+
+    @classmethod
+    def get(cls, num_sessions=1, flags=None, env=None):
+        # keyed by pid because forked workers can't share the parent's pipes
+        key = (os.getpid(), tuple(flags or []),
+               None if env is None else tuple(sorted(env.items())))
+        if key not in cls._pools:
+            cls._pools[key] = cls(num_sessions, flags, env)
+        return cls._pools[key]
+
+    @contextmanager
+    def session(self):
+        try:
+            s = self.idle.get_nowait()
+        except queue.Empty:
+            if len(self.sessions) < self.num_sessions:
+                s = NgspiceSession(self.flags, self.env)
+                self.sessions.append(s)
+            else:
+                s = self.idle.get()
+        try:
+            yield s
+        except BaseException:
+            # anything from an ngspice error to a KeyboardInterrupt halfway
+            # through a command; we don't know what state it's in, so start
+            # a fresh one next time rather than leave it neither idle nor gone
+            s.close()
+            self.sessions.remove(s)
+            raise
+        self.idle.put(s)
+
+    def run(self, tb_file, raw_file):
+        with self.session() as s:
+            s.run(tb_file, raw_file)
+
+    @classmethod
+    def close_all(cls):
+        for key, pool in list(cls._pools.items()):
+            if key[0] == os.getpid():
+                for s in pool.sessions:
+                    s.close()
+                del cls._pools[key]
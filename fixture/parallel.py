@@ -0,0 +1,107 @@
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+
+# The template holds the magma circuit and the simulator, which we can't
+# pickle, so workers get them through fork instead of as arguments
+_worker_state = {}
+
+
+def _simulate_in_worker(test_index, shard):
+    template = _worker_state['template']
+    checkpoint = _worker_state['checkpoint']
+    test = template.tests[test_index]
+    template.run_testbench(test, checkpoint, shard=shard)
+    return test_index
+
+
+def _plot_in_worker(filename, folder, profiler, test_name):
+    from fixture.plot_helper import PlotHelper
+    if profiler is None:
+        PlotHelper.plot_file(filename, folder)
+    else:
+        with profiler.stage(test_name, 'plot_regression'):
+            PlotHelper.plot_file(filename, folder)
+    return filename
+
+
+class SimulationPool:
+    '''
+    Runs the testbench build and simulation for several tests (or several
+    shards of one test) at once, each in its own process and its own
+    checkpoint.suggest_run_dir folder.
+    The parent process still does the analysis, post-processing and
+    regression for each test, but it can start on a test as soon as that
+    test's simulation is done. Analysis stays in the parent, in the original
+    test order, because some templates pass information from one test's
+    analysis to the next (e.g. SamplerTemplate.temp_inv)
+    '''
+
+    def __init__(self, template, checkpoint, num_workers):
+        self.template = template
+        self.checkpoint = checkpoint
+        self.num_workers = num_workers
+        self.futures = {}
+
+        _worker_state['template'] = template
+        _worker_state['checkpoint'] = checkpoint
+        # fork is necessary so the workers inherit _worker_state
+        context = multiprocessing.get_context('fork')
+        self.executor = ProcessPoolExecutor(max_workers=num_workers,
+                                            mp_context=context)
+
+    @staticmethod
+    def _key(test, shard):
+        return (test, None if shard is None else shard[0])
+
+    def submit(self, test, shard=None):
+        test_index = self.template.tests.index(test)
+        future = self.executor.submit(_simulate_in_worker, test_index, shard)
+        self.futures[self._key(test, shard)] = future
+
+    def wait(self, test, shard=None):
+        # blocks until the simulation for this test is done, and re-raises
+        # any error from the worker
+        key = self._key(test, shard)
+        assert key in self.futures, f'Simulation for {test} shard {shard} was never submitted'
+        self.futures[key].result()
+
+    def shutdown(self, cancel=False):
+        # cancel drops the simulations that haven't started yet
+        self.executor.shutdown(wait=True, cancel_futures=cancel)
+        _worker_state.clear()
+
+
+class PlotPool:
+    '''
+    Draws the full regression plots in background processes, so go() can
+    move on to the next mode or test while they render. Each job only gets
+    the filename of the data saved with Checkpoint.save_plot_data.
+    Plots are optional, so a plot that fails is reported at shutdown
+    instead of stopping the run.
+    No processes are started until the first submit. With a StageProfiler,
+    each worker records the time it spends drawing as a plot_regression stage
+    '''
+
+    def __init__(self, num_workers=1, profiler=None):
+        self.num_workers = num_workers
+        self.profiler = profiler
+        self.executor = None
+        self.futures = []
+
+    def submit(self, filename, folder, test_name=None):
+        if self.executor is None:
+            context = multiprocessing.get_context('fork')
+            self.executor = ProcessPoolExecutor(max_workers=self.num_workers,
+                                                mp_context=context)
+        self.futures.append(self.executor.submit(_plot_in_worker, filename, folder,
+                                                 self.profiler, test_name))
+
+    def shutdown(self, cancel=False):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=cancel)
+            self.executor = None
+        for future in self.futures:
+            if not future.cancelled() and future.exception() is not None:
+                print(f'Plotting failed: {future.exception()!r}')
+        self.futures = []
@@ -0,0 +1,85 @@
+from fixture.regression import Regression
+
+
+class ParameterAlgebra:
+    '''
+    A test's parameter_algebra compiled to monomials. For example
+    {'out': {'gain': 'in*vdd^2', 'offset': '1'}} has
+    symbols: ['in', 'vdd', Regression.one_literal]
+    equations: {'out': [('gain', (0, 1, 1)), ('offset', (2,))]}
+    Each monomial is a tuple of indices into symbols, with powers written out
+    as repeats. Every factor is kept, with '1' read as Regression.one_literal.
+    Compiling only looks at the strings, so it is cached per test class and
+    shared by every instance with the same algebra, and bind() looks up each
+    symbol once no matter how many terms use it
+    '''
+    ones = ['1', Regression.one_literal]
+    _compiled = {}
+
+    def __init__(self, symbols, equations):
+        self.symbols = symbols
+        self.equations = equations
+
+    @staticmethod
+    def parse_term(term):
+        # 'a*b^2' -> ['a', 'b', 'b']; python's ** works too
+        factors = []
+        for f in term.replace('**', '^').split('*'):
+            power_split = [x.strip() for x in f.split('^')]
+            if len(power_split) == 1:
+                factors.append(power_split[0])
+            elif len(power_split) == 2:
+                factors += [power_split[0]] * int(power_split[1])
+            else:
+                assert False, f'Double power in {term}?'
+        return factors
+
+    @classmethod
+    def compile(cls, parameter_algebra, owner=None):
+        try:
+            key = (owner, tuple((lhs, tuple(rhs.items()))
+                                for lhs, rhs in parameter_algebra.items()))
+            hash(key)
+        except TypeError:
+            # something unhashable in the algebra, so just don't cache it
+            key = None
+        if key is not None and key in cls._compiled:
+            return cls._compiled[key]
+
+        symbols = []
+        index = {}
+        equations = {}
+        for lhs, rhs in parameter_algebra.items():
+            equations[lhs] = []
+            for param, term in rhs.items():
+                if isinstance(term, str):
+                    factors = cls.parse_term(term)
+                elif isinstance(term, tuple):
+                    # already split into factors, which aren't parsed
+                    factors = term
+                else:
+                    factors = (term,)
+                monomial = []
+                for f in factors:
+                    if f in cls.ones:
+                        f = Regression.one_literal
+                    if f not in index:
+                        index[f] = len(symbols)
+                        symbols.append(f)
+                    monomial.append(index[f])
+                equations[lhs].append((param, tuple(monomial)))
+
+        compiled = cls(symbols, equations)
+        if key is not None:
+            cls._compiled[key] = compiled
+        return compiled
+
+    def bind(self, convert):
+        '''
+        Returns {lhs: [(param, term)]} where each term is a tuple of whatever
+        convert turns each symbol into, usually Signals
+        '''
+        factors = [convert(s) for s in self.symbols]
+        return {lhs: [(param, tuple(factors[i] for i in monomial))
+                      for param, monomial in terms]
+                for lhs, terms in self.equations.items()}
@@ -1,15 +1,13 @@
 import itertools
 import operator
+import os
+import pickle
 from functools import reduce
 
-import matplotlib.pyplot as plt
-import scipy
-import statsmodels.formula.api as smf
 import pandas
 import numpy as np
 from fixture.regression import Regression
 from fixture.signals import SignalIn, SignalOut
-from scipy.interpolate import griddata
 
 
 class PlotHelper:
@@ -19,6 +17,41 @@ class PlotHelper:
         self.data = data
         self.parameter_algebra = parameter_algebra
         self.regression_results = regression_results
+        # lhs each param is part of
+        self.param_lhs = {}
+        for lhs, rhs in parameter_algebra.items():
+            for param in rhs:
+                self.param_lhs.setdefault(param, lhs)
+        # data columns as arrays, fits compiled by _param_plan, and
+        # get_column results
+        self.columns = {}
+        self.plans = {}
+        self.cache = {}
+
+    @classmethod
+    def from_file(cls, filename):
+        # data saved with Checkpoint.save_plot_data
+        with open(filename, 'rb') as f:
+            data, parameter_algebra, regression_results = pickle.load(f)
+        return cls(data, parameter_algebra, regression_results)
+
+    @classmethod
+    def plot_file(cls, filename, folder):
+        '''
+        Draw the full regression plots for data saved with
+        Checkpoint.save_plot_data, into folder. Used by PlotPool, but also
+        handy for drawing the full set after a run with plots: summary
+        '''
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+        cwd = os.getcwd()
+        os.chdir(folder)
+        try:
+            cls.from_file(filename).plot_regression()
+        finally:
+            plt.close('all')
+            os.chdir(cwd)
 
     def get_column(self, target, overrides=None, lhs_pred=False, param_meas=False):
         '''
@@ -37,37 +70,76 @@ class PlotHelper:
 
         Also, cases [1, 4, 5, 6] can be adjusted to mimic optional input values
         Also, if target is a tuple, returns the product of the elements
+
+        Columns are numpy arrays, and are memoized by target and overrides,
+        so plot_regression asking for the same params and predictions over
+        and over only computes each once. Don't edit them in place
         '''
 
-        # clean up some inputs
         if overrides is None:
             overrides = {}
         if isinstance(target, (SignalIn, SignalOut)):
             target = Regression.regression_name(target)
 
+        key = (target, self._overrides_key(overrides), lhs_pred, param_meas)
+        if key not in self.cache:
+            column = self._eval_column(target, overrides, lhs_pred, param_meas)
+            if isinstance(column, np.ndarray) and column.ndim > 0:
+                # it's shared by everyone who asks for it now
+                column.flags.writeable = False
+            self.cache[key] = column
+        return self.cache[key]
+
+    @staticmethod
+    def _overrides_key(overrides):
+        key = []
+        for name, value in overrides.items():
+            if not isinstance(name, (str, tuple)):
+                name = Regression.regression_name(name)
+            value = np.asarray(value, dtype=float)
+            key.append((name, value.shape, value.tobytes()))
+        return frozenset(key)
+
+    def _data_column(self, name):
+        if name not in self.columns:
+            assert name in self.data, f"Can't find target {name}, assumed this was Case 2 or 3"
+            self.columns[name] = np.asarray(self.data[name], dtype=float)
+        return self.columns[name]
+
+    def _param_plan(self, lhs, param):
+        # param = sum of coef * component, as a list of components and a
+        # vector of their coefs
+        if (lhs, param) not in self.plans:
+            fit = self.regression_results[lhs][param]
+            self.plans[(lhs, param)] = (list(fit.keys()),
+                                        np.array(list(fit.values()), dtype=float))
+        return self.plans[(lhs, param)]
+
+    def _eval_column(self, target, overrides, lhs_pred, param_meas):
         # easy cases
         if target in overrides:
             # TODO what if override is a number, not column?
-            return overrides[target]
-        overrides_str = {Regression.regression_name(s): v for s, v in overrides.items()}
+            return np.asarray(overrides[target], dtype=float)
+        overrides_str = {Regression.regression_name(s): v for s, v in overrides.items()
+                         if not isinstance(s, tuple)}
         if target in overrides_str:
-            return overrides_str[target]
+            return np.asarray(overrides_str[target], dtype=float)
         if isinstance(target, tuple):
             return reduce(operator.mul,
-                          [self.get_column(elem) for elem in target],
-                          self.data[Regression.one_literal])
+                          [self.get_column(elem, overrides) for elem in target],
+                          self._data_column(Regression.one_literal))
 
         # now we start breaking it up by the 6 cases
         if target in self.parameter_algebra:
             if not lhs_pred:
                 # Case 1) lhs
+                lhs_column = self._data_column(Regression.regression_name(target))
                 if overrides == {}:
-                    return self.data[Regression.regression_name(target)]
+                    return lhs_column
                 else:
                     adjustment = (self.get_column(target, lhs_pred=True, overrides=overrides)
                                   - self.get_column(target, lhs_pred=True))
-                    result = self.get_column(target) + adjustment
-                    return result
+                    return lhs_column + adjustment
 
             else:
                 # Case 5) lhs_pred
@@ -77,36 +149,40 @@ class PlotHelper:
                                for param, factors in rhs.items()])
                 return pred
 
-        #params = {p: t
-        #          for rhs in self.parameter_algebra.values()
-        #          for p, t in rhs.items()}
-        for lhs, rhs in self.parameter_algebra.items():
-            if target in rhs:
-                if not param_meas:
-                    # Case 4) param
-                    fit = self.regression_results[lhs][target]
-                    param = reduce(operator.add,
-                                  [self.get_column(param_comp, overrides) * coef
-                                   for param_comp, coef in fit.items()])
-                    return param
-                else:
-                    # Case 6: gain = (out - offset) / in
-
-                    other_terms = reduce(operator.add,
-                        [self.get_column(param, overrides) * self.get_column(factors)
-                         for param, factors in rhs.items() if param != target],
-                        np.zeros(self.data.shape[0]))
-                    this_term_factors = self.get_column(rhs[target])
-                    lhs_column = self.get_column(lhs)
-                    result = (lhs_column - other_terms) / this_term_factors
-                    return result
+        if target in self.param_lhs:
+            lhs = self.param_lhs[target]
+            rhs = self.parameter_algebra[lhs]
+            if not param_meas:
+                # Case 4) param
+                components, coefs = self._param_plan(lhs, target)
+                columns = np.broadcast_arrays(*[self.get_column(c, overrides)
+                                                for c in components])
+                return np.tensordot(coefs, np.stack(columns), axes=1)
+            else:
+                # Case 6: gain = (out - offset) / in
+                other_terms = reduce(operator.add,
+                    [self.get_column(param, overrides) * self.get_column(factors)
+                     for param, factors in rhs.items() if param != target],
+                    np.zeros(self.data.shape[0]))
+                this_term_factors = self.get_column(rhs[target])
+                lhs_column = self.get_column(lhs)
+                return (lhs_column - other_terms) / this_term_factors
+
         # if we are still here, it should be Case 2 or 3
         # without access to signals, we can't check if it's case 3, so we just
         # assume target will be in data and go with it
+        return self._data_column(Regression.regression_name(target))
 
-        target = Regression.regression_name(target)
-        assert target in self.data, f"Can't find target {target}, assumed this was Case 2 or 3"
-        return self.data[target]
+    def sweep(self, target, pin, values, overrides=None, lhs_pred=False):
+        '''
+        get_column with pin overridden by each of values, as one broadcast
+        operation instead of a get_column call per value.
+        Returns an array with a row for each value
+        '''
+        overrides = dict(overrides or {})
+        overrides[pin] = np.asarray(values, dtype=float)[:, np.newaxis]
+        column = self.get_column(target, overrides, lhs_pred=lhs_pred)
+        return np.broadcast_to(column, (len(values), self.data.shape[0]))
 
 
     @classmethod
@@ -116,6 +192,7 @@ class PlotHelper:
 
     @classmethod
     def save_current_plot(cls, name):
+        import matplotlib.pyplot as plt
         plt.grid()
         #plt.show()
         plt.savefig(cls.clean_filename(name), dpi=cls.dpi)
@@ -127,7 +204,34 @@ class PlotHelper:
 
     #@classmethod(parameter_algebra, data, )
 
+    def plot_summary(self):
+        '''
+        One plot of predicted vs. measured for each lhs, a lot cheaper than
+        plot_regression
+        '''
+        import matplotlib.pyplot as plt
+        for lhs in self.parameter_algebra:
+            y_meas = np.array(self.get_column(lhs), dtype=float)
+            y_pred = np.array(self.get_column(lhs, lhs_pred=True), dtype=float)
+            if len(y_meas) != len(y_pred):
+                # same nan issue as in plot_regression
+                continue
+            start = min(np.nanmin(y_meas), np.nanmin(y_pred))
+            end = max(np.nanmax(y_meas), np.nanmax(y_pred))
+
+            plt.figure()
+            plt.plot(y_meas, y_pred, 'x')
+            plt.plot([start, end], [start, end], '--')
+            plt.xlabel('Measured')
+            plt.ylabel('Predicted by model')
+            plt.title(f'{lhs} fit')
+            self.save_current_plot(f'{lhs}_fit')
+            plt.close()
+
     def plot_regression(self):
+        import matplotlib.pyplot as plt
+        import scipy.spatial
+        from scipy.interpolate import griddata
         #models = regression.results_models
         #for reg_name, value in models.items():
         #    name = reg_name[2:-1]
@@ -297,6 +401,7 @@ class PlotHelper:
 
     @classmethod
     def plot_optional_effects(cls, test, data, regression_results):
+        import matplotlib.pyplot as plt
 
         def regression_name(s):
             return Regression.clean_string(Regression.regression_name(s))
@@ -394,6 +499,7 @@ class PlotHelper:
 
 
 if __name__ == '__main__':
+    import matplotlib.pyplot as plt
     x = [1, 2, 3]
     y = [6, 5, 2]
     plt.plot(x, y)
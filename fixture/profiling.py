@@ -0,0 +1,165 @@
+import collections
+import csv
+import glob
+import json
+import os
+import resource
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+
+class StackSampler:
+    '''
+    Minimal sampling profiler: a background thread looks at the profiled
+    thread's stack every interval seconds and counts each distinct stack.
+    save() writes them in the folded format flamegraph.pl and speedscope read
+    '''
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.counts = collections.Counter()
+        self.thread_id = None
+        self.running = False
+        self.thread = None
+
+    def _run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.counts[';'.join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def enable(self):
+        self.thread_id = threading.get_ident()
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def disable(self):
+        self.running = False
+        self.thread.join()
+
+    def save(self, filename):
+        with open(filename, 'w') as f:
+            for stack, count in self.counts.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class StageProfiler:
+    '''
+    Records wall time, CPU time and peak RSS for each stage of each test in
+    TemplateMaster.go, and optionally profiles each stage.
+    Records are appended to a file per process as they happen, so stages run
+    in SimulationPool workers are included too. report() collects them into
+    profile.json and profile.csv in the checkpoint folder.
+    CPU time and RSS are given separately for this process and for its
+    children, which is where the simulator runs. RSS is the high-water mark
+    at the end of the stage, and rss_growth is how much the stage raised it
+    profile: None, 'cprofile' to save a .prof file per stage (for pstats or
+        snakeviz), or 'sample' to save a folded stack file per stage
+    '''
+    stat_names = ['wall', 'cpu', 'cpu_children', 'rss_mb', 'rss_growth_mb',
+                  'rss_children_mb']
+
+    def __init__(self, checkpoint_folder, profile=None):
+        assert profile in [None, 'cprofile', 'sample'], f'Unknown profiler {profile}'
+        self.folder = os.path.join(checkpoint_folder, 'profile')
+        self.profile = profile
+        os.makedirs(self.folder, exist_ok=True)
+        # leftovers from an earlier run would end up in this report
+        for filename in glob.glob(os.path.join(self.folder, '*')):
+            os.remove(filename)
+
+    @staticmethod
+    def _usage():
+        self_usage = resource.getrusage(resource.RUSAGE_SELF)
+        children = resource.getrusage(resource.RUSAGE_CHILDREN)
+        # ru_maxrss is in kB on linux
+        return {
+            'wall': time.perf_counter(),
+            'cpu': self_usage.ru_utime + self_usage.ru_stime,
+            'cpu_children': children.ru_utime + children.ru_stime,
+            'rss_mb': self_usage.ru_maxrss / 1024,
+            'rss_children_mb': children.ru_maxrss / 1024,
+        }
+
+    @contextmanager
+    def stage(self, test, stage):
+        profiler = None
+        if self.profile == 'cprofile':
+            import cProfile
+            profiler = cProfile.Profile()
+        elif self.profile == 'sample':
+            profiler = StackSampler()
+
+        before = self._usage()
+        if profiler is not None:
+            profiler.enable()
+        try:
+            yield
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            after = self._usage()
+            record = {
+                'test': str(test),
+                'stage': stage,
+                'pid': os.getpid(),
+                'start': time.time() - (after['wall'] - before['wall']),
+                'wall': after['wall'] - before['wall'],
+                'cpu': after['cpu'] - before['cpu'],
+                'cpu_children': after['cpu_children'] - before['cpu_children'],
+                'rss_mb': after['rss_mb'],
+                'rss_growth_mb': after['rss_mb'] - before['rss_mb'],
+                'rss_children_mb': after['rss_children_mb'],
+            }
+            with open(os.path.join(self.folder, f'stages_{os.getpid()}.jsonl'), 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+            if profiler is not None:
+                name = f'{test}_{stage}_{os.getpid()}_{int(record["start"]*1e3)}'
+                if self.profile == 'cprofile':
+                    profiler.dump_stats(os.path.join(self.folder, f'{name}.prof'))
+                else:
+                    profiler.save(os.path.join(self.folder, f'{name}.folded'))
+
+    def records(self):
+        records = []
+        for filename in glob.glob(os.path.join(self.folder, 'stages_*.jsonl')):
+            with open(filename) as f:
+                records += [json.loads(line) for line in f if line.strip()]
+        return sorted(records, key=lambda r: r['start'])
+
+    def report(self):
+        records = self.records()
+        with open(os.path.join(self.folder, 'profile.json'), 'w') as f:
+            json.dump(records, f, indent=2)
+        columns = ['test', 'stage', 'pid', 'start'] + self.stat_names
+        with open(os.path.join(self.folder, 'profile.csv'), 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=columns)
+            writer.writeheader()
+            writer.writerows(records)
+
+        # a stage can run several times for one test (shards, modes, batches)
+        totals = {}
+        for r in records:
+            total = totals.setdefault((r['test'], r['stage']), {'count': 0, 'wall': 0, 'cpu': 0,
+                                                                 'cpu_children': 0, 'rss_mb': 0})
+            total['count'] += 1
+            for k in ['wall', 'cpu', 'cpu_children']:
+                total[k] += r[k]
+            total['rss_mb'] = max(total['rss_mb'], r['rss_mb'])
+
+        print(f'Stage timing (details in {self.folder}):')
+        print('\ttest\tstage\tcount\twall (s)\tcpu (s)\tsim cpu (s)\tpeak rss (MB)')
+        for (test, stage), t in totals.items():
+            print(f'\t{test}\t{stage}\t{t["count"]}\t{t["wall"]:.3f}\t{t["cpu"]:.3f}'
+                  f'\t{t["cpu_children"]:.3f}\t{t["rss_mb"]:.0f}')
+        return records
@@ -0,0 +1,175 @@
+import os
+import numpy as np
+from fixture.waveform import Waveform
+from fixture.edges import find_crossings, resolve_edge_reads, EdgeReadError
+
+
+class RawFile:
+    '''
+    Simulator results from a SPICE .raw file (ngspice -r, binary or ascii).
+    Binary data is memory mapped rather than parsed, and each signal is only
+    pulled out of the file the first time something reads it.
+    Use RawFile.open so each file is only mapped once
+    '''
+    _open_files = {}
+
+    def __init__(self, filepath):
+        self.filepath = str(filepath)
+        self.plots = self.read_plots(self.filepath)
+        assert len(self.plots) > 0, f'No data in raw file {self.filepath}'
+        # usually there is only the transient, but an op point can come first
+        transients = [p for p in self.plots if 'transient' in p['name'].lower()]
+        self.plot = transients[-1] if transients else self.plots[-1]
+
+        self.names = {}
+        for i, name in enumerate(self.plot['names']):
+            # same cleanup fault does for results: v(out) -> out
+            lower = name.lower()
+            if (lower.startswith('v(') or lower.startswith('i(')) and lower.endswith(')'):
+                name = name[2:-1]
+            self.names[name] = i
+        assert 'time' in self.names, f'No time vector in raw file {self.filepath}'
+        self.columns = {}
+        self.time = self.column('time')
+        self.crossings = {}
+
+    @classmethod
+    def open(cls, filepath):
+        # reuse the mapping unless the simulator rewrote the file
+        stat = os.stat(filepath)
+        key = (str(filepath), stat.st_mtime_ns, stat.st_size)
+        if key not in cls._open_files:
+            cls._open_files = {k: v for k, v in cls._open_files.items()
+                               if k[0] != key[0]}
+            cls._open_files[key] = cls(filepath)
+        return cls._open_files[key]
+
+    @staticmethod
+    def read_plots(filepath):
+        '''
+        Returns a list of plots, each {'name': plotname, 'names': [variable
+        names], 'data': (num_points, num_variables) array}
+        '''
+        plots = []
+        size = os.path.getsize(filepath)
+        with open(filepath, 'rb') as f:
+            header = {}
+            names = []
+            while True:
+                line = f.readline()
+                if not line:
+                    return plots
+                key, _, value = line.decode('latin-1').partition(':')
+                key = key.strip().lower()
+
+                if key == 'variables':
+                    num_variables = int(header['no. variables'])
+                    # the first variable might be on the same line
+                    entries = [value] if value.strip() else []
+                    while len(entries) < num_variables:
+                        entries.append(f.readline().decode('latin-1'))
+                    names = [entry.split()[1] for entry in entries]
+
+                elif key in ['binary', 'values']:
+                    num_variables = len(names)
+                    num_points = int(header['no. points'])
+                    is_complex = 'complex' in header.get('flags', '').lower()
+                    if key == 'binary':
+                        dtype = np.complex128 if is_complex else np.float64
+                        row_bytes = num_variables * np.dtype(dtype).itemsize
+                        offset = f.tell()
+                        # a sim that was killed early has fewer points
+                        num_points = min(num_points, (size - offset) // row_bytes)
+                        data = np.memmap(filepath, dtype=dtype, mode='r',
+                                         offset=offset, shape=(num_points, num_variables))
+                        f.seek(offset + num_points * row_bytes)
+                    else:
+                        assert not is_complex, 'TODO complex ascii raw files'
+                        # each point is its index followed by every variable
+                        tokens = []
+                        while len(tokens) < num_points * (num_variables + 1):
+                            line = f.readline()
+                            if not line:
+                                break
+                            tokens += line.split()
+                        num_points = len(tokens) // (num_variables + 1)
+                        data = np.array(tokens[:num_points*(num_variables+1)], dtype=float)
+                        data = data.reshape((num_points, num_variables + 1))[:, 1:]
+                    plots.append({'name': header.get('plotname', ''),
+                                  'names': names,
+                                  'data': data})
+                    header = {}
+                    names = []
+
+                elif key:
+                    header[key] = value.strip()
+
+    def column(self, name):
+        if name not in self.names:
+            # ngspice makes every name lowercase
+            assert name.lower() in self.names, f'No signal {name} in {self.filepath}'
+            name = name.lower()
+        if name not in self.columns:
+            v = self.plot['data'][:, self.names[name]]
+            if np.iscomplexobj(v):
+                v = v.real
+            # contiguous so searching it doesn't copy every time
+            self.columns[name] = np.ascontiguousarray(v)
+        return self.columns[name]
+
+    def __contains__(self, name):
+        return name in self.names or name.lower() in self.names
+
+    def waveform(self, name):
+        return Waveform(self.time, self.column(name))
+
+    def get_crossings(self, name, height):
+        # (rising, falling) times, scanned once per signal and height
+        key = (name, height)
+        if key not in self.crossings:
+            self.crossings[key] = find_crossings(self.time, self.column(name), height)
+        return self.crossings[key]
+
+    def resolve_gets(self, gets, name_of, edge_height, fallback):
+        '''
+        Fill in action.value for every (time, action) in gets, grouping the
+        reads by signal and style so each group is one vectorized search.
+        name_of(action) gives the signal name, and fallback(time, action) is
+        used for styles this doesn't know about
+        Point reads: interpolated value at time, clamped at the ends
+        Block reads: (t, v) for the duration after time, with one extra
+            sample on either side, and t relative to the read time
+        Edge reads: list of the count nearest edge times relative to the read
+            time, searching forward or backward; an EdgeReadError if there
+            aren't that many
+        '''
+        groups = {}
+        for time, action in gets:
+            params = action.params if isinstance(action.params, dict) else {}
+            style = params.get('style', 'single')
+            if style not in ['single', 'block', 'edge'] or name_of(action) not in self:
+                fallback(time, action)
+                continue
+            groups.setdefault((name_of(action), style), []).append((time, action, params))
+
+        t = self.time
+        for (name, style), reads in groups.items():
+            times = np.array([time for time, _, _ in reads], dtype=float)
+            v = self.column(name)
+
+            if style == 'single':
+                values = np.interp(times, t, v)
+                for (_, action, _), value in zip(reads, values):
+                    action.value = value
+
+            elif style == 'block':
+                durations = np.array([p['duration'] for _, _, p in reads], dtype=float)
+                starts = np.maximum(np.searchsorted(t, times, side='right') - 1, 0)
+                stops = np.minimum(np.searchsorted(t, times + durations, side='left') + 1, len(t))
+                for (time, action, _), a, b in zip(reads, starts, stops):
+                    action.value = Waveform(t, v, a, b, offset=time)
+
+            else:
+                resolve_edge_reads(reads, name,
+                                   lambda height: self.get_crossings(name, height),
+                                   edge_height)
@@ -1,7 +1,6 @@
 from collections import defaultdict
 from functools import reduce
 
-import statsmodels.formula.api as smf
 import pandas
 from itertools import combinations, product
 import magma
@@ -9,6 +8,7 @@ import re
 from ast import literal_eval
 
 from fixture.signals import SignalArray
+from fixture.least_squares import fit_shared_design
 import operator
 
 
@@ -131,10 +131,27 @@ class Regression:
 
         return '_times_'.join([self.regression_name(x) for x in term])
 
-    def __init__(self, template, test, data):
+    @classmethod
+    def add_mode_factors(cls, terms, mode_factors):
+        # every optional term gets an extra version for each mode bit, so the
+        # bits shift every coefficient independently
+        ans = list(terms)
+        for bit in mode_factors:
+            for term in terms:
+                if term == cls.one_literal:
+                    ans.append(bit)
+                elif isinstance(term, tuple):
+                    ans.append((*term, bit))
+                else:
+                    ans.append((term, bit))
+        return ans
+
+    def __init__(self, template, test, data, mode_factors=None):
         '''
         Incoming data should be of the form 
         {pin:[x1, ...], ...}
+        mode_factors: true_digital signals to fit as regression factors,
+            which need their own 0/1 column in data (see ModePlan)
         '''
 
         assert self.one_literal in data, 'Should have been set in go()'
@@ -165,54 +182,87 @@ class Regression:
         '''
         results = {lhs: defaultdict(dict) for lhs in pa}
         results_models = {}
-        regression_dicts = []
+        info_mappings = {}
+        # each product term is computed once and shared by every lhs that
+        # uses it, along with which of its rows are missing
+        self.column_cache = {}
+        notnull_cache = {}
+        # every column used by any lhs, in order, without duplicates
+        # when they have the same column heading, assert that the data is equal
+        data_combined = {}
+        # lhs with the same terms and the same missing rows use the same
+        # design matrix, so they are fit together
+        shared_designs = {}
+
+        def add_combined(header, column):
+            if header in data_combined:
+                # duplicate; usually the very same cached column
+                if column is not data_combined[header]:
+                    assert all(column == data_combined[header]), 'Mismatched data'
+            else:
+                data_combined[header] = column
+
+        optional_pin_expr = self.get_optional_pin_expression(template)
+        if mode_factors:
+            optional_pin_expr = self.add_mode_factors(optional_pin_expr, mode_factors)
         for lhs, rhs in pa.items():
             lhs_clean = self.clean_string(lhs)
-            regression_data_dict = {lhs_clean: data[lhs]}
+            lhs_column = data[lhs]
+            add_combined(lhs_clean, lhs_column)
             self.info_mapping = {}
 
-            optional_pin_expr = self.get_optional_pin_expression(template)
             rhs_info = self.get_terms(rhs, optional_pin_expr)
+            names = []
+            # drop rows with missing data in any column of this fit
+            df_row_mask = lhs_column.notnull().to_numpy()
             for name, term, param, opt in rhs_info:
                 assert name not in self.info_mapping, f'Duplicate term: {name}'
                 self.info_mapping[name] = (term, param, opt)
-                column = reduce(operator.mul,
-                                [data[x] for x in term],
-                                data[self.one_literal])
-                regression_data_dict[name] = column
+                if term not in self.column_cache:
+                    column = reduce(operator.mul,
+                                    [data[x] for x in term],
+                                    data[self.one_literal])
+                    self.column_cache[term] = column
+                    notnull_cache[term] = column.notnull().to_numpy()
+                add_combined(name, self.column_cache[term])
+                df_row_mask = df_row_mask & notnull_cache[term]
+                names.append(name)
             # TODO if every instance of 'vdd' is in a product term, should we
             # still add 'vdd' to the dataframe by itself?
-            regression_data = pandas.DataFrame(regression_data_dict)
-
-
-            df_row_mask = ~ regression_data[lhs_clean].isnull()
-            df_filtered = regression_data[df_row_mask]
-
-            formula = self.make_formula(lhs_clean, [x[0] for x in rhs_info])
-            stats_model = smf.ols(formula, df_filtered)
-            stat_results = stats_model.fit()
+            info_mappings[lhs] = self.info_mapping
+
+            key = (tuple(names), df_row_mask.tobytes())
+            if key not in shared_designs:
+                exog_frame = pandas.DataFrame({name: self.column_cache[self.info_mapping[name][0]]
+                                               for name in names})[df_row_mask]
+                shared_designs[key] = (names, exog_frame, {})
+            shared_designs[key][2][lhs] = lhs_column[df_row_mask]
+
+        fits = {}
+        for names, exog_frame, endog_columns in shared_designs.values():
+            lhs_clean = {lhs: self.clean_string(lhs) for lhs in endog_columns}
+            frame = pandas.concat([exog_frame] + [column.rename(lhs_clean[lhs])
+                                   for lhs, column in endog_columns.items()],
+                                  axis='columns')
+            group_fits = fit_shared_design(frame, names, list(lhs_clean.values()))
+            for lhs in endog_columns:
+                fits[lhs] = group_fits[lhs_clean[lhs]]
+
+        for lhs in pa:
+            stat_results = fits[lhs]
             results_entry = results[lhs]
             for name, coef in stat_results.params.items():
-                term, param, opt = self.info_mapping[name]
+                term, param, opt = info_mappings[lhs][name]
                 assert opt not in results_entry[param], f'Parameter {lhs}->{param}->{opt} found in multiple parameter algebra formulas'
                 results_entry[param][opt] = coef
 
             results_models[lhs] = stat_results
 
-            # TODO need to double-check that this still handles NaNs correctly
-            regression_dicts.append(regression_data)
-
+        # which result row each regression row is, for post_regression
+        for name in ['mode_id', 'sample_id']:
+            if name in data.columns:
+                add_combined(name, data[name])
 
-        # combine the individual dataframes into a big one
-        # when they have the same column heading, assert that the data is equal
-        data_combined = {}
-        for df in regression_dicts:
-            for header, column in df.items():
-                if header in data_combined:
-                    # duplicate
-                    assert all(column == data_combined[header]), 'Mismatched data'
-                else:
-                    data_combined[header] = column
         df_combined = pandas.DataFrame(data_combined)
 
         # TODO dump res to a yaml file
@@ -221,6 +271,15 @@ class Regression:
         self.results_models = results_models
 
 
-    def make_formula(self, lhs_clean, rhs_names):
-        return f'I({lhs_clean}) ~ {" + ".join(rhs_names)} -1'
+    def converged(self, tol):
+        '''
+        True when every coefficient's standard error is at most tol times the
+        largest coefficient (in absolute value) in the same fit
+        '''
+        for stat_results in self.results_models.values():
+            scale = max(abs(stat_results.params), default=0)
+            bse = stat_results.bse
+            if bse.isnull().any() or any(bse > tol * scale):
+                return False
+        return True
 
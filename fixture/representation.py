@@ -1,5 +1,6 @@
 from fault.domain_read import EdgeNotFoundError, domain_read
 from fixture.signals import SignalOut, SignalIn, SignalArray
+from fixture.waveform import Waveform
 import numpy as np
 
 class Representation:
@@ -226,13 +227,15 @@ class Representation:
             def callback():
                 if (len(gvs)>0 and gvs[0].params.get('style', None) == 'block'):
                     # probably block read
-                    ts, vs = zip(*[gv.value for gv in gvs])
-                    time_check = all([all(ts[0] == ts[i])
-                                      for i in range(1, len(ts))])
+                    ws = [Waveform.from_value(gv.value) for gv in gvs]
+                    t = ws[0].t
+                    time_check = all([w.t is t or np.array_equal(w.t, t)
+                                      for w in ws[1:]])
                     assert time_check, f'Inconsistent time steps in block read of vector {self.name}'
-                    t = ts[0]
-                    v = sum(vi*coef for vi, coef in zip(vs, coefs))
-                    return t, v
+                    # only add up the components where someone looks
+                    def v(index):
+                        return sum(w.values(index)*coef for w, coef in zip(ws, coefs))
+                    return Waveform(t, v)
 
                 else:
                     return sum(gv.value*coef for gv, coef in zip(gvs, coefs))
@@ -3,7 +3,6 @@ from fixture.checkpoints import Checkpoint
 import fixture.config_parse as config_parse
 import fault
 import fixture.templates as templates
-import fixture.mgenero_interface as mgenero_interface
 from fixture.simulator import Simulator
 
 
@@ -27,11 +26,18 @@ def edit_paths(config_dict, config_filename, params):
             config_dict[param] = new
 
 
-def run(circuit_config_filename):
+def run(circuit_config_filename, **run_options):
+    '''
+    run_options are passed on to TemplateMaster.go, e.g. num_workers=8.
+    They can also be given in the "run_options" section of the circuit
+    config; anything passed here takes precedence over the config
+    '''
     with open(circuit_config_filename) as f:
         circuit_config_dict = yaml.safe_load(f)
         circuit_config_dict['filename'] = circuit_config_filename
     edit_paths(circuit_config_dict, circuit_config_filename, ['filepath', 'mgenero'])
+    config_run_options = circuit_config_dict.get('run_options', None) or {}
+    circuit_config_dict['run_options'] = {**config_run_options, **run_options}
     _run(circuit_config_dict)
 
 
@@ -46,7 +52,9 @@ def _run(circuit_config_dict):
 
 
     t = TemplateClass(UserCircuit, simulator, signal_manager, extras)
-    checkpoint = Checkpoint(t, 'checkpoint_folder')
+    run_options = dict(circuit_config_dict.get('run_options', None) or {})
+    checkpoint_format = run_options.pop('checkpoint_format', 'npy')
+    checkpoint = Checkpoint(t, 'checkpoint_folder', checkpoint_format)
 
     # TODO figure out UI for saving and loading
     #checkpoint.save(t, 'pickletest4.json')
@@ -62,7 +70,7 @@ def _run(circuit_config_dict):
 
 
 
-    params_by_mode = t.go(checkpoint)
+    params_by_mode = t.go(checkpoint, **run_options)
 
     for mode, results in params_by_mode.items():
         print('For mode', mode)
@@ -86,6 +94,8 @@ def _run(circuit_config_dict):
         if not os.path.exists(dir_clean):
             os.makedirs(dir_clean)
 
+        # mgenero pulls in DaVE, so only import it when it's used
+        import fixture.mgenero_interface as mgenero_interface
         mgenero_interface.create_all(t, mgenero_params, params_by_mode)
 
 
@@ -1,20 +1,30 @@
 import math
-import itertools
 import random
+import numpy as np
 from fixture.signals import SignalIn, SignalArray
 random.seed(4)
 
 class Sampler:
+    rng = np.random.default_rng(4)
+
     @classmethod
     def rand(cls):
         return random.random()
 
     @classmethod
-    def get_samples(cls, dims, N):
+    def get_samples(cls, dims, N, rng=None):
         # return a dictionary where keys are SignalIn (each SignalArray in dims
         # will be broken out) and values are length N lists of scaled samples
 
-        samples = cls.get_orthogonal_samples(len(dims), N)
+        samples = cls.get_orthogonal_samples(len(dims), N, rng)
+        return cls.convert_samples(dims, samples, rng)
+
+    @classmethod
+    def convert_samples(cls, dims, samples, rng=None):
+        # turn an NxD array of samples on [0, 1) into the dictionary
+        # described in get_samples
+        samples = np.asarray(samples).reshape(-1, len(dims))
+        N = len(samples)
         samples_dict = {}
         for i, dim in enumerate(dims):
             if isinstance(dim, SignalArray):
@@ -25,15 +35,13 @@ class Sampler:
                     # to evenly distributed thermometer codes, BUT don't turn
                     # them on in order like we do for thermometer
                     assert len(dim.shape) == 1
-                    samples_this_dim = [samples[j][i] for j in range(N)]
-                    data = cls.convert_qa_therm_random(samples_this_dim, dim.shape[0])
+                    data = cls.convert_qa_therm_random(samples[:, i], dim.shape[0], rng)
                     for j, s in enumerate(dim):
-                        samples_this_bit = [data[k][j] for k in range(N)]
-                        samples_dict[s] = samples_this_bit
+                        samples_dict[s] = data[:, j].tolist()
 
                 elif bus_type == 'thermometer':
                     assert len(dim.shape) == 1
-                    samples_this_dim = [samples[j][i] for j in range(N)]
+                    samples_this_dim = samples[:, i].tolist()
                     data = cls.convert_qa_therm(samples_this_dim, dim.shape[0])
                     for j, s in enumerate(dim):
                         samples_this_bit = [data[k][j] for k in range(N)]
@@ -43,7 +51,7 @@ class Sampler:
                     # TODO could probably make this a little better
                     # For now, do nothing special, although we could try to
                     # balance the number of 1s and 0s on a particular bit, etc.
-                    samples_this_dim = [samples[j][i] for j in range(N)]
+                    samples_this_dim = samples[:, i].tolist()
                     data = cls.convert_qa_binary(samples_this_dim, dim.shape[0])
                     for j, s in enumerate(dim):
                         samples_this_bit = [data[k][j] for k in range(N)]
@@ -56,101 +64,99 @@ class Sampler:
                 assert dim.type_ in ['analog', 'real']
                 assert isinstance(dim.value, tuple) and len(dim.value) == 2
                 lims = dim.value
-                xs = []
-                for j in range(N):
-                    xs.append(lims[0] + samples[j][i]*(lims[1]-lims[0]))
-                samples_dict[dim] = xs
+                xs = lims[0] + samples[:, i]*(lims[1]-lims[0])
+                samples_dict[dim] = xs.tolist()
 
         return samples_dict
 
+    @staticmethod
+    def regions_per_dim(D, N):
+        # largest rpd with rpd^D <= N, without trusting floating point roots
+        if D == 0:
+            return 0
+        rpd = int(round(N ** (1 / D)))
+        while rpd ** D > N:
+            rpd -= 1
+        while (rpd + 1) ** D <= N:
+            rpd += 1
+        return rpd
+
     @classmethod
-    def get_orthogonal_samples(cls, D, N):
+    def get_orthogonal_samples(cls, D, N, rng=None):
         '''
         :param D: Number of true analog dimensions
         :param N: Number of samples
+        :param rng: numpy.random.Generator, default is the class's seeded one
         :return: NxD array of samples, every entry between 0 and 1
         Does Latin Hypercube Sampling and Orthogonal sampling
         '''
+        if rng is None:
+            rng = cls.rng
+        if D == 0:
+            return np.zeros((N, 0))
 
-        points = []
-        # untaken rows and columns for LHS
-        available = [set(range(N)) for _ in range(D)]
-
-        # choose a point on [0,1) while respecting and updating available
-        def choose_without_regions(dim):
-            choice = int(cls.rand() * len(available[dim]))
-            row = list(available[dim])[choice]
-            available[dim].remove(row)
-            p = (row + cls.rand())/N
-            return p
-
-
-        # now break the analog space into regions
+        # break the analog space into regions
         # each analog dimension is broken into rpd spaces
         # stands for "regions per (true analog) dimension"
-        rpd = 0 if D == 0 else int(math.pow(N, 1/D))
-
-        # equivalent to D nested for loops
-        # Total number of iterations is rpd^D <= N
-        for region_coords in itertools.product(range(rpd), repeat=D):
-            # choose a random point within the region
-            point = []
-            for dim, rc in enumerate(region_coords): # D
-                # what sections of this region are still available?
-                avail = []
-                length = 0
-                # start and end of this region in this dimension, entire dim is [0,1)
-                start = rc / rpd
-                end = (rc+1)/ rpd
-                # snap region divisions to nearest row division
-                # Be careful! I thought this wan't necessary, but in some cases the greedy
-                # approach doesn't find a solution if you don't do this
-                start = round(start*N)/N
-                end = round(end*N)/N
-                # loop through every row overlapping this region
-                for row in range(math.floor(start*N), math.ceil(end*N)): # N/rpd <= N
-                    if row in available[dim]:
-                        #assert max(start, row/N) == row/N
-                        #assert min(end, (row+1)/N) == (row+1)/N
-                        segment = (max(start, row/N), min(end, (row+1)/N))
-                        avail.append((row, segment))
-                        length += segment[1] - segment[0]
-
-                if avail == []:
-                    print('\n'.join(str(x) for x in points)) 
-                    print('avail', avail, length)
-                    print(available[dim], start, end)
-                    assert False, 'bug in sampler.py'
-
-                # we want to randomly choose a point in theis region in the
-                # space still in "available", which keeps track of LHS
-                rand_in_avail = cls.rand() * length
-                for row, segment in avail:
-                    l = segment[1] - segment[0]
-                    if rand_in_avail < l:
-                        # rand_in_avail falls in this segment
-                        point.append(segment[0] + rand_in_avail)
-                        assert (row/N) <= point[-1] < ((row+1)/N), 'point not in row!' # noqa
-                        available[dim].remove(row)
-                        break
-                    rand_in_avail -= l
-                else:
-                    # else after a for loop runs iff no break happened
-                    assert False, 'rand_in_avail not within avail! bug in sampler.py' # noqa
-
-            points.append(point)
-
-        # now we have one point in each region, but we need to fill out the rest
-        for _ in range(N - len(points)):
-            point = []
-            for dim in range(D):
-                p = choose_without_regions(dim)
-                point.append(p)
-
-            points.append(point)
-
+        rpd = cls.regions_per_dim(D, N)
+        # one point goes in each of the rpd^D regions, in the same order as
+        # itertools.product would give, and the rest are extra points
+        region_coords = np.indices((rpd,)*D).reshape(D, -1).T
+        num_regions = len(region_coords)
+        per_band = num_regions // rpd
+
+        # snap region divisions to the nearest row division so every row is
+        # entirely inside one region
+        # Be careful! I thought this wan't necessary, but in some cases you
+        # can't find a solution if you don't do this
+        edges = np.round(np.arange(rpd + 1) * N / rpd).astype(int)
+        band_of_row = np.searchsorted(edges, np.arange(N), side='right') - 1
+
+        rows = np.empty((N, D), dtype=int)
+        for dim in range(D):
+            # shuffle rows within each band, then the first per_band rows of
+            # a band go to the regions in that band and the leftovers go to
+            # the extra points, so every row is used exactly once (LHS)
+            order = np.lexsort((rng.random(N), band_of_row))
+            rank = np.arange(N) - edges[band_of_row[order]]
+            region_rows = order[rank < per_band]
+            leftover_rows = rng.permutation(order[rank >= per_band])
+
+            region_order = np.argsort(region_coords[:, dim], kind='stable')
+            rows[region_order, dim] = region_rows
+            rows[num_regions:, dim] = leftover_rows
+
+        points = (rows + rng.random((N, D))) / N
         return points
 
+    @classmethod
+    def extend_orthogonal_samples(cls, samples, M, rng=None):
+        '''
+        :param samples: existing NxD LHS samples
+        :param M: total number of samples wanted, must be a multiple of N
+        :param rng: numpy.random.Generator, default is the class's seeded one
+        :return: (M-N)xD array of new samples
+        The old and new samples together are an LHS design with M rows. Each
+        old row splits into M/N new rows and the old point is in one of them,
+        so the new points just fill in the rows that are still empty. The new
+        points are not spread over orthogonal regions like the first batch.
+        When M = 2N, the new points are an LHS design with N rows on their own
+        '''
+        if rng is None:
+            rng = cls.rng
+        samples = np.asarray(samples)
+        N, D = samples.shape
+        assert M % N == 0, f'Can only extend {N} LHS samples to a multiple of {N}, not {M}'
+
+        new_points = np.empty((M - N, D))
+        for dim in range(D):
+            taken = np.zeros(M, dtype=bool)
+            taken[np.floor(samples[:, dim] * M).astype(int)] = True
+            assert taken.sum() == N, 'Samples to extend are not an LHS design'
+            rows = rng.permutation(np.flatnonzero(~taken))
+            new_points[:, dim] = (rows + rng.random(M - N)) / M
+        return new_points
+
     @classmethod
     def convert_qa_therm(self, samples, num_bits):
         '''
@@ -179,81 +185,80 @@ class Sampler:
         data = [choose_thermometer(x) for x in samples]
         return data
 
+    @staticmethod
+    def _rank_in_group(groups):
+        # for each entry, how many earlier entries are in the same group
+        order = np.argsort(groups, kind='stable')
+        sorted_groups = groups[order]
+        starts = np.searchsorted(sorted_groups, sorted_groups, side='left')
+        ranks = np.empty(len(groups), dtype=int)
+        ranks[order] = np.arange(len(groups)) - starts
+        return ranks
+
     @classmethod
-    def convert_qa_therm_random(self, samples, num_bits):
+    def convert_qa_therm_random(cls, samples, num_bits, rng=None):
         '''
         :param samples:
         :param num_bits:
-        :return:
+        :param rng: numpy.random.Generator, default is the class's seeded one
+        :return: N x num_bits uint8 array
         We want to turn 0.23432 in to a thermometer code like 00101000, where
         the 1s are randomly distributed throughout the code.
         We are actually picky about the total number of 0s and 1s being the
         same, so we choose the number of ones based on the "row" of LHS the
         random number is in, rather than basing it on the random number itself.
         '''
+        if rng is None:
+            rng = cls.rng
+        samples = np.asarray(samples, dtype=float)
         N = len(samples)
 
-        def choose_thermometer(x):
-            row = int(x * N)
-            eps = 1e-8
-            # because we want to round equally on either side
-            # of the center, we stretch by (1+eps) to avoid
-            # things coinciding exactly
-            # therm = int((row+.5)/N * (nb+1))
-            num_ones = int((((row + .5) / N - .5) * (1 + eps) + 0.5) * (num_bits + 1))
-            ones = random.sample(range(num_bits), num_ones)
-            dig = [1 if i in ones else 0 for i in range(num_bits)]
-            return dig
+        row = (samples * N).astype(int)
+        eps = 1e-8
+        # because we want to round equally on either side
+        # of the center, we stretch by (1+eps) to avoid
+        # things coinciding exactly
+        num_ones = ((((row + .5) / N - .5) * (1 + eps) + 0.5) * (num_bits + 1)).astype(int)
 
-        data = [choose_thermometer(x) for x in samples]
-        data_T = list(zip(*data))
+        # turn on a random subset of num_ones bits in each point
+        keys = rng.random((N, num_bits))
+        bit_rank = np.argsort(np.argsort(keys, axis=1), axis=1)
+        data = (bit_rank < num_ones[:, None]).astype(np.uint8)
 
         # now we do some special adjustment to the digital bits so that each
         # bit always has the same number of 0s and 1s
-        errors = [sum(column) - N/2 for column in data_T]
-        assert abs(sum(errors)) < 0.501
+        # when the total can't be split evenly, the bits that are already
+        # highest get the extra 1s
+        total = int(num_ones.sum())
+        assert abs(total - num_bits*N/2) < 0.501
+        counts = data.sum(axis=0).astype(int)
+        target = np.full(num_bits, total // num_bits)
+        highest = np.lexsort((rng.random(num_bits), -counts))
+        target[highest[:total % num_bits]] += 1
+        errors = counts - target
 
         # the general strategy is to swap elements within one point, so the bit
-        # count of a point never changes but errors decrease
-        def bit_perm():
-            xs = list(range(num_bits))
-            random.shuffle(xs)
-            return xs
-
-        def get_swappable(i, over):
-            # in point i, find a zero that could be a one or vice versa
-            # return the j or None, and False iff this isn't necessary
-            # the "necessary" thing is important when N is odd
-            value_search = 1 if over else 0
-            for j in bit_perm():
-                if (((errors[j] > 0.75) if over else (errors[j] < -0.75))
-                        and data[i][j] == value_search):
-                    return j, True
-            for j in bit_perm():
-                if (((errors[j] > 0.25) if over else (errors[j] < -0.25))
-                        and data[i][j] == value_search):
-                    return j, False
-            return None, False
-
-        options = list(range(N))
-        while len(options) > 0:
-            opt_choice = random.randint(0, len(options)-1)
-            i = options[opt_choice]
-
-            over, over_necessary = get_swappable(i, True)
-            under, under_necessary = get_swappable(i, False)
-
-            if (over is None or under is None
-                    or (not (over_necessary or under_necessary))):
-                # nothing useful at this i
-                options.pop(opt_choice)
-                continue
-
-            # swap over and under
-            data[i][over] = 0
-            data[i][under] = 1
-            errors[over] -= 1
-            errors[under] += 1
+        # count of a point never changes but errors decrease. Each pass picks
+        # one random (over, under) pair in every point that has one and
+        # accepts as many as the errors allow
+        while np.any(errors != 0):
+            over_mask = (data == 1) & (errors > 0)[None, :]
+            under_mask = (data == 0) & (errors < 0)[None, :]
+            over = np.where(over_mask, rng.random((N, num_bits)), -1).argmax(axis=1)
+            under = np.where(under_mask, rng.random((N, num_bits)), -1).argmax(axis=1)
+            points = np.flatnonzero(over_mask.any(axis=1) & under_mask.any(axis=1))
+            assert len(points) > 0, 'no swaps available, bug in sampler.py'
+
+            points = rng.permutation(points)
+            over, under = over[points], under[points]
+            accept = ((cls._rank_in_group(over) < errors[over])
+                      & (cls._rank_in_group(under) < -errors[under]))
+            points, over, under = points[accept], over[accept], under[accept]
+
+            data[points, over] = 0
+            data[points, under] = 1
+            errors -= np.bincount(over, minlength=num_bits)
+            errors += np.bincount(under, minlength=num_bits)
 
         return data
 
@@ -270,19 +275,21 @@ class Sampler:
             data.append(bits)
         return data
 
+    @staticmethod
     def assert_lhs(samples):
         #visualize([s[0:2] for s in samples])
         # print('samples', samples)
+        samples = np.asarray(samples)
         N = len(samples)
-        for dim in range(len(samples[0])):
-            for i in range(N):
-                # must be at least one sample in this interval
+        for dim in range(samples.shape[1]):
+            # must be at least one sample in each interval [i/N, (i+1)/N)
+            rows = np.floor(samples[:, dim] * N)
+            hit = np.zeros(N, dtype=bool)
+            hit[rows[(rows >= 0) & (rows < N)].astype(int)] = True
+            if not hit.all():
+                i = int(np.argmin(hit))
                 interval = (i/N, (i+1)/N)
-                for j in range(N):
-                    if interval[0] <= samples[j][dim] < interval[1]:
-                        break
-                else:
-                    assert False, f'No sample in interval {interval} in dim {dim}'
+                assert False, f'No sample in interval {interval} in dim {dim}'
 
     @staticmethod
     def assert_fifty_fifty(samples):
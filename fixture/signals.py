@@ -174,6 +174,9 @@ def parse_bus(name):
     return bus_name, indices_parsed, info_parsed, names
 
 def parse_name(name):
+    if '[' not in name and '<' not in name and '{' not in name:
+        # no braces_open, so no indices; skip the regexes
+        return name, ()
     indices = re.findall(re_index + '|' + re_index_range, name)
     bus_name = re.sub(re_index + '|' + re_index_range, '', name)
     indices_parsed = []
@@ -0,0 +1,120 @@
+import hashlib
+import inspect
+import os
+import re
+import numpy as np
+
+
+class SimCache:
+    '''
+    Content-addressed cache of simulation run directories, kept under the
+    checkpoint folder. The key covers everything that goes into a
+    simulation: the netlist and model files, the simulator config, the
+    test's input vectors and testbench code, and the template extras.
+    If an entry with the same key already finished, the simulation can be
+    skipped and fault can read the old results with no_run=True
+    '''
+    done_marker = 'sim_done'
+
+    def __init__(self, checkpoint_folder, template):
+        self.folder = os.path.join(checkpoint_folder, 'sim_cache')
+        self.template = template
+        self.hits = {}
+        self.misses = {}
+        self._circuit_hash = None
+
+    # .include file, .inc file, .lib file section
+    include_re = re.compile(r'^\s*\.(?:include|inc|lib)\s+[\'"]?([^\'"\s]+)[\'"]?',
+                            re.IGNORECASE | re.MULTILINE)
+
+    @classmethod
+    def _hash_file(cls, h, path, seen=None):
+        '''
+        Hash a netlist or model file, and every file it pulls in with
+        .include or .lib, recursively. Relative paths are relative to the
+        file that includes them. ".lib section" lines that only name a
+        section don't point to a file, so anything that doesn't exist is
+        skipped
+        '''
+        seen = set() if seen is None else seen
+        path = os.path.abspath(path)
+        if path in seen:
+            return
+        seen.add(path)
+        h.update(str(path).encode())
+        if not os.path.isfile(path):
+            return
+        with open(path, 'rb') as f:
+            contents = f.read()
+        h.update(contents)
+        text = contents.decode(errors='ignore')
+        for included in cls.include_re.findall(text):
+            included = os.path.join(os.path.dirname(path), os.path.expanduser(included))
+            if os.path.isfile(included):
+                cls._hash_file(h, included, seen)
+
+    def circuit_hash(self):
+        # the same for every test, so only read the netlist files once
+        if self._circuit_hash is None:
+            simulator = self.template.simulator
+            h = hashlib.sha256()
+            sim_dict = simulator.simulator_dict
+            for k in sorted(sim_dict):
+                h.update(f'{k}={sim_dict[k]!r};'.encode())
+            for k in ['target', 'simulator']:
+                h.update(f'{k}={simulator.test_config_dict.get(k)!r};'.encode())
+            seen = set()
+            for k in ['model_paths', 'ext_libs']:
+                for path in sim_dict.get(k, []):
+                    self._hash_file(h, path, seen)
+            extras = self.template.extras
+            for k in sorted(extras, key=str):
+                h.update(f'{k}={extras[k]!r};'.encode())
+            self._circuit_hash = h.hexdigest()
+        return self._circuit_hash
+
+    def get_key(self, test, test_vectors, shard=None):
+        h = hashlib.sha256()
+        h.update(self.circuit_hash().encode())
+        h.update(str(test).encode())
+        try:
+            h.update(inspect.getsource(type(test)).encode())
+        except (OSError, TypeError):
+            # no source available, so changes to the test can't be detected
+            pass
+        h.update(repr([str(s) for s in test.signals.flat()]).encode())
+
+        sample_indices = None if shard is None else shard[1]
+        for k in sorted(test_vectors.keys(), key=str):
+            # tolist so numpy scalars from a loaded checkpoint hash the same
+            # as the plain python values from a fresh one
+            column = np.asarray(test_vectors[k]).tolist()
+            if sample_indices is not None:
+                column = [column[i] for i in sample_indices]
+            h.update(f'{k}={column!r};'.encode())
+        h.update(repr(sample_indices).encode())
+        modes = None if shard is None else shard[2]
+        if modes is not None:
+            h.update(repr([tuple(m) for m in modes]).encode())
+        return h.hexdigest()
+
+    def run_dir(self, key):
+        return os.path.join(self.folder, key)
+
+    def is_done(self, key):
+        return os.path.exists(os.path.join(self.run_dir(key), self.done_marker))
+
+    def mark_done(self, key):
+        with open(os.path.join(self.run_dir(key), self.done_marker), 'w') as f:
+            f.write(key)
+
+    def record(self, test, hit):
+        counts = self.hits if hit else self.misses
+        counts[str(test)] = counts.get(str(test), 0) + 1
+
+    def report(self):
+        print('Simulation cache results:')
+        for test in self.template.tests:
+            hits = self.hits.get(str(test), 0)
+            misses = self.misses.get(str(test), 0)
+            print(f'\t{test}\thits: {hits}\tmisses: {misses}')
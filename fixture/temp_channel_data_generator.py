@@ -1,10 +1,7 @@
 #from dragonphy import *
 import math
 
-from dragonphy import Channel
 import numpy as np
-from scipy import linalg
-import matplotlib.pyplot as plt
 
 ##THIS_DIR = Path(__file__).resolve().parent
 #sparam_file_list = ["Case4_FM_13SI_20_T_D13_L6.s4p",
@@ -19,6 +16,10 @@ import matplotlib.pyplot as plt
 class ChannelUtil:
     @staticmethod
     def get_channel_data(file_path, bit_freq, sample_freq_desired, total_time, debug=False):
+        # dragonphy is only needed for channel tests, so don't require it
+        # just to import fixture
+        from dragonphy import Channel
+        import matplotlib.pyplot as plt
         samples_per_bit = math.ceil(sample_freq_desired / bit_freq)
         sample_freq = bit_freq * samples_per_bit
 
@@ -68,6 +68,65 @@ def extract_pzs(nps, nzs, x, y):
     return (pad(ps, nps), pad(zs, nzs))
 
 
+def _extract_pzs_star(args):
+    return extract_pzs(*args)
+
+def extract_pzs_batch(nps, nzs, waveforms, num_points=None, num_workers=None):
+    '''
+    extract_pzs for a list of (x, y) step responses at once.
+    When they all cover the same time span, they are resampled onto one
+    shared grid (num_points long, default the longest input) and fit
+    together. Otherwise each is fit separately, in num_workers processes.
+    Returns arrays ps (len(waveforms), nps) and zs (len(waveforms), nzs),
+    one column per pole/zero, padded with inf the same way as extract_pzs
+    '''
+    waveforms = [(np.asarray(x, dtype=float), np.asarray(y, dtype=float))
+                 for x, y in waveforms]
+    ps = np.full((len(waveforms), nps), float('inf'))
+    zs = np.full((len(waveforms), nzs), float('inf'))
+    # constant y only gives one datapoint; leave those rows as inf
+    rows = [i for i, (x, y) in enumerate(waveforms) if len(x) > 1]
+    if len(rows) == 0:
+        return ps, zs
+
+    starts = np.array([waveforms[i][0][0] for i in rows])
+    ends = np.array([waveforms[i][0][-1] for i in rows])
+    span = ends.max() - starts.min()
+    shared = (np.allclose(starts, starts[0], rtol=0, atol=1e-6*span)
+              and np.allclose(ends, ends[0], rtol=0, atol=1e-6*span))
+
+    if not shared:
+        args = [(nps, nzs, *waveforms[i]) for i in rows]
+        if num_workers is None or num_workers <= 1:
+            results = map(_extract_pzs_star, args)
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=num_workers) as executor:
+                results = list(executor.map(_extract_pzs_star, args))
+        for i, (p, z) in zip(rows, results):
+            ps[i], zs[i] = p, z
+        return ps, zs
+
+    if num_points is None:
+        num_points = max(len(waveforms[i][0]) for i in rows)
+    grid = np.linspace(starts[0], ends[0], num_points)
+    h_steps = np.array([np.interp(grid, *waveforms[i]) for i in rows])
+
+    ma = modal_analysis.ModalAnalysis(grid, h_steps)
+    # step response definitely has a pole at zero
+    ps_step, zs_batch = ma.extract_pzs_batch(nps+1, nzs, [0])
+    assert np.all(ps_step[:, 0] == 0)
+    ps_batch = np.abs(ps_step[:, 1:] / (2*np.pi))
+    zs_batch = np.abs(zs_batch / (2*np.pi))
+
+    # same as pad() in extract_pzs
+    if ps_batch.shape[1] > nps:
+        ps_batch = np.sort(ps_batch, axis=1)[:, :nps]
+    ps[rows, :ps_batch.shape[1]] = ps_batch
+    zs[rows] = zs_batch
+    return ps, zs
+
+
 def dynamic(template):
     # NOTE: the only reason I inherit directly from TemplateMaster
     # here is because I check whether a class is a template by checking
@@ -172,109 +231,71 @@ def plot(xs, ys):
 '''
 
 
-def make_nondecreasing(ys):
+def make_nondecreasing(ys, weights=None, decreasing=False):
     '''
-    Given a list of y values, give a new list of y values that is nondecreasing
-    such that the MSE between the two lists is minimized
+    Given a list of y values, give a new array of y values that is nondecreasing
+    such that the (weighted) MSE between the two is minimized.
+    With decreasing=True the result is nonincreasing instead.
+    Pool adjacent violators: keep a stack of blocks, each set to the average
+    of its points, and merge the newest block into the one before it while
+    they are out of order. Every point is merged at most once, so it's O(n)
     '''
-    ys = [float(y) for y in ys]
-    new_ys = [ys[0]]
-    for i in range(1, len(ys)):
-        y = ys[i]
-        new_ys.append(y)
-        if new_ys[-1] < new_ys[-2]:
-            # do some approximating
-            # The best thing to do is to take the previous n points and set
-            # them equal to their collective average, for some n
-            cum_sum = y
-            count = 1
-            error_added_best = float('inf')
-            avg_prev = None
-            j = i
-            while j > 0:
-                j -= 1
-                cum_sum += ys[j]
-                count += 1
-                avg = cum_sum / count
-                # this time through the loop, we are proposing to set all
-                # new_ys[j:i+1] equal to avg (that's j to i, inclusive)
-                if j>0 and avg < new_ys[j-1]:
-                    # this is illegal because it would be decreasing
-                    continue
-                error_added = 0
-                # loop over all indices we propose to change
-                for k in range(j, i+1):
-                    error_added += (ys[k] - avg)**2 - (ys[k]-new_ys[k])**2
-                if error_added >= error_added_best:
-                    # we've gone too far! quit now and use our current best
-                    break
-                error_added_best = error_added
-                avg_best = avg
-                j_best = j
-
-            # now that we're out of the loop, we have the j and avg we want
-            for k in range(j_best, i+1):
-                new_ys[k] = avg_best
+    ys = np.asarray(ys, dtype=float)
+    if decreasing:
+        return -make_nondecreasing(-ys, weights)
+    if weights is None:
+        weights = np.ones(len(ys))
+    weights = np.asarray(weights, dtype=float)
 
-    '''
-    import matplotlib.pyplot as plt
-    xs = list(range(len(ys)))
-    plt.plot(xs, ys, '+')
-    plt.plot(xs, new_ys, '--')
-    plt.grid()
-    plt.show()
-    '''
+    means, totals, counts = [], [], []
+    for y, w in zip(ys.tolist(), weights.tolist()):
+        count = 1
+        while means and means[-1] > y:
+            prev_mean, prev_total = means.pop(), totals.pop()
+            y = (prev_mean*prev_total + y*w) / (prev_total + w)
+            w += prev_total
+            count += counts.pop()
+        means.append(y)
+        totals.append(w)
+        counts.append(count)
 
-    return new_ys
+    return np.repeat(means, counts)
 
 
 
 def invert_function(xs, ys):
     #ys = [float(y) + random.random()*0.02 for y in ys]
-    xs = [float(x) for x in xs]
+    xs = np.asarray(xs, dtype=float)
+    ys = np.asarray(ys, dtype=float)
     #xs = list(range(len(xs)))
-    #TODO: this is broken for decreasing things
-    if ys[0] > ys[-1]:
-        temp = [-y for y in ys]
-        temp2 = make_nondecreasing(temp)
-        ys_up = [-y for y in temp2]
-    else:
-        ys_up = make_nondecreasing(ys)
-    
-    new_xs = [xs[0]]
-    new_ys = [ys_up[0]]
+    # a decreasing function is the increasing function -ys, flipped at the end
+    decreasing = ys[0] > ys[-1]
+    if decreasing:
+        ys = -ys
+    ys_up = make_nondecreasing(ys)
+
+    # look for flat regions in the interior points i
     float_eps = (ys_up[-1] - ys_up[0])*1e-10 # 1e-10
-    for i in range(1, len(xs)-1):
-        # look for flat regions
-        # start
-        if ys_up[i-1] < ys_up[i] - float_eps:
-            if ys_up[i] < ys_up[i+1] - float_eps:
-                # normal
-                new_xs.append(xs[i])
-                new_ys.append(ys_up[i])
-                #print('normal', i)
-            else:
-                # start of flat region
-                frac = (ys_up[i] - ys[i-1]) / (ys[i] - ys[i-1])
-                new_x = xs[i-1] + frac * (xs[i] - xs[i-1])
-                new_xs.append(new_x)
-                new_ys.append(ys_up[i])
-                #print('start of flat', i, frac, xs[i-1:i+2], new_x)
-        else:
-            if ys_up[i] < ys_up[i+1] - float_eps:
-                # end of flat region
-                frac = (ys_up[i] - ys[i]) / (ys[i+1] - ys[i])
-                new_x = xs[i] + frac * (xs[i+1] - xs[i])
-                new_xs.append(new_x)
-                new_ys.append(ys_up[i])
-                #print('end of flat', i, frac, xs[i-1:i+2], new_x)
-            else:
-                # middle of flat region - no points necessary
-                #print('middle of flat', i)
-                pass
-
-    new_xs.append(xs[-1])
-    new_ys.append(ys_up[-1])
+    i = np.arange(1, len(xs)-1)
+    rising_before = ys_up[i-1] < ys_up[i] - float_eps
+    rising_after = ys_up[i] < ys_up[i+1] - float_eps
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # start of flat region: where the data crosses the flat value on the way in
+        frac_start = (ys_up[i] - ys[i-1]) / (ys[i] - ys[i-1])
+        x_start = xs[i-1] + frac_start * (xs[i] - xs[i-1])
+        # end of flat region: same, on the way out
+        frac_end = (ys_up[i] - ys[i]) / (ys[i+1] - ys[i])
+        x_end = xs[i] + frac_end * (xs[i+1] - xs[i])
+    # middle of flat region - no points necessary
+    keep = rising_before | rising_after
+    interior_xs = np.select([rising_before & rising_after, rising_before],
+                            [xs[i], x_start], x_end)
+
+    new_xs = np.concatenate(([xs[0]], interior_xs[keep], [xs[-1]]))
+    new_ys = np.concatenate(([ys_up[0]], ys_up[i][keep], [ys_up[-1]]))
+    if decreasing:
+        new_xs = new_xs[::-1]
+        new_ys = -new_ys[::-1]
 
     #import matplotlib.pyplot as plt
     #plt.figure()
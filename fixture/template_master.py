@@ -1,12 +1,27 @@
+import contextlib
+import os
 import fault
+import numpy as np
 from abc import ABC, abstractmethod
 import fixture
 from fixture import Tester, Regression
 from fixture.signals import SignalManager, SignalArray, SignalOut, SignalIn
-from fixture.plot_helper import PlotHelper
+from fixture.parallel import SimulationPool, PlotPool
+from fixture.sim_cache import SimCache
+from fixture.ngspice_session import SessionPool
+from fixture.mode_plan import ModePlan
+from fixture.parameter_algebra import ParameterAlgebra
+from fixture.profiling import StageProfiler
+from fixture.incremental import StageTracker
+from fixture.waveform import Waveform
 
 class TemplateMaster():
     debug = False
+    sim_cache = None
+    raw_reader = False
+    sim_sessions = 0
+    profiler = None
+    plots = 'full'
 
     class Ports:
         def __init__(self, signal_manager):
@@ -90,6 +105,9 @@ class TemplateMaster():
         # TODO perhaps put an init method that checks some parameter algebra
         # has been specified
         input_vector_mapping = {}
+        # (mode, sample index) of the row analysis() is working on, for tests
+        # that keep something from each row to use in post_regression
+        analysis_key = None
 
         def __init__(self, template):
             self.template = template
@@ -111,40 +129,12 @@ class TemplateMaster():
             # Duplicate equations for vectored outputs
             # Put everything in "sum of products" form, i.e. dict of tuples
             #self.parameter_algebra_vectored = {k: v.copy() for k, v in self.parameter_algebra.items()}
-            pa_vec = {}
-            ones = ['1', Regression.one_literal]
-
-            def read_algebra(algebra_string):
-                # first, multiplication
-                s = algebra_string.replace('**', '^')
-                factors = s.split('*')
-                ans = []
-                for f in factors:
-                    # now, powers
-                    power_split = f.split('^')
-                    if len(power_split) == 1:
-                        ans.append(f)
-                    elif len(power_split) == 2:
-                        power = [power_split[0]]*int(power_split[1])
-                        ans += power
-                    else:
-                        assert False, f'Double power in {algebra_string}?'
-                return tuple(ans)
-
-
-            # Copy and Interpret algebra in string
-            for lhs, rhs in self.parameter_algebra.items():
-                pa_vec[lhs] = {}
-                for param, term in rhs.items():
-                    if isinstance(term, str):
-                        term_exp = read_algebra(term)
-                        pa_vec[lhs][param] = term_exp
-                    else:
-                        pa_vec[lhs][param] = term
+            # parsing is shared by every instance with the same algebra
+            algebra = ParameterAlgebra.compile(self.parameter_algebra, type(self))
 
             def convert_string(string):
                 # string to object
-                if string in ones:
+                if string == Regression.one_literal:
                     return Regression.one_literal
                 try:
                     factor_obj = self.signals.from_template_name(string)
@@ -155,53 +145,46 @@ class TemplateMaster():
                     assert string not in self.template.required_ports, 'Unexpected case'
                     return string
 
-
-            # convert to objects
-            for lhs, rhs in pa_vec.items():
-                for param, term in rhs.items():
-                    # if the top level was a string, we still want it to be a
-                    if isinstance(term, tuple):
-                        term_objs = tuple(convert_string(s) for s in term)
-                        pa_vec[lhs][param] = term_objs
-                    else:
-                        term_obj = convert_string(term)
-                        pa_vec[lhs][param] = (term_obj,)
+            equations = algebra.bind(convert_string)
 
             # vector inputs
-            # we do this in multiple passes in case there are products
-            # of multiple vectored objects
-            # first collect things to vector
+            # collect things to vector, in the order they first appear
             vectored_inputs = {}
-            for lhs, rhs in pa_vec.items():
-                for param, term in rhs.items():
-                    for component in term:
-                        if isinstance(component, SignalArray):
-                            # vector this one
-                            vectored_inputs[component] = list(component)
-                        elif component in self.input_vector_mapping:
-                            parent_input = self.signals.from_template_name(self.input_vector_mapping[component])
-                            if isinstance(parent_input, SignalArray):
-                                num = parent_input.shape[0]
-                                vec_version = [Regression.vector_input_name(component, i) for i in range(num)]
-                                vectored_inputs[component] = vec_version
-            # now vector them one at a time
-            for vectored_input, components in vectored_inputs.items():
-                for lhs, rhs in pa_vec.items():
-                    to_remove = []
-                    to_add = {}
-                    for param, term in rhs.items():
+            for component in {f: None for terms in equations.values()
+                              for _, term in terms for f in term}:
+                if isinstance(component, SignalArray):
+                    # vector this one
+                    vectored_inputs[component] = list(component)
+                elif component in self.input_vector_mapping:
+                    parent_input = self.signals.from_template_name(self.input_vector_mapping[component])
+                    if isinstance(parent_input, SignalArray):
+                        num = parent_input.shape[0]
+                        vec_version = [Regression.vector_input_name(component, i) for i in range(num)]
+                        vectored_inputs[component] = vec_version
+
+            # Each term becomes one term per combination of components of
+            # the vectored inputs in it. Terms are ordered as if each
+            # vectored input was expanded in its own pass that moved the
+            # terms it touched to the end, which is how this used to work
+            passes_last_first = list(vectored_inputs)[::-1]
+            pa_vec = {}
+            for lhs, terms in equations.items():
+                if len(vectored_inputs) == 0:
+                    pa_vec[lhs] = dict(terms)
+                    continue
+                expanded = []
+                for param, term in terms:
+                    subs = [(param, term)]
+                    for vectored_input, components in vectored_inputs.items():
                         if vectored_input in term:
-                            to_remove.append(param)
-                            for vec_i, sub in enumerate(components):
-                                term_subbed = tuple((sub if x == vectored_input else x)
-                                                    for x in term)
-                                param_name = Regression.vector_parameter_name_input(param, vec_i, component)
-                                # TODO is template_name the best choice here?
-                                to_add[param_name] = term_subbed
-                    for r in to_remove:
-                        del pa_vec[lhs][r]
-                    for a in to_add:
-                        pa_vec[lhs][a] = to_add[a]
+                            subs = [(Regression.vector_parameter_name_input(p, vec_i, sub),
+                                     tuple((sub if x == vectored_input else x) for x in t))
+                                    for p, t in subs
+                                    for vec_i, sub in enumerate(components)]
+                    order = tuple(v in term for v in passes_last_first)
+                    expanded.append((order, subs))
+                expanded.sort(key=lambda e: e[0])
+                pa_vec[lhs] = {p: t for _, subs in expanded for p, t in subs}
 
             # vector outputs
             vectored_outputs = self.template.signals.vectored_out()
@@ -293,7 +276,11 @@ class TemplateMaster():
             This method will be overridden when the @debug decorator from
             template_creation_utils is added. Unfortunately this means this
             input signature has to match
+            Nothing is read unless the template has debug on, since these
+            are long block reads that only debug_plot looks at
             '''
+            if not self.template.debug:
+                return
             if isinstance(signal, SignalArray):
                 for signal in signal:
                     self.debug(tester, signal, duration)
@@ -303,6 +290,8 @@ class TemplateMaster():
                                                    'duration': duration})
                 self.debug_dict[signal] = r
 
+        debug_plot_points = 100000
+
         def debug_plot(self):
             import matplotlib.pyplot as plt
             plt.figure()
@@ -310,7 +299,9 @@ class TemplateMaster():
             bump = 0
             for p, r in self.debug_dict.items():
                 leg.append(p)
-                plt.plot(r.value[0], r.value[1] + bump, '-+')
+                # long transients have far more points than the plot can show
+                t, v = Waveform.from_value(r.value).decimate(self.debug_plot_points)
+                plt.plot(t, v + bump, '-+')
                 bump += 0.0 # useful for separating clock signals
             plt.grid()
             plt.legend(leg)
@@ -321,11 +312,177 @@ class TemplateMaster():
             return s.split(' ')[0].split('.')[-1]
 
 
-    def go(self, checkpoint, checkpoint_start=0):
+    def get_shards(self, test, num_shards):
+        '''
+        Split this test into shards. When the test simulates at least
+        num_shards true_digital modes, each shard gets some of the modes and
+        all of the samples, otherwise each shard gets a contiguous chunk of
+        the samples and all of the modes.
+        Each shard is (shard_id, sample_indices, modes), with modes None for
+        all of them
+        '''
+        num_samples = getattr(test, 'num_samples', 10)
+        modes = ModePlan.from_test(self, test).sim_modes
+        if len(modes) >= num_shards:
+            chunks = np.array_split(np.arange(len(modes)), num_shards)
+            return [(shard_id, list(range(num_samples)), [modes[i] for i in chunk])
+                    for shard_id, chunk in enumerate(chunks)]
+        chunks = np.array_split(np.arange(num_samples), num_shards)
+        return [(shard_id, [int(i) for i in chunk], None)
+                for shard_id, chunk in enumerate(chunks) if len(chunk) > 0]
+
+    def profile_stage(self, test, stage):
+        # context manager around one stage of one test, see StageProfiler
+        if self.profiler is None:
+            return contextlib.nullcontext()
+        return self.profiler.stage(test, stage)
+
+    def run_testbench(self, test, checkpoint, no_run=False, shard=None):
+        '''
+        Build the fault testbench for this test and run the simulation in
+        the test's run directory. Returns the Testbench object, whose reads
+        are filled in once the simulator is done
+        shard: (shard_id, sample_indices, modes) to build a testbench with
+            only those samples and modes, in its own run directory
+        '''
+        tester = Tester(self.dut)
+        tester.raw_reader = self.raw_reader
+        tester.sim_sessions = self.sim_sessions
+        # TODO what's a good way to specify do_optional_out
+        #do_optional_out = test == self.tests[0]
+        do_optional_out = True
+
+        test_vectors = checkpoint.load_input_vectors(test)
+        shard_id, sample_indices, modes = (None, None, None) if shard is None else shard
+        with self.profile_stage(test, 'create_testbench'):
+            tb = fixture.Testbench(self, tester, test, test_vectors,
+                                   do_optional_out=do_optional_out,
+                                   sample_indices=sample_indices,
+                                   modes=modes)
+            tb.create_test_bench()
+
+        run_dir, cache_key = self.get_run_dir(test, checkpoint, shard)
+        # even if we skip the sim, we still need fault to annotate all
+        # the reads in the test bench, so we still need this call
+        with self.profile_stage(test, 'read_results' if no_run else 'simulate'):
+            self.simulator.run(tester, run_dir=run_dir, no_run=no_run)
+        if cache_key is not None and not no_run:
+            self.sim_cache.mark_done(cache_key)
+        return tb
+
+    def get_run_dir(self, test, checkpoint, shard=None):
+        '''
+        Returns (run_dir, cache_key). When the sim cache is on, the run dir
+        is the cache entry for this test (and shard), otherwise cache_key
+        is None
+        '''
+        if self.sim_cache is None:
+            shard_id = None if shard is None else shard[0]
+            return checkpoint.suggest_run_dir(test, shard=shard_id), None
+        test_vectors = checkpoint.load_input_vectors(test)
+        key = self.sim_cache.get_key(test, test_vectors, shard)
+        return self.sim_cache.run_dir(key), key
+
+    def run_adaptive(self, test, checkpoint, tol, batch_size=None, budget=None):
+        '''
+        Simulate this test in batches until the regression coefficients stop
+        changing much. The first batch is a normal orthogonal design, and each
+        batch after that doubles the number of samples while keeping the
+        whole design an LHS. Stops once Regression.converged(tol) is True for
+        every mode, or when doubling again would go over the budget
+        Returns (testbenches, results_each_mode_unprocessed, results_each_mode)
+        '''
+        if budget is None:
+            budget = getattr(test, 'num_samples', 10)
+        if batch_size is None:
+            batch_size = max(1, budget // 8)
+
+        dims = test.signals.random()
+        samples = fixture.Sampler.get_orthogonal_samples(len(dims), batch_size)
+        new_samples = samples
+        test_vectors = {}
+        tbs = []
+        results_list = []
+        while True:
+            new_vectors = fixture.Sampler.convert_samples(dims, new_samples)
+            for s, values in new_vectors.items():
+                test_vectors[s] = test_vectors.get(s, []) + values
+            checkpoint.save_input_vectors(test, test_vectors)
+
+            # each batch is simulated like a shard with only the new samples,
+            # so the test's num_samples is never needed
+            batch = (len(tbs), list(range(len(samples) - len(new_samples), len(samples))), None)
+            cached = False
+            if self.sim_cache is not None:
+                _, cache_key = self.get_run_dir(test, checkpoint, batch)
+                cached = self.sim_cache.is_done(cache_key)
+                self.sim_cache.record(test, cached)
+            tb = self.run_testbench(test, checkpoint, no_run=cached, shard=batch)
+            tbs.append(tb)
+            with self.profile_stage(test, 'get_results'):
+                results_list.append(tb.get_results())
+                results_unprocessed = fixture.Testbench.stitch_results(tbs, results_list)
+
+            with self.profile_stage(test, 'post_process'):
+                results_each_mode = tb.post_process(results_unprocessed)
+            results_with_one = results_each_mode.copy()
+            results_with_one[Regression.one_literal] = 1
+            converged = True
+            plan = ModePlan.from_test(self, test)
+            with self.profile_stage(test, 'regression'):
+                for _, results in plan.regression_groups(results_with_one):
+                    if not Regression(self, test, results, plan.factors()).converged(tol):
+                        converged = False
+                        break
+
+            print(f'Adaptive sampling for {test}: {len(samples)} samples, converged={converged}')
+            if converged or 2 * len(samples) > budget:
+                break
+            new_samples = fixture.Sampler.extend_orthogonal_samples(samples, 2 * len(samples))
+            samples = np.concatenate([samples, new_samples])
+
+        run_dir, _ = self.get_run_dir(test, checkpoint, batch)
+        checkpoint.save_run_dir(test, run_dir)
+        return tbs, results_unprocessed, results_each_mode
+
+    def go(self, checkpoint, checkpoint_start=0, num_workers=1, num_shards=1,
+           sim_cache=False, incremental=False, adaptive=False,
+           adaptive_tol=0.01, adaptive_batch=None, adaptive_budget=None,
+           raw_reader=False, sim_sessions=0, profile=False, plots='full'):
         '''
         Actually do the entire analysis of the circuit
+        num_workers: if more than 1, simulate that many tests at once in
+        separate processes
+        num_shards: if more than 1, split the samples of each test into that
+        many separate testbenches and simulate them at the same time
+        sim_cache: if True, reuse simulation results from an earlier run when
+        the netlist, simulator config, and test vectors are all unchanged
+        incremental: if True, only re-run the stages of each test whose
+        inputs changed since the last run in this checkpoint folder
+        adaptive: if True, simulate each test in batches and stop once the
+        regression coefficients' standard errors are below adaptive_tol times
+        the largest coefficient, or once the next batch would go over
+        adaptive_budget samples (default is the test's num_samples). The
+        first batch has adaptive_batch samples (default budget/8)
+        raw_reader: if True, read ngspice results by memory mapping the .raw
+        file and answering all of a testbench's reads at once
+        sim_sessions: if more than 0, keep up to that many ngspice sessions
+        open in each process and run every testbench in one of them, so the
+        netlist and models are loaded once instead of once per simulation.
+        Results are read the same way as with raw_reader
+        profile: if True, record wall time, CPU time and peak RSS for every
+        stage of every test in checkpoint_folder/profile. 'cprofile' or
+        'sample' also saves a cProfile or sampled-stack profile per stage
+        plots: 'off' for no regression plots, 'summary' for one predicted
+        vs. measured plot per lhs, or 'full' for every plot, drawn in
+        background processes from the data saved in the checkpoint folder
         '''
 
+        self.profiler = None
+        if profile:
+            self.profiler = StageProfiler(checkpoint.filepath,
+                                          None if profile is True else profile)
+
         checkpoint_controller = {str(test):
                                     {
                                         'choose_inputs': True,
@@ -382,96 +539,227 @@ class TemplateMaster():
         #    }
         #}
 
-        params_by_mode_all = {}
+        assert not (adaptive and incremental), \
+            'Adaptive sampling chooses inputs as it goes, so it cannot be incremental'
+        tracker = None
+        if incremental:
+            tracker = StageTracker(self, checkpoint, num_shards)
+
+        # choose inputs for every test up front so that simulations can
+        # start without waiting on the tests before them
         for test in self.tests:
             controller = checkpoint_controller[str(test)]
-
-            if controller['choose_inputs']:
-                test_vectors = fixture.Sampler.get_samples(
-                    test.signals.random(),
-                    getattr(test, 'num_samples', 10))
-                checkpoint.save_input_vectors(test, test_vectors)
-
-            # analysis requires a fault testbench even if we skip the actual
-            # sim, so the checkpoint logic is not as straightforward here
-            if controller['run_sim'] or controller['run_analysis']:
-                tester = Tester(self.dut)
-                # TODO what's a good way to specify do_optional_out
-                #do_optional_out = test == self.tests[0]
-                do_optional_out = True
-
-                test_vectors = checkpoint.load_input_vectors(test)
-                tb = fixture.Testbench(self, tester, test, test_vectors,
-                                       do_optional_out=do_optional_out)
-                tb.create_test_bench()
-
-                run_dir = checkpoint.suggest_run_dir(test)
-                # even if we skip the sim, we still need fault to annotate all
-                # the reads in the test bench, so we still need this call
-                self.simulator.run(tester, run_dir=run_dir,
-                                   no_run=(not controller['run_sim']))
-                if controller['run_sim']:
-                    checkpoint.save_run_dir(test, run_dir)
-
-                if self.debug:
-                    test.debug_plot()
-
-                if controller['run_analysis']:
-                    results_each_mode_unprocessed = tb.get_results()
+            if tracker is not None:
+                controller['choose_inputs'] = tracker.needs_run(test, 'choose_inputs')
+            if controller['choose_inputs'] and not adaptive:
+                with self.profile_stage(test, 'choose_inputs'):
+                    test_vectors = fixture.Sampler.get_samples(
+                        test.signals.random(),
+                        getattr(test, 'num_samples', 10))
+                    checkpoint.save_input_vectors(test, test_vectors)
+                if tracker is not None:
+                    tracker.record(test, 'choose_inputs')
+
+        if tracker is not None:
+            tracker.plan(checkpoint_controller)
+
+        # adaptive sampling runs its own batches later, one test at a time
+        shards_by_test = {test: ([] if adaptive else
+                                 self.get_shards(test, num_shards) if num_shards > 1
+                                 else [None])
+                          for test in self.tests}
+
+        self.raw_reader = raw_reader
+        self.sim_sessions = sim_sessions
+        # "plots: off" in yaml is read as False
+        self.plots = {False: 'off', True: 'full'}.get(plots, plots)
+        assert self.plots in ['off', 'summary', 'full'], f'Unknown plots option {plots}'
+        # only started once there's a plot to draw
+        plot_pool = None
+
+        # sims that already have results in the cache are never submitted
+        self.sim_cache = SimCache(checkpoint.filepath, self) if sim_cache else None
+        sim_cached = {}
+        for test in self.tests:
+            for shard in shards_by_test[test]:
+                cached = False
+                if self.sim_cache is not None and checkpoint_controller[str(test)]['run_sim']:
+                    _, cache_key = self.get_run_dir(test, checkpoint, shard)
+                    cached = self.sim_cache.is_done(cache_key)
+                    self.sim_cache.record(test, cached)
+                sim_cached[SimulationPool._key(test, shard)] = cached
+
+        pool = None
+        finished = False
+        try:
+            if (num_workers > 1 or num_shards > 1) and not adaptive:
+                pool = SimulationPool(self, checkpoint,
+                                      max(num_workers, num_shards))
+                for test in self.tests:
+                    if checkpoint_controller[str(test)]['run_sim']:
+                        for shard in shards_by_test[test]:
+                            if not sim_cached[SimulationPool._key(test, shard)]:
+                                pool.submit(test, shard)
+
+            params_by_mode_all = {}
+            for test in self.tests:
+                controller = checkpoint_controller[str(test)]
+
+                if adaptive:
+                    tbs, results_each_mode_unprocessed, results_each_mode = self.run_adaptive(
+                        test, checkpoint, adaptive_tol, adaptive_batch, adaptive_budget)
+                    tb = tbs[0]
                     checkpoint.save_extracted_data_unprocessed(test, results_each_mode_unprocessed)
-
-            if controller['run_post_process']:
-                results_each_mode_unprocessed = checkpoint.load_extracted_data_unprocessed(test)
-                results_each_mode = tb.post_process(results_each_mode_unprocessed)
-                checkpoint.save_extracted_data(test, results_each_mode)
-
-            results_each_mode = checkpoint.load_extracted_data(test)
-            results_each_mode[Regression.one_literal] = 1
-            params_by_mode = {}
-            for mode in set(results_each_mode.mode_id):
-                results = results_each_mode.loc[results_each_mode.mode_id==mode]
-                if controller['run_regression']:
-                    regression = Regression(self, test, results)
-
-                    #PlotHelper.plot_regression(regression, test.parameter_algebra_vectored, regression.regression_dataframe)
-                    #PlotHelper.plot_optional_effects(test, regression.regression_dataframe, regression.results)
-                    ph = PlotHelper(regression.regression_dataframe,
+                    # run_adaptive already post-processed the last batch
+                    checkpoint.save_extracted_data(test, results_each_mode)
+
+                # analysis requires a fault testbench even if we skip the actual
+                # sim, so the checkpoint logic is not as straightforward here
+                elif controller['run_sim'] or controller['run_analysis']:
+                    # when a worker already ran the sim, we rebuild the same
+                    # testbench here with no_run so fault can annotate the reads
+                    shards = shards_by_test[test]
+                    tbs = []
+                    for shard in shards:
+                        cached = sim_cached[SimulationPool._key(test, shard)]
+                        sim_done = cached
+                        if pool is not None and controller['run_sim'] and not cached:
+                            pool.wait(test, shard)
+                            sim_done = True
+                        no_run = (not controller['run_sim']) or sim_done
+                        tbs.append(self.run_testbench(test, checkpoint,
+                                                      no_run=no_run, shard=shard))
+                    tb = tbs[0]
+                    if controller['run_sim']:
+                        run_dir, _ = self.get_run_dir(test, checkpoint, shards[0])
+                        checkpoint.save_run_dir(test, run_dir)
+                        if tracker is not None:
+                            tracker.record(test, 'run_sim')
+
+                    if self.debug:
+                        test.debug_plot()
+
+                    if controller['run_analysis']:
+                        with self.profile_stage(test, 'get_results'):
+                            if len(tbs) == 1:
+                                results_each_mode_unprocessed = tb.get_results()
+                            else:
+                                results_each_mode_unprocessed = fixture.Testbench.stitch_results(
+                                    tbs, [shard_tb.get_results() for shard_tb in tbs])
+                            checkpoint.save_extracted_data_unprocessed(test, results_each_mode_unprocessed)
+                        if tracker is not None:
+                            tracker.record(test, 'run_analysis')
+
+                if controller['run_post_process'] and not adaptive:
+                    if not (controller['run_sim'] or controller['run_analysis']):
+                        # post-processing only needs the test, not the results
+                        # of a simulated testbench
+                        tb = fixture.Testbench(self, Tester(self.dut), test,
+                                               checkpoint.load_input_vectors(test))
+                    with self.profile_stage(test, 'post_process'):
+                        results_each_mode_unprocessed = checkpoint.load_extracted_data_unprocessed(test)
+                        results_each_mode = tb.post_process(results_each_mode_unprocessed)
+                        checkpoint.save_extracted_data(test, results_each_mode)
+                    if tracker is not None:
+                        tracker.record(test, 'run_post_process')
+
+                results_each_mode = checkpoint.load_extracted_data(test)
+                results_each_mode[Regression.one_literal] = 1
+                params_by_mode = {}
+                # usually one fit per mode, but a mode plan can fit several modes
+                # at once with the mode bits as factors
+                plan = ModePlan.from_test(self, test)
+                post_regression_results = []
+                if controller['run_post_regression'] == 'load':
+                    saved_post_regression = checkpoint.load_post_regression_results(test)
+                for group_i, (modes, results) in enumerate(plan.regression_groups(results_each_mode)):
+                    if controller['run_regression']:
+                        with self.profile_stage(test, 'regression'):
+                            regression = Regression(self, test, results, plan.factors())
+
+                        #PlotHelper.plot_regression(regression, test.parameter_algebra_vectored, regression.regression_dataframe)
+                        #PlotHelper.plot_optional_effects(test, regression.regression_dataframe, regression.results)
+                        if self.plots != 'off':
+                            with self.profile_stage(test, 'save_plot_data'):
+                                plot_file = checkpoint.save_plot_data(
+                                    test, plan.group(modes[0]),
+                                    regression.regression_dataframe,
                                     test.parameter_algebra_vectored,
                                     regression.results)
-                    ph.plot_regression()
-
-                    rr = dict(regression.results)
-
-                    checkpoint.save_regression_results(test, rr)
-                else:
-                    rr = {}
-
-                #if controller['run_post_regression'] == 'load':
-                #    with open(f'{test}_{mode}_post_regression.pickle', 'rb') as f:
-                #        import pickle
-                #        data_in = pickle.load(f)
-                #        test.post_regression(*data_in)
-                #elif controller['run_post_regression'] == 'save':
-                #    with open(f'{test}_{mode}_post_regression.pickle', 'wb') as f:
-                #        import pickle
-                #        pickle.dump((regression.results, regression.regression_dataframe), f)
-                #    # TODO this should really be handled in create_testbench
-                #    temp = test.post_regression(regression.results, regression.regression_dataframe)
-                #    rr.update(temp)
-                #elif controller['run_post_regression'] == False:
-                #    pass
-                #else:
-                #    assert False
-                temp = test.post_regression(regression.results_models, regression.regression_dataframe)
-                rr.update(temp)
-
-                params_by_mode[mode] = rr
-
-            # merge results from this test in results from all tests
-            for mode in params_by_mode:
-                if mode in params_by_mode_all:
-                    params_by_mode_all[mode].update(params_by_mode[mode])
-                else:
-                    params_by_mode_all[mode] = params_by_mode[mode]
+                            if self.plots == 'summary':
+                                from fixture.plot_helper import PlotHelper
+                                with self.profile_stage(test, 'plot_regression'):
+                                    PlotHelper(regression.regression_dataframe,
+                                               test.parameter_algebra_vectored,
+                                               regression.results).plot_summary()
+                            else:
+                                if plot_pool is None:
+                                    plot_pool = PlotPool(max(1, num_workers), self.profiler)
+                                # the plot_regression stage is recorded by the
+                                # worker that draws it
+                                plot_pool.submit(plot_file, os.getcwd(), str(test))
+
+                        rr_group = dict(regression.results)
+
+                        checkpoint.save_regression_results(test, rr_group)
+                    else:
+                        rr_group = {}
+
+                    #if controller['run_post_regression'] == 'load':
+                    #    with open(f'{test}_{mode}_post_regression.pickle', 'rb') as f:
+                    #        import pickle
+                    #        data_in = pickle.load(f)
+                    #        test.post_regression(*data_in)
+                    #elif controller['run_post_regression'] == 'save':
+                    #    with open(f'{test}_{mode}_post_regression.pickle', 'wb') as f:
+                    #        import pickle
+                    #        pickle.dump((regression.results, regression.regression_dataframe), f)
+                    #    # TODO this should really be handled in create_testbench
+                    #    temp = test.post_regression(regression.results, regression.regression_dataframe)
+                    #    rr.update(temp)
+                    #elif controller['run_post_regression'] == False:
+                    #    pass
+                    #else:
+                    #    assert False
+                    if controller['run_post_regression'] == 'load':
+                        temp = saved_post_regression[group_i]
+                    else:
+                        with self.profile_stage(test, 'post_regression'):
+                            temp = test.post_regression(regression.results_models, regression.regression_dataframe)
+                    post_regression_results.append(temp)
+
+                    for mode in modes:
+                        if plan.fractional and rr_group:
+                            rr = plan.fold(rr_group, mode)
+                        else:
+                            rr = dict(rr_group)
+                        rr.update(temp)
+                        params_by_mode[mode] = rr
+                if tracker is not None and controller['run_post_regression'] == 'save':
+                    checkpoint.save_post_regression_results(test, post_regression_results)
+                    tracker.record(test, 'run_post_regression')
+
+                # merge results from this test in results from all tests
+                for mode in params_by_mode:
+                    if mode in params_by_mode_all:
+                        params_by_mode_all[mode].update(params_by_mode[mode])
+                    else:
+                        params_by_mode_all[mode] = params_by_mode[mode]
+            finished = True
+        finally:
+            # also when a test fails, so no simulation or plot workers and
+            # no ngspice sessions are left running; queued work is dropped
+            if pool is not None:
+                pool.shutdown(cancel=not finished)
+            if plot_pool is not None:
+                plot_pool.shutdown(cancel=not finished)
+            SessionPool.close_all()
+
+        if self.profiler is not None:
+            self.profiler.report()
+        if self.sim_cache is not None:
+            self.sim_cache.report()
+        if tracker is not None:
+            tracker.report(checkpoint_controller)
 
         return params_by_mode_all
@@ -1,11 +1,30 @@
-from .simple_amp import SimpleAmpTemplate
-from .comparator import ContinuousComparatorTemplate
-from .differential_amp import DifferentialAmpTemplate
-from .phase_blender import PhaseBlenderTemplate
-from .phase_blender_C import PhaseBlenderTemplate_C
-from .oscillator import OscillatorTemplate
-from .sampler import SamplerTemplate
-from .sampler_custom import SamplerCustomTemplate
-from .mac import MACTemplate
-from .cap_dac import DACTemplate
-from .amplifier import AmplifierTemplate
+import importlib
+
+# templates are imported the first time they're used, so that using one
+# template doesn't mean importing every other template's dependencies
+_template_modules = {
+    'SimpleAmpTemplate': '.simple_amp',
+    'ContinuousComparatorTemplate': '.comparator',
+    'DifferentialAmpTemplate': '.differential_amp',
+    'PhaseBlenderTemplate': '.phase_blender',
+    'PhaseBlenderTemplate_C': '.phase_blender_C',
+    'OscillatorTemplate': '.oscillator',
+    'SamplerTemplate': '.sampler',
+    'SamplerCustomTemplate': '.sampler_custom',
+    'MACTemplate': '.mac',
+    'DACTemplate': '.cap_dac',
+    'AmplifierTemplate': '.amplifier',
+}
+
+__all__ = list(_template_modules)
+
+
+def __getattr__(name):
+    if name not in _template_modules:
+        raise AttributeError(f'module {__name__} has no attribute {name}')
+    module = importlib.import_module(_template_modules[name], __name__)
+    return getattr(module, name)
+
+
+def __dir__():
+    return sorted(list(globals()) + __all__)
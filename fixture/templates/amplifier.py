@@ -1,9 +1,8 @@
 from fixture import TemplateMaster
 from fixture import PlotHelper
-import matplotlib.pyplot as plt
 import numpy as np
 from fixture.signals import create_input_domain_signal, SignalArray
-from fixture.template_creation_utils import extract_pzs
+from fixture.template_creation_utils import extract_pzs, extract_pzs_batch
 
 
 class AmplifierTemplate(TemplateMaster):
@@ -49,6 +48,7 @@ class AmplifierTemplate(TemplateMaster):
 
         def post_regression(self, regression_models, regression_dataframe):
             return {}
+            import matplotlib.pyplot as plt
             print('Hello')
             model = regression_models['amp_output_vec[0]'].model
             y = model.endog
@@ -128,6 +128,7 @@ class AmplifierTemplate(TemplateMaster):
 
         def post_regression(self, results, data):
             return {}
+            import matplotlib.pyplot as plt
             inputs = data['input']
             outputs = data['amp_output']
             ph = PlotHelper()
@@ -256,6 +257,22 @@ class AmplifierTemplate(TemplateMaster):
             zeros = {f'z{i+1}': z for i, z in enumerate(zs)}
             return {**poles, **zeros}
 
+        def analysis_batch(self, reads_list):
+            # same as analysis, but fits every step response together
+            waveforms = []
+            for reads in reads_list:
+                t, v = reads[0].value
+                waveforms.append((t, np.asarray(v) - v[0]))
+            ps, zs = extract_pzs_batch(self.NP, self.NZ, waveforms)
+            zs = np.sort(zs, axis=1)
+
+            results = []
+            for ps_row, zs_row in zip(ps, zs):
+                poles = {f'p{i+1}': p for i, p in enumerate(ps_row)}
+                zeros = {f'z{i+1}': z for i, z in enumerate(zs_row)}
+                results.append({**poles, **zeros})
+            return results
+
 
     tests = [
         #DCTest,
@@ -9,11 +9,12 @@ from fixture import template_creation_utils
 from fixture import signals
 import fixture
 from fixture.signals import SignalOut
+from fixture.waveform import Waveform
+from fixture.edges import find_crossings, search_edges
 
 Regression = fixture.regression.Regression
 import math
 import matplotlib.pyplot as plt
-from fault import domain_read
 from fixture import ChannelUtil
 
 
@@ -636,7 +637,9 @@ class SamplerTemplate(TemplateMaster):
 
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
-            self.poked_waveform = False
+            # the waveform goes into each testbench once; a test can build
+            # several testbenches when it is sharded
+            self.poked_tester = None
 
         #parameter_algebra = {
         #    'sample_out': {'should_be_1': 'value',
@@ -686,7 +689,7 @@ class SamplerTemplate(TemplateMaster):
             clk = self.signals.clk[0] if hasattr(self.signals.clk,
                                                  '__getitem__') else self.signals.clk
 
-            if not self.poked_waveform:
+            if self.poked_tester is not tester:
                 import numpy as np
                 data = np.genfromtxt('fixture/test_channel.csv', delimiter=',')
                 #ts = [t*settle*0.05 for t in range(200)]
@@ -704,7 +707,7 @@ class SamplerTemplate(TemplateMaster):
                     'waits': [ts[1]]*len(vs),
                     'values': vs
                 })
-                self.poked_waveform = True
+                self.poked_tester = tester
 
             if hasattr(self.ports.clk, '__getitem__'):
                 for p in self.ports.clk[1:]:
@@ -998,7 +1001,9 @@ class SamplerTemplate(TemplateMaster):
 
         def __init__(self, *args, **kwargs):
             super().__init__(*args, **kwargs)
-            self.poked_waveform = False
+            # the waveform goes into each testbench once; a test can build
+            # several testbenches when it is sharded
+            self.poked_tester = None
             self.blocks = []
 
             assert 'channel_info' in self.template.extras
@@ -1035,7 +1040,7 @@ class SamplerTemplate(TemplateMaster):
             #clk = self.signals.clk[0] if hasattr(self.signals.clk,
             #                                     '__getitem__') else self.signals.clk
 
-            if not self.poked_waveform:
+            if self.poked_tester is not tester:
                 #import numpy as np
                 #data = np.genfromtxt('fixture/test_channel.csv', delimiter=',')
                 ##ts = [t*settle*0.05 for t in range(200)]
@@ -1054,7 +1059,7 @@ class SamplerTemplate(TemplateMaster):
                     'waits': [ts[1]]*len(vs),
                     'values': vs
                 })
-                self.poked_waveform = True
+                self.poked_tester = tester
 
             #if hasattr(self.ports.clk, '__getitem__'):
             #    for p in self.ports.clk[1:]:
@@ -1111,7 +1116,9 @@ class SamplerTemplate(TemplateMaster):
         def analysis(self, reads):
             block, v_early, v_exact, v_late = [x.value for x in reads[:-1]]
             v_early, v_exact, v_late = [float(x) for x in [v_early, v_exact, v_late]]
-            self.blocks.append(scipy.interpolate.interp1d(*block))
+            # keep the read itself rather than an interp1d, which copies it
+            block = Waveform.from_value(block)
+            self.blocks.append(block)
             output = self.template.interpret_value(reads[-1])
             # TODO I don't understand why that cast to float is necessary
             out_mapped = float(self.template.temp_inv(output))
@@ -1120,13 +1127,13 @@ class SamplerTemplate(TemplateMaster):
 
             # block read is 1 period, clk falls right in the middle
             period = float(self.extras['cycle_time'])
+            # one scan of the block for crossings, then each search is a
+            # binary search
+            crossings = find_crossings(block.t, block.v, out_mapped)
             def search(forward, rising):
-                try:
-                    es = domain_read.find_edge_spice(block[0], block[1],
-                            period / 2, out_mapped, forward=forward, rising=rising)
-                    return es[0]
-                except domain_read.EdgeNotFoundError:
-                    return None
+                edge = search_edges(crossings[0] if rising else crossings[1],
+                                    [period / 2], forward=forward)[0, 0]
+                return None if np.isnan(edge) else float(edge)
 
             edges = [search(False, False),
                      search(False, True),
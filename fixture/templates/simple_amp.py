@@ -1,6 +1,5 @@
 from fixture import TemplateMaster
 from fixture import PlotHelper
-import matplotlib.pyplot as plt
 
 class SimpleAmpTemplate(TemplateMaster):
     required_ports = ['in_single', 'out_single']
@@ -38,6 +37,7 @@ class SimpleAmpTemplate(TemplateMaster):
             return results
 
         def post_regression(self, regression_models):
+            import matplotlib.pyplot as plt
             print('Hello')
             model = regression_models['I(amp_output)'].model
             inputs = model.endog
@@ -89,6 +89,7 @@ class SimpleAmpTemplate(TemplateMaster):
 
         def post_regression(self, results, data):
             return {}
+            import matplotlib.pyplot as plt
             inputs = data['in_single']
             outputs = data['amp_output']
             ph = PlotHelper()
@@ -1,11 +1,124 @@
 import fault
 from fault.domain_read import EdgeNotFoundError
+from fault.spice_target import SpiceTarget
+from fault.result_parse import SpiceResult
+from fault.subprocess_run import subprocess_run
 
 from fixture.signals import SignalIn, SignalOut, SignalArray
+from fixture.waveform import Waveform
+from fixture.raw_reader import RawFile
+from fixture.edges import find_crossings, resolve_edge_reads, EdgeReadError
+from fixture.ngspice_session import SessionPool
 import numpy as np
 
 
+class EdgeSpiceTarget(SpiceTarget):
+    '''
+    SpiceTarget that answers edge reads with fixture.edges: each signal is
+    scanned for crossings once per height, and all the edge reads on it are
+    one searchsorted. Other reads go through fault as usual
+    '''
+
+    def impl_all_gets(self, results, gets):
+        edge_reads = {}
+        for time, action in gets:
+            params = action.params if isinstance(action.params, dict) else {}
+            name = f'{action.port.name}'
+            if params.get('style', None) == 'edge' and name in results:
+                edge_reads.setdefault(name, []).append((time, action, params))
+            else:
+                self.impl_get(results=results, time=time, action=action)
+
+        for name, reads in edge_reads.items():
+            result = results[name]
+            crossings = {}
+            def get_crossings(height):
+                if height not in crossings:
+                    crossings[height] = find_crossings(result.t, result.v, height)
+                return crossings[height]
+            resolve_edge_reads(reads, name, get_crossings, self.vsup / 2)
+
+
+class RawSpiceTarget(EdgeSpiceTarget):
+    '''
+    SpiceTarget that reads ngspice results with fixture's RawFile instead of
+    fault's parser: the .raw file is memory mapped once, and all the reads
+    in the testbench are answered together with binary searches over the
+    time vector. Other simulators, and read styles RawFile doesn't handle,
+    go through fault as usual
+    '''
+
+    def run(self, actions):
+        if self.simulator != 'ngspice':
+            return super().run(actions)
+
+        # same steps as SpiceTarget.run
+        comp = self.compile_actions(actions)
+        tb_file = self.write_test_bench(comp)
+        cmd, raw_files = self.ngspice_cmds(tb_file)
+        if not self.no_run:
+            self.simulate(cmd, tb_file, raw_files)
+
+        for raw_file in raw_files:
+            raw = RawFile.open(raw_file)
+            results = self.FaultResults(raw)
+            self.print_results(results=results, prints=comp.prints)
+
+            def fallback(time, action):
+                self.impl_get(results=results, time=time, action=action)
+            raw.resolve_gets(comp.gets, lambda action: f'{action.port.name}',
+                             self.vsup / 2, fallback)
+
+            self.check_results(results=results, checks=comp.checks)
+
+    def simulate(self, cmd, tb_file, raw_files):
+        subprocess_run(cmd, cwd=self.directory, env=self.sim_env,
+                       disp_type=self.disp_type)
+
+    class FaultResults(dict):
+        # the {name: SpiceResult} dict fault's own methods expect, built
+        # only for the names they actually ask for
+        def __init__(self, raw):
+            super().__init__()
+            self.raw = raw
+
+        def __missing__(self, name):
+            result = SpiceResult(t=self.raw.time, v=self.raw.column(name))
+            self[name] = result
+            return result
+
+
+class SessionSpiceTarget(RawSpiceTarget):
+    '''
+    RawSpiceTarget that runs ngspice in a persistent session from this
+    process's SessionPool instead of starting a new ngspice for every
+    testbench, so the netlist and models are only loaded once per worker
+    '''
+    num_sessions = 1
+
+    def simulate(self, cmd, tb_file, raw_files):
+        assert len(raw_files) == 1, 'TODO sessions with multiple raw files'
+        pool = SessionPool.get(self.num_sessions, self.flags, self.sim_env)
+        pool.run(tb_file, raw_files[0])
+
+
 class Tester(fault.Tester):
+    # use RawSpiceTarget for spice simulations
+    raw_reader = False
+    # if more than 0, use SessionSpiceTarget with up to this many sessions
+    sim_sessions = 0
+
+    def make_target(self, target, **kwargs):
+        if (target == 'spice' and self.sim_sessions
+                and kwargs.get('simulator', 'ngspice') == 'ngspice'):
+            spice_target = SessionSpiceTarget(self._circuit, **kwargs)
+            spice_target.num_sessions = self.sim_sessions
+            return spice_target
+        if target == 'spice' and self.raw_reader:
+            return RawSpiceTarget(self._circuit, **kwargs)
+        if target == 'spice':
+            return EdgeSpiceTarget(self._circuit, **kwargs)
+        return super().make_target(target, **kwargs)
 
     def poke(self, port, value, delay=None):
         if isinstance(port, list):
@@ -70,6 +183,47 @@ class Tester(fault.Tester):
                 return self.callback()
             raise AttributeError
 
+    class BlockReadReturnObject:
+        '''
+        Wraps a block read so its value is a Waveform, which can be windowed
+        and interpolated without copying the data
+        '''
+        def __init__(self, read):
+            self.read = read
+            self.waveform = None
+
+        def __getattr__(self, item):
+            if item in ['read', 'waveform']:
+                raise AttributeError
+            if item == 'value':
+                if self.waveform is None:
+                    self.waveform = Waveform.from_value(self.read.value)
+                return self.waveform
+            return getattr(self.read, item)
+
+    class EdgeReadReturnObject:
+        # EdgeSpiceTarget stores a missing edge as an error; raise it when
+        # someone looks, the same as fault does
+        def __init__(self, read):
+            self.read = read
+
+        def __getattr__(self, item):
+            if item == 'read':
+                raise AttributeError
+            value = getattr(self.read, item)
+            if item == 'value' and isinstance(value, EdgeReadError):
+                raise EdgeNotFoundError(str(value))
+            return value
+
+    def _fault_get_value(self, port, params):
+        r = super().get_value(port, params=params)
+        style = None if params is None else params.get('style', None)
+        if style == 'block':
+            return self.BlockReadReturnObject(r)
+        if style == 'edge':
+            return self.EdgeReadReturnObject(r)
+        return r
+
     def _array_get_value(self, array, params):
         get_value_objects = []
         for sub_array in array:
@@ -92,12 +246,12 @@ class Tester(fault.Tester):
                 return port.representation.representation_get_value(self, params=params)
             else:
                 magma_port = port.spice_pin
-                return super().get_value(magma_port, params=params)
+                return self._fault_get_value(magma_port, params)
 
         elif isinstance(port, SignalArray):
             return self._array_get_value(port, params)
         else:
-            return super().get_value(port, params=params)
+            return self._fault_get_value(port, params)
 
 
     vector_read_mode = {}
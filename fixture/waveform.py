@@ -0,0 +1,131 @@
+import numpy as np
+
+
+class Waveform:
+    '''
+    The (t, v) data from a block read, without copying it.
+    It unpacks like the (t, v) tuple block reads used to be, so
+    `t, v = waveform` and waveform[0] still work, but window, chunks and
+    calling it to interpolate only look at the samples they need.
+    v can also be a function of (absolute) indices, so derived waveforms
+    like a linear combination of reads are only computed where they're used.
+    offset is subtracted from t when it's read, so a block read can be
+    relative to its start time while still sharing the simulator's time axis
+    '''
+
+    def __init__(self, t, v, start=0, stop=None, offset=0):
+        self._t = t
+        self._v = v
+        self.start = int(start)
+        self.stop = len(t) if stop is None else int(stop)
+        self.offset = offset
+
+    @classmethod
+    def from_value(cls, value):
+        if isinstance(value, Waveform):
+            return value
+        t, v = value
+        return cls(np.asarray(t), np.asarray(v))
+
+    @property
+    def num_points(self):
+        return self.stop - self.start
+
+    @property
+    def t(self):
+        if self.offset == 0:
+            return self._t[self.start:self.stop]
+        return self._t[self.start:self.stop] - self.offset
+
+    def _times(self, indices):
+        # self.t[indices] without subtracting the offset from the whole window
+        return self._t[np.asarray(indices) + self.start] - self.offset
+
+    @property
+    def v(self):
+        return self.values(slice(None))
+
+    def values(self, index):
+        # index is relative to this window, like self.v[index]
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.num_points)
+            index = slice(self.start + start, self.start + stop, step)
+        else:
+            index = np.asarray(index) + self.start
+        if callable(self._v):
+            return self._v(index)
+        return self._v[index]
+
+    # act like the tuple (t, v)
+    def __len__(self):
+        return 2
+
+    def __iter__(self):
+        yield self.t
+        yield self.v
+
+    def __getitem__(self, i):
+        return (self.t, self.v)[i]
+
+    def window(self, t_start, t_stop):
+        # every point with t_start <= t <= t_stop
+        t = self._t[self.start:self.stop]
+        a = np.searchsorted(t, t_start + self.offset, side='left')
+        b = np.searchsorted(t, t_stop + self.offset, side='right')
+        return Waveform(self._t, self._v, self.start + a, self.start + b, self.offset)
+
+    def chunks(self, size):
+        for i in range(self.start, self.stop, size):
+            yield Waveform(self._t, self._v, i, min(i + size, self.stop), self.offset)
+
+    def __call__(self, t_new):
+        '''
+        Linear interpolation, like scipy's interp1d(t, v), including the
+        ValueError for points outside the waveform
+        '''
+        t_new = np.asarray(t_new, dtype=float) + self.offset
+        t = self._t[self.start:self.stop]
+        if np.any(t_new < t[0]) or np.any(t_new > t[-1]):
+            raise ValueError('A value in t_new is outside the time range of the waveform')
+        i = np.clip(np.searchsorted(t, t_new, side='right'), 1, len(t) - 1)
+        t0, t1 = t[i-1], t[i]
+        v0, v1 = self.values(i-1), self.values(i)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            frac = np.where(t1 == t0, 0, (t_new - t0) / (t1 - t0))
+        return v0 + frac * (v1 - v0)
+
+    def decimate(self, max_points):
+        '''
+        At most max_points points for plotting. Keeps the min and max of each
+        chunk so clock edges and glitches don't disappear
+        '''
+        if self.num_points <= max_points:
+            return self
+        size = int(np.ceil(2 * self.num_points / max_points))
+        indices = []
+        for chunk in self.chunks(size):
+            v = chunk.v
+            offset = chunk.start - self.start
+            indices.extend(sorted({offset + int(np.argmin(v)),
+                                   offset + int(np.argmax(v))}))
+        indices = np.array(indices)
+        return Waveform(self._times(indices), self.values(indices))
+
+    def to_memmap(self, path_prefix, chunk_size=1 << 20):
+        '''
+        Write to path_prefix_t.npy and path_prefix_v.npy one chunk at a time
+        and return a Waveform backed by memory maps of those files
+        '''
+        assert self.num_points > 0, 'Cannot save an empty waveform'
+        arrays = []
+        for name, get in [('t', lambda c: c.t), ('v', lambda c: c.v)]:
+            path = f'{path_prefix}_{name}.npy'
+            first = get(Waveform(self._t, self._v, self.start, self.start + 1, self.offset))
+            out = np.lib.format.open_memmap(path, mode='w+', dtype=np.asarray(first).dtype,
+                                            shape=(self.num_points,))
+            for chunk in self.chunks(chunk_size):
+                out[chunk.start - self.start:chunk.stop - self.start] = get(chunk)
+            out.flush()
+            del out
+            arrays.append(np.load(path, mmap_mode='r'))
+        return Waveform(*arrays)
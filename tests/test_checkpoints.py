@@ -0,0 +1,76 @@
+import types
+
+import pandas
+
+from fixture.checkpoints import Checkpoint, CSVStorage, NpyStorage
+from fixture.mode_plan import ModePlan
+from fixture.signals import SignalOut
+
+
+def test_npy_round_trip(tmp_path):
+    a = SignalOut('real', 'a', 'a', 'a', False)
+    data = pandas.DataFrame({
+        a: [1.0, 2.0, 3.0],
+        'count': [1, 2, 3],
+        'mode_id': [(0, 1), (1, 0), (0, 0)],
+        'misc': [None, [1], 2]
+    })
+
+    filename = str(tmp_path / 'extracted_data')
+    NpyStorage.save(filename, data)
+    loaded = NpyStorage.load(filename, {str(a): a})
+
+    assert list(loaded.columns) == [a, 'count', 'mode_id', 'misc']
+    assert list(loaded.dtypes) == list(data.dtypes)
+    assert list(loaded.mode_id) == [(0, 1), (1, 0), (0, 0)]
+    assert list(loaded.misc) == [None, [1], 2]
+
+    # edits to the loaded data stay in memory
+    loaded.loc[loaded.mode_id == (0, 1), 'count'] = 5
+    assert list(NpyStorage.load(filename, {str(a): a})['count']) == [1, 2, 3]
+
+
+def test_npy_keys_and_index(tmp_path):
+    # only Signals get looked up on load, other keys come back as they were,
+    # and an index of mixed types needs pickling like an object column
+    data = pandas.DataFrame({0: [1.0, 2.0], (1, 2): [3, 4], 'name': ['a', 'bc']},
+                            index=['x', (0, 1)])
+
+    filename = str(tmp_path / 'table')
+    NpyStorage.save(filename, data)
+    loaded = NpyStorage.load(filename, {})
+
+    assert list(loaded.columns) == [0, (1, 2), 'name']
+    assert list(loaded.dtypes) == list(data.dtypes)
+    assert list(loaded.index) == ['x', (0, 1)]
+    assert list(loaded[(1, 2)]) == [3, 4]
+    assert list(loaded['name']) == ['a', 'bc']
+
+
+def test_csv_fallback(tmp_path):
+    # csv checkpoints from before npy was the default still load
+    a = SignalOut('real', 'a', 'a', 'a', False)
+
+    class CSVTest:
+        signals = types.SimpleNamespace(flat=lambda: [a])
+    test = CSVTest()
+    csv_checkpoint = Checkpoint(types.SimpleNamespace(tests=[test]), str(tmp_path), 'csv')
+    csv_checkpoint.save_extracted_data(test, pandas.DataFrame({a: [1.0, 2.0]}))
+
+    checkpoint = Checkpoint(types.SimpleNamespace(tests=[test]), str(tmp_path))
+    assert list(checkpoint.load_extracted_data(test)[a]) == [1.0, 2.0]
+
+
+def test_csv_mode_id(tmp_path):
+    a = SignalOut('real', 'a', 'a', 'a', False)
+    data = pandas.DataFrame({a: [1.0, 2.0, 3.0], 'mode_id': [(0, 1), (1, 0), (0, 1)]})
+
+    filename = str(tmp_path / 'extracted_data.csv')
+    CSVStorage.save(filename, data)
+    loaded = CSVStorage.load(filename, {str(a): a})
+
+    assert list(loaded.mode_id) == [(0, 1), (1, 0), (0, 1)]
+    plan = ModePlan([])
+    groups = plan.regression_groups(loaded)
+    assert [modes for modes, _ in groups] == [[(0, 1)], [(1, 0)]]
+    assert list(groups[0][1][a]) == [1.0, 3.0]
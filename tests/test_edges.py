@@ -0,0 +1,52 @@
+from types import SimpleNamespace
+
+import numpy as np
+from fault.result_parse import SpiceResult
+
+from fixture.edges import find_crossings, search_edges, EdgeReadError
+from fixture.tester import EdgeSpiceTarget
+
+
+def test_edges():
+    t = np.linspace(0, 10, 10001)
+    v = np.sin(2*np.pi*t)
+    rising, falling = find_crossings(t, v, 0.5)
+    # sin crosses 0.5 rising at 1/12 and falling at 5/12 of each period
+    assert np.allclose(rising, np.arange(10) + 1/12, atol=1e-6)
+    assert np.allclose(falling, np.arange(10) + 5/12, atol=1e-6)
+
+    times = np.array([0, 2.5, 9.9])
+    back = search_edges(rising, times, forward=False, count=2)
+    fwd = search_edges(falling, times, forward=True, count=1)
+    for i, time in enumerate(times):
+        # brute force
+        before = sorted([e - time for e in rising if e <= time], reverse=True)[:2]
+        before += [float('nan')] * (2 - len(before))
+        after = [e - time for e in falling if e >= time][:1] or [float('nan')]
+        assert np.allclose(back[i], before, equal_nan=True)
+        assert np.allclose(fwd[i], after, equal_nan=True)
+
+    assert np.isnan(search_edges([], [1.0])).all()
+
+
+def test_edge_spice_target():
+    # edge reads on fault's own results go through the same search
+    t = np.linspace(0, 10e-9, 1001)
+    clk = (np.sin(2*np.pi*1e9*t) > 0).astype(float)
+    results = {'clk': SpiceResult(t, clk), 'ramp': SpiceResult(t, t * 1e8)}
+
+    def read(name, params=None):
+        return SimpleNamespace(port=SimpleNamespace(name=name), params=params, value=None)
+    point = read('ramp')
+    edge_back = read('clk', {'style': 'edge', 'rising': True, 'count': 2})
+    edge_fwd = read('clk', {'style': 'edge', 'forward': True, 'rising': False})
+    missing = read('clk', {'style': 'edge', 'count': 100})
+
+    target = EdgeSpiceTarget.__new__(EdgeSpiceTarget)
+    target.vsup = 1.0
+    target.impl_all_gets(results, [(2.5e-9, point), (4.2e-9, edge_back),
+                                   (4.2e-9, edge_fwd), (1e-9, missing)])
+    assert np.isclose(point.value, 0.25)
+    assert np.allclose(edge_back.value, [-0.2e-9, -1.2e-9], atol=2e-11)
+    assert np.allclose(edge_fwd.value, [0.3e-9], atol=2e-11)
+    assert isinstance(missing.value, EdgeReadError)
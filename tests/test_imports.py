@@ -0,0 +1,13 @@
+import subprocess
+import sys
+
+
+def test_lazy_imports():
+    # plotting, channel and template dependencies should wait until used
+    code = ('import sys, fixture; '
+            'print([m for m in ["statsmodels", "dragonphy", "dave", '
+            '"fixture.plot_helper", "fixture.templates.amplifier"] '
+            'if m in sys.modules])')
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         capture_output=True, text=True).stdout
+    assert out.strip().splitlines()[-1] == '[]'
@@ -0,0 +1,43 @@
+import types
+
+from fixture.incremental import StageTracker
+
+
+class StaticTest:
+    pass
+
+
+class DelayTest:
+    pass
+
+
+def make_tracker(changed):
+    # every fingerprint matches the saved one except the stages in changed
+    tests = [StaticTest(), DelayTest()]
+    tracker = StageTracker.__new__(StageTracker)
+    tracker.template = types.SimpleNamespace(tests=tests)
+    tracker.fingerprints = {test: {stage: ('new' if (type(test), stage) in changed else 'old')
+                                   for stage in StageTracker.stages}
+                            for test in tests}
+    tracker.saved = {test: {stage: 'old' for stage in StageTracker.stages} for test in tests}
+    controller = {str(test): {stage: True for stage in StageTracker.stages} for test in tests}
+    tracker.plan(controller)
+    return [controller[str(test)] for test in tests]
+
+
+def test_plan_unchanged():
+    # analysis is skipped, so post_regression has to use its saved results
+    # rather than run without what analysis would have set up
+    for controller in make_tracker(set()):
+        assert controller['run_analysis'] is False
+        assert controller['run_post_regression'] == 'load'
+
+
+def test_plan_post_regression_changed():
+    static, delay = make_tracker({(DelayTest, 'run_post_regression')})
+    # DelayTest.post_regression uses the blocks its analysis keeps, and its
+    # analysis uses the template's temp_inv from StaticTest's analysis
+    assert delay['run_post_regression'] == 'save'
+    assert delay['run_analysis'] is True and static['run_analysis'] is True
+    assert static['run_post_regression'] == 'load'
+    assert not delay['run_sim'] and not delay['run_post_process']
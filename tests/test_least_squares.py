@@ -0,0 +1,26 @@
+import numpy as np
+import pandas
+import statsmodels.formula.api as smf
+
+from fixture.least_squares import fit_shared_design
+
+
+def test_matches_statsmodels():
+    rng = np.random.default_rng(0)
+    N = 50
+    data = pandas.DataFrame({'const_1': 1.0,
+                             'a': rng.random(N),
+                             'b': rng.random(N)})
+    data['y1'] = 3*data['a'] - 2*data['b'] + 1 + 0.1*rng.standard_normal(N)
+    data['y2'] = data['a'] + 0.1*rng.standard_normal(N)
+
+    fits = fit_shared_design(data, ['const_1', 'a', 'b'], ['y1', 'y2'])
+    for y in ['y1', 'y2']:
+        expected = smf.ols(f'I({y}) ~ const_1 + a + b -1', data).fit()
+        fit = fits[y]
+        assert np.allclose(fit.params, expected.params)
+        assert np.allclose(fit.bse, expected.bse)
+        assert np.allclose(fit.predict(), expected.predict())
+        assert np.allclose(fit.predict(data.iloc[:5]), expected.predict(data.iloc[:5]))
+        assert np.allclose(fit.model.endog, expected.model.endog)
+        assert np.allclose(fit.model.predict(fit.params), expected.model.predict(expected.params))
@@ -0,0 +1,69 @@
+import numpy as np
+
+from fixture.modal_analysis import ModalAnalysis
+from fixture.template_creation_utils import extract_pzs, extract_pzs_batch
+
+
+def test_varpro_error():
+    t, h_step = ModalAnalysis.get_debug_h_step()
+    ma = ModalAnalysis(t, h_step)
+    known = np.array([0])
+    free = np.array([-3e9+4e9j, -3e9-4e9j]) * ma.scale
+    poles = np.concatenate((known, free))
+
+    errors = ma.error_from_poles_batch(np.array([poles, poles*2]), 1)
+    assert np.isclose(errors[0], np.real(ma.error_from_poles(poles, 1)))
+    assert np.isclose(errors[1], np.real(ma.error_from_poles(poles*2, 1)))
+
+    # analytic gradient w.r.t. coefs matches finite differences
+    def f(coefs):
+        free = ma.poles_from_coefs(coefs)
+        errors, grad = ma.varpro_error(np.concatenate((known, free)),
+                                       ma.t, h_step, 1, with_grad=True)
+        return errors[0], (grad[0, 1:] @ ma.pole_derivatives(free)).real
+
+    coefs = ma.coefs_from_poles(free)
+    _, grad = f(coefs)
+    for i in range(len(coefs)):
+        step = np.zeros(len(coefs))
+        step[i] = 1e-6 * abs(coefs[i])
+        fd = (f(coefs + step)[0] - f(coefs - step)[0]) / (2*step[i])
+        assert np.isclose(grad[i], fd, rtol=1e-4)
+
+
+def test_extract_pzs_batch():
+    t, h_step = ModalAnalysis.get_debug_h_step()
+    waveforms = [(t, h_step * gain) for gain in [1, 0.5, 2]]
+    # ragged one takes the other path
+    waveforms_ragged = waveforms + [(t[:800], h_step[:800])]
+
+    for ws in [waveforms, waveforms_ragged]:
+        ps, zs = extract_pzs_batch(2, 1, ws)
+        assert ps.shape == (len(ws), 2)
+        assert zs.shape == (len(ws), 1)
+        for (x, y), p, z in zip(ws, ps, zs):
+            p_single, z_single = extract_pzs(2, 1, x, y)
+            assert np.allclose(np.sort(p), np.sort(p_single), rtol=1e-2)
+            assert np.allclose(z, z_single, rtol=1e-2)
+
+
+def test_extract_pzs_batch_rows_independent():
+    # rows with different poles and zeros, each fit on its own
+    from scipy.signal import residue
+    t = 1e-12 * np.arange(1000)
+    specs = [(-2e9, -20e9, 50e9), (-5e9, -30e9, -80e9), (-1e9, -8e9, 20e9),
+             (-3e9+2e9j, -3e9-2e9j, 40e9)]
+    waveforms = []
+    for p1, p2, z in specs:
+        r, p, _ = residue(np.poly([z]) * p1*p2 / -z, np.poly([0, p1, p2]))
+        waveforms.append((t, np.real(sum(ri*np.exp(pi*t) for ri, pi in zip(r, p)))))
+
+    ps, zs = extract_pzs_batch(2, 1, waveforms)
+    for i, ((x, y), p, z) in enumerate(zip(waveforms, ps, zs)):
+        p_single, z_single = extract_pzs(2, 1, x, y)
+        assert np.allclose(np.sort(p), np.sort(p_single), rtol=1e-3)
+        assert np.allclose(z, z_single, rtol=1e-3)
+        # the same answer no matter what else is in the batch
+        p_alone, z_alone = extract_pzs_batch(2, 1, [waveforms[i]])
+        assert np.allclose(p_alone[0], p, rtol=1e-9)
+        assert np.allclose(z_alone[0], z, rtol=1e-9)
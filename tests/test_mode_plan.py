@@ -0,0 +1,114 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas
+
+from fixture.mode_plan import ModePlan
+from fixture.regression import Regression
+
+
+class Bit:
+    def __init__(self, name):
+        self.spice_name = name
+        self.template_name = None
+
+
+def test_two_level_design():
+    for k in range(1, 8):
+        design = ModePlan.two_level_design(k)
+        assert design.shape[1] == k
+        assert len(design) < 2 * (k + 1)
+        # balanced and orthogonal, so every main effect is estimable
+        signs = 2 * design - 1
+        assert np.all(signs.sum(axis=0) == 0)
+        assert np.array_equal(signs.T @ signs, len(design) * np.eye(k))
+
+
+def test_mode_plan():
+    en, a, b, c = bits = [Bit('en'), Bit('a'), Bit('b'), Bit('c')]
+    full = ModePlan(bits)
+    assert len(full.sim_modes) == 16 and full.factors() == []
+
+    reachable = ModePlan(bits, reachable=[[1, 0, 0, 0], {'en': 1, 'a': 1, 'b': 1, 'c': 0}])
+    assert reachable.sim_modes == [(1, 0, 0, 0), (1, 1, 1, 0)]
+
+    plan = ModePlan(bits, independent=['a', 'b', 'c'], fractional=True)
+    # 4 runs over the independent bits for each value of en
+    assert len(plan.sim_modes) == 8
+    assert len(plan.modes) == 16
+    assert plan.factors() == [a, b, c]
+
+    results_each_mode = pandas.DataFrame({
+        'mode_id': [m for m in plan.sim_modes for _ in range(2)],
+        'out': np.arange(16.0)})
+    groups = plan.regression_groups(results_each_mode)
+    assert len(groups) == 2
+    modes, results = groups[1]
+    assert all(m[0] == 1 for m in modes) and len(modes) == 8
+    assert len(results) == 8
+    assert list(results[b]) == [m[2] for m in results.mode_id]
+
+    x = Bit('x')
+    fit = {'out': {'gain': {Regression.one_literal: 1.0, x: 2.0, a: 0.5,
+                            (x, a): 0.25, c: -1.0}}}
+    folded = plan.fold(fit, (1, 1, 0, 1))
+    assert folded['out']['gain'] == {Regression.one_literal: 0.5, x: 2.25}
+    folded = plan.fold(fit, (1, 0, 0, 0))
+    assert folded['out']['gain'] == {Regression.one_literal: 1.0, x: 2.0}
+
+
+def test_add_mode_factors():
+    a, x = Bit('a'), Bit('x')
+    terms = Regression.add_mode_factors([Regression.one_literal, x, (x, x)], [a])
+    assert terms == [Regression.one_literal, x, (x, x), a, (x, a), (x, x, a)]
+
+
+def test_fractional_fit_folds_to_per_mode_fits():
+    en, a, b, c = bits = [Bit('en'), Bit('a'), Bit('b'), Bit('c')]
+    plan = ModePlan(bits, independent=['a', 'b', 'c'], fractional=True)
+    vdd = Bit('vdd')
+    vdd.type_ = 'analog'
+    template = SimpleNamespace(extras={},
+                               signals=SimpleNamespace(optional_expr=lambda: [vdd]))
+    test = SimpleNamespace(parameter_algebra_vectored={'out': {'gain': 'x', 'offset': '1'}},
+                           signals=SimpleNamespace(auto_measure=lambda: []))
+
+    # every coefficient is additive in the independent bits
+    def params(mode):
+        en_, a_, b_, c_ = mode
+        return {'gain': {Regression.one_literal: 2 + en_ + 0.5*a_ - 0.3*b_ + 0.2*c_,
+                         vdd: 0.1 + 0.05*a_ - 0.4*en_},
+                'offset': {Regression.one_literal: 1 + 0.2*b_ - 0.7*c_,
+                           vdd: -0.1 + 0.3*en_ + 0.15*c_}}
+
+    rng = np.random.default_rng(4)
+    def simulate(modes, n=6):
+        rows = {'mode_id': [], 'x': [], vdd: [], 'out': []}
+        for mode in modes:
+            p = params(mode)
+            for _ in range(n):
+                x_, vdd_ = rng.uniform(-1, 1, 2)
+                rows['mode_id'].append(mode)
+                rows['x'].append(x_)
+                rows[vdd].append(vdd_)
+                rows['out'].append(sum(
+                    (p[name][Regression.one_literal] + p[name][vdd]*vdd_) * scale
+                    for name, scale in [('gain', x_), ('offset', 1)]))
+        data = pandas.DataFrame(rows)
+        data[Regression.one_literal] = 1
+        return data
+
+    groups = plan.regression_groups(simulate(plan.sim_modes))
+    assert len(groups) == 2
+    for modes, results in groups:
+        folded_group = Regression(template, test, results, plan.factors()).results
+        # half of these modes were never simulated
+        assert len(modes) == 8
+        for mode in modes:
+            folded = plan.fold(folded_group, mode)
+            alone = Regression(template, test, simulate([mode])).results
+            for param, coefs in alone['out'].items():
+                assert folded['out'][param].keys() == coefs.keys()
+                for opt, coef in coefs.items():
+                    assert np.isclose(folded['out'][param][opt], coef)
+                    assert np.isclose(coef, params(mode)[param][opt])
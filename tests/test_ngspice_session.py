@@ -0,0 +1,72 @@
+import pytest
+
+from fixture.ngspice_session import NgspiceSession
+
+
+def make_deck(pwl, tran, control=()):
+    return '\n'.join([
+        '* Automatically generated file.',
+        '.include /models/sky130.lib',
+        'X0 __in_v in __in_s 0 inout_sw_mod',
+        f'V1 __in_v 0 DC 0 PWL({pwl})',
+        'V2 __in_s 0 DC 1 PWL(0 1)',
+        f'.tran {tran}',
+        '.control',
+        *control,
+        'run',
+        'write',
+        'exit',
+        '.endc',
+        '.probe V(out)',
+        '.end',
+    ])
+
+
+def test_parse_deck():
+    key_a, circuit, pwls, tran, control = NgspiceSession.parse_deck(make_deck('0 0 1e-09 1.2', '1e-11 1e-08'))
+    key_b, _, pwls_b, tran_b, _ = NgspiceSession.parse_deck(make_deck('0 0.5 2e-09 0', '2e-11 2e-08'))
+    assert key_a == key_b
+    assert pwls == {'v1': '0 0 1e-09 1.2', 'v2': '0 1'}
+    assert pwls_b['v1'] == '0 0.5 2e-09 0'
+    assert tran == 'tran 1e-11 1e-08' and tran_b == 'tran 2e-11 2e-08'
+    assert '.control' not in circuit and 'exit' not in circuit
+    assert '.include /models/sky130.lib' in circuit
+    assert control == []
+
+    key_c, _, _, _, _ = NgspiceSession.parse_deck(
+        make_deck('0 0', '1e-11 1e-08').replace('sky130.lib', 'other.lib'))
+    assert key_c != key_a
+
+
+def test_parse_deck_control_options():
+    deck = make_deck('0 0 1e-09 1.2', '1e-11 1e-08',
+                     ['option reltol=1e-4 method=gear', '* a comment', 'save v(out) i(v1)'])
+    key, circuit, _, _, control = NgspiceSession.parse_deck(deck)
+    assert control == ['option reltol=1e-4 method=gear', 'save v(out) i(v1)']
+    assert 'reltol' not in circuit
+    # different options need the circuit loaded again
+    assert key != NgspiceSession.parse_deck(make_deck('0 0 1e-09 1.2', '1e-11 1e-08'))[0]
+
+
+def test_session_pool_error(monkeypatch, tmp_path):
+    import fixture.ngspice_session as ngspice_session
+
+    class FakeSession:
+        def __init__(self, flags, env):
+            self.closed = False
+
+        def run(self, tb_file, raw_file):
+            with open(tb_file) as f:
+                NgspiceSession.parse_deck(f.read())
+
+        def close(self):
+            self.closed = True
+
+    monkeypatch.setattr(ngspice_session, 'NgspiceSession', FakeSession)
+    pool = ngspice_session.SessionPool(num_sessions=1)
+    (tmp_path / 'no_tran.sp').write_text('* no .tran here\n')
+    for tb_file, error in [('missing.sp', OSError), ('no_tran.sp', AssertionError)]:
+        with pytest.raises(error):
+            pool.run(str(tmp_path / tb_file), 'out.raw')
+        # the broken session is gone, so the next run doesn't wait for it
+        assert pool.sessions == [] and pool.idle.empty()
@@ -0,0 +1,64 @@
+import types
+
+import numpy as np
+
+from fixture.parameter_algebra import ParameterAlgebra
+from fixture.regression import Regression
+from fixture.signals import SignalManager, SignalArray, SignalIn, SignalOut, \
+    create_input_domain_signal
+
+
+def test_compile():
+    pa = {'out': {'gain': 'in*vdd^2', 'offset': '1', 'cm': 'vdd ** 2 * in',
+                  'given': ('in', Regression.one_literal), 'scaled': 'vdd*1'}}
+    algebra = ParameterAlgebra.compile(pa)
+    assert algebra.symbols == ['in', 'vdd', Regression.one_literal]
+    assert algebra.equations == {'out': [('gain', (0, 1, 1)), ('offset', (2,)),
+                                         ('cm', (1, 1, 0)), ('given', (0, 2)),
+                                         ('scaled', (1, 2))]}
+
+    class MyTest:
+        pass
+    assert ParameterAlgebra.compile(pa, MyTest) is ParameterAlgebra.compile(dict(pa), MyTest)
+    assert ParameterAlgebra.compile(pa, MyTest) is not ParameterAlgebra.compile(pa, int)
+
+    bound = algebra.bind(str.upper)
+    assert bound['out'][0] == ('gain', ('IN', 'VDD', 'VDD'))
+
+
+def bus(name, n):
+    bits = [SignalIn(None, 'binary_analog', True, True, f'{name}<{i}>',
+                     f'{name}<{i}>', f'{name}[{i}]', False) for i in range(n)]
+    return SignalArray(np.array(bits), {}, template_name=name, spice_name=name)
+
+
+def test_expand_parameter_algebra():
+    from fixture.template_master import TemplateMaster
+    vdd = create_input_domain_signal('vdd', (1.0, 1.2), spice_pin='vdd')
+    a, b = bus('a', 3), bus('b', 2)
+    out = SignalOut('real', 'out', 'out', 'out', False)
+    signals = SignalManager([vdd, a, b, out], {'vdd': vdd, 'a': a, 'b': b, 'out': out})
+    test = types.SimpleNamespace(
+        parameter_algebra={'out': {'k': 'a', 'g': 'vdd^2', 'h': 'a*b',
+                                   'm': 'b', 'c': '1', 'q': 'vdd*x_ph', 'v': 'vdd*1'}},
+        signals=signals,
+        input_vector_mapping={'x_ph': 'a'},
+        template=types.SimpleNamespace(required_ports=['a', 'b', 'out'], signals=signals))
+
+    TemplateMaster.Test._expand_parameter_algebra(test)
+    rhs = test.parameter_algebra_vectored['out']
+
+    # terms with vectored inputs go after the others, in the order the
+    # vectored inputs first appear
+    assert list(rhs) == ['g', 'c', 'v', 'k_invec[0]', 'k_invec[1]', 'k_invec[2]',
+                         'm_invec[0]', 'm_invec[1]',
+                         'h_invec[0]_invec[0]', 'h_invec[0]_invec[1]',
+                         'h_invec[1]_invec[0]', 'h_invec[1]_invec[1]',
+                         'h_invec[2]_invec[0]', 'h_invec[2]_invec[1]',
+                         'q_invec[0]', 'q_invec[1]', 'q_invec[2]']
+    assert rhs['g'] == (vdd, vdd)
+    assert rhs['c'] == (Regression.one_literal,)
+    # explicit factors of 1 are kept, like a const_1 input
+    assert rhs['v'] == (vdd, Regression.one_literal)
+    assert rhs['h_invec[2]_invec[1]'] == (a[2], b[1])
+    assert rhs['q_invec[1]'] == (vdd, 'x_ph_invec[1]')
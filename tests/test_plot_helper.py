@@ -0,0 +1,57 @@
+import numpy as np
+import pandas
+
+from fixture.plot_helper import PlotHelper
+from fixture.regression import Regression
+from fixture.signals import create_input_domain_signal
+
+
+def get_plot_helper():
+    # out = gain*in + offset, gain and offset depend on vdd
+    s_in = create_input_domain_signal('in_single', (0.0, 1.2), spice_pin='in_single')
+    vdd = create_input_domain_signal('vdd', (1.0, 1.4), spice_pin='vdd', optional_expr=True)
+    rng = np.random.default_rng(4)
+    x = rng.uniform(0, 1.2, 50)
+    v = rng.uniform(1.0, 1.4, 50)
+    gain = 2 + 0.1*v + 0.01*v*v
+    offset = 0.5 - 0.05*v
+    data = pandas.DataFrame({'in_single': x, 'vdd': v,
+                             'out': gain*x + offset + rng.normal(0, 1e-3, 50),
+                             Regression.one_literal: 1})
+    parameter_algebra = {'out': {'gain': (s_in,), 'offset': (Regression.one_literal,)}}
+    regression_results = {'out': {
+        'gain': {Regression.one_literal: 2, vdd: 0.1, (vdd, vdd): 0.01},
+        'offset': {Regression.one_literal: 0.5, vdd: -0.05}}}
+    return PlotHelper(data, parameter_algebra, regression_results), data, vdd
+
+
+def test_get_column():
+    ph, data, vdd = get_plot_helper()
+    x, v, out = data['in_single'].values, data['vdd'].values, data['out'].values
+    gain = 2 + 0.1*v + 0.01*v*v
+    offset = 0.5 - 0.05*v
+
+    assert np.allclose(ph.get_column('gain'), gain)
+    assert np.allclose(ph.get_column('out', lhs_pred=True), gain*x + offset)
+    assert np.allclose(ph.get_column('gain', param_meas=True), (out - offset) / x)
+    assert ph.get_column('gain') is ph.get_column('gain')
+
+    # adjusted to vdd=1.2, including the vdd^2 term
+    nominal = {vdd: 1.2}
+    gain_nom = 2 + 0.12 + 0.0144
+    offset_nom = 0.5 - 0.06
+    assert np.allclose(ph.get_column('gain', overrides=nominal), gain_nom)
+    assert np.allclose(ph.get_column('out', overrides=nominal, lhs_pred=True),
+                       gain_nom*x + offset_nom)
+    assert np.allclose(ph.get_column('out', overrides=nominal),
+                       out + (gain_nom*x + offset_nom) - (gain*x + offset))
+
+
+def test_sweep():
+    ph, data, vdd = get_plot_helper()
+    x = data['in_single'].values
+    vdds = np.array([1.0, 1.2, 1.4])
+    pred = ph.sweep('out', vdd, vdds, lhs_pred=True)
+    assert pred.shape == (3, len(data))
+    for row, v in zip(pred, vdds):
+        assert np.allclose(row, (2 + 0.1*v + 0.01*v*v)*x + 0.5 - 0.05*v)
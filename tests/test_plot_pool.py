@@ -0,0 +1,73 @@
+import os
+import types
+
+import numpy as np
+import pandas
+
+from fixture.checkpoints import Checkpoint
+from fixture.parallel import PlotPool
+from fixture.plot_helper import PlotHelper
+from fixture.profiling import StageProfiler
+from fixture.regression import Regression
+from fixture.signals import create_input_domain_signal
+
+
+def save_line_data(folder):
+    # out = 2*in + 0.5, fit exactly
+    s_in = create_input_domain_signal('in_single', (0.0, 1.2), spice_pin='in_single')
+    x = np.linspace(0, 1.2, 20)
+    data = pandas.DataFrame({Regression.regression_name(s_in): x,
+                             'out': 2*x + 0.5,
+                             Regression.one_literal: 1})
+    parameter_algebra = {'out': {'gain': (s_in,), 'offset': (Regression.one_literal,)}}
+    regression_results = {'out': {'gain': {Regression.one_literal: 2.0},
+                                   'offset': {Regression.one_literal: 0.5}}}
+    checkpoint = Checkpoint(types.SimpleNamespace(tests=[]), str(folder))
+    return checkpoint.save_plot_data('LineTest', (0, 1), data, parameter_algebra,
+                                     regression_results)
+
+
+def test_plot_pool(tmp_path):
+    filename = save_line_data(tmp_path / 'checkpoint_folder')
+    assert os.path.basename(filename) == 'plot_data_01.pickle'
+
+    plots = tmp_path / 'plots'
+    plots.mkdir()
+    profiler = StageProfiler(str(tmp_path / 'checkpoint_folder'))
+    pool = PlotPool(1, profiler)
+    # nothing is started until there's something to plot
+    assert pool.executor is None
+    pool.submit(filename, str(plots), 'LineTest')
+    pool.shutdown()
+    assert any(name.startswith('out_vs_') for name in os.listdir(plots))
+    # the time is recorded by the worker that drew the plots
+    [record] = profiler.records()
+    assert (record['test'], record['stage']) == ('LineTest', 'plot_regression')
+    assert record['pid'] != os.getpid()
+
+
+def test_plot_summary(tmp_path, monkeypatch):
+    filename = save_line_data(tmp_path)
+    monkeypatch.chdir(tmp_path)
+    PlotHelper.from_file(filename).plot_summary()
+    assert os.path.exists(tmp_path / 'out_fit.png')
+
+
+def test_plot_pool_failure(tmp_path, capsys):
+    pool = PlotPool(1)
+    pool.submit(str(tmp_path / 'missing.pickle'), str(tmp_path))
+    pool.shutdown()
+    assert 'Plotting failed' in capsys.readouterr().out
+
+
+def test_plot_pool_cancel(tmp_path, capsys):
+    # what go() does when a test fails: queued plots are dropped, and only
+    # the ones that actually ran are reported
+    pool = PlotPool(1)
+    for _ in range(20):
+        pool.submit(str(tmp_path / 'missing.pickle'), str(tmp_path))
+    futures = pool.futures
+    pool.shutdown(cancel=True)
+    assert pool.executor is None
+    failures = capsys.readouterr().out.count('Plotting failed')
+    assert failures == sum(not f.cancelled() for f in futures)
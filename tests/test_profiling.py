@@ -0,0 +1,45 @@
+import csv
+import json
+import os
+import time
+
+from fixture.profiling import StageProfiler
+
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    total = 0
+    while time.perf_counter() < end:
+        total += 1
+    return total
+
+
+def test_stage_profiler(tmp_path):
+    profiler = StageProfiler(tmp_path, profile='sample')
+    with profiler.stage('DCTest', 'regression'):
+        busy(0.05)
+    with profiler.stage('DCTest', 'post_process'):
+        pass
+    records = profiler.report()
+
+    assert [r['stage'] for r in records] == ['regression', 'post_process']
+    assert records[0]['wall'] >= 0.05
+    assert records[0]['cpu'] > 0.02
+    assert records[0]['rss_mb'] > 0
+
+    folder = tmp_path / 'profile'
+    with open(folder / 'profile.json') as f:
+        assert json.load(f) == records
+    with open(folder / 'profile.csv') as f:
+        assert len(list(csv.DictReader(f))) == 2
+    folded = [name for name in os.listdir(folder) if name.endswith('.folded')]
+    assert len(folded) == 2
+    with open(folder / [name for name in folded if 'regression' in name][0]) as f:
+        assert 'busy' in f.read()
+
+
+def test_cprofile(tmp_path):
+    profiler = StageProfiler(tmp_path, profile='cprofile')
+    with profiler.stage('DCTest', 'simulate'):
+        busy(0.01)
+    assert any(name.endswith('.prof') for name in os.listdir(tmp_path / 'profile'))
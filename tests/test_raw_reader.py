@@ -0,0 +1,55 @@
+import numpy as np
+
+from fixture.raw_reader import RawFile, EdgeReadError
+
+
+def write_raw(filepath, names, data):
+    # the same layout ngspice -r writes
+    header = ['Title: test', 'Date: today', 'Plotname: Transient Analysis',
+              'Flags: real', f'No. Variables: {len(names)}',
+              f'No. Points: {len(data)}', 'Variables:']
+    header += [f'\t{i}\t{name}\tvoltage' for i, name in enumerate(names)]
+    header += ['Binary:']
+    with open(filepath, 'wb') as f:
+        f.write(('\n'.join(header) + '\n').encode())
+        f.write(np.asarray(data, dtype=np.float64).tobytes())
+
+
+class Read:
+    def __init__(self, name, params=None):
+        self.name = name
+        self.params = params
+        self.value = None
+
+
+def test_raw_reader(tmp_path):
+    t = np.linspace(0, 10e-9, 1001)
+    clk = (np.sin(2*np.pi*1e9*t) > 0).astype(float)
+    ramp = t * 1e8
+    filepath = tmp_path / 'out.raw'
+    write_raw(filepath, ['time', 'v(clk)', 'v(ramp)'], np.column_stack((t, clk, ramp)))
+
+    raw = RawFile.open(filepath)
+    assert RawFile.open(filepath) is raw
+    assert isinstance(raw.plot['data'], np.memmap)
+
+    point = Read('ramp')
+    block = Read('ramp', {'style': 'block', 'duration': 1e-9})
+    edge_back = Read('clk', {'style': 'edge', 'rising': True, 'count': 2})
+    edge_fwd = Read('clk', {'style': 'edge', 'forward': True, 'rising': False})
+    missing = Read('clk', {'style': 'edge', 'count': 100})
+    other = Read('ramp', {'style': 'frequency'})
+    gets = [(2.5e-9, point), (3e-9, block), (4.2e-9, edge_back),
+            (4.2e-9, edge_fwd), (1e-9, missing), (0, other)]
+    fallbacks = []
+    raw.resolve_gets(gets, lambda read: read.name, 0.5,
+                     lambda time, read: fallbacks.append(read))
+
+    assert np.isclose(point.value, 0.25)
+    bt, bv = block.value
+    assert bt[0] <= 0 and bt[-1] >= 1e-9
+    assert np.allclose(bv, (bt + 3e-9) * 1e8)
+    assert np.allclose(edge_back.value, [-0.2e-9, -1.2e-9], atol=2e-11)
+    assert np.allclose(edge_fwd.value, [0.3e-9], atol=2e-11)
+    assert isinstance(missing.value, EdgeReadError)
+    assert fallbacks == [other]
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas
+
+from fixture.create_testbench import ResultsBuilder
+
+
+def test_results_builder():
+    rows = [{'f': 1.0, 'i': 1, 'maybe': None, 'vec': np.array([1.0, 2.0])},
+            {'f': None, 'i': 2.5, 'maybe': 3.0, 'vec': np.array([3.0, 4.0])},
+            {'f': 2.0, 'i': 3, 'maybe': 4.0, 'vec': np.array([5.0, 6.0])}]
+    builder = ResultsBuilder(len(rows))
+    for row, results_row in enumerate(rows):
+        builder.set_row(row, results_row)
+    columns = builder.finish()
+
+    # same dtypes pandas gives for lists of these values
+    for name in ['f', 'i', 'maybe']:
+        expected = pandas.Series([r[name] for r in rows])
+        assert columns[name].dtype == expected.dtype
+        assert np.allclose(columns[name], expected, equal_nan=True)
+    assert columns['vec'].shape == (3, 2)
+    assert np.array_equal(columns['vec'][:, 1], [2.0, 4.0, 6.0])
+
+
+def test_sharded_analysis_keys():
+    # two shards over two modes, analysed in shard order, which is not the
+    # order of the stitched results
+    import types
+    from fixture.create_testbench import Testbench
+    from fixture.signals import SignalIn, SignalManager, create_input_domain_signal
+
+    class KeyTest:
+        num_samples = 4
+        analysis_key = None
+
+        def __init__(self):
+            self.input = create_input_domain_signal('in_', (0.0, 1.0), spice_pin='in_')
+            en = SignalIn(None, 'true_digital', False, False, 'en', 'en', 'en', False)
+            self.signals = SignalManager([self.input, en], {})
+            self.seen = {}
+
+        def analysis(self, reads):
+            self.seen[self.analysis_key] = reads
+            return {'out': reads}
+
+    test = KeyTest()
+    template = types.SimpleNamespace(extras={})
+    tester = types.SimpleNamespace(circuit=types.SimpleNamespace(circuit=None))
+    test_vectors = {test.input: [0.0, 0.1, 0.2, 0.3]}
+    tbs = []
+    for samples in [[2, 3], [0, 1]]:
+        tb = Testbench(template, tester, test, test_vectors, sample_indices=samples)
+        tb.result_processing_list = [(m, i, (10*m[0] + i, {}))
+                                     for m in tb.modes for i in samples]
+        tbs.append(tb)
+
+    results = Testbench.stitch_results(tbs, [tb.get_results() for tb in tbs])
+    assert list(results.sample_id) == [0, 1, 2, 3, 0, 1, 2, 3]
+    assert list(results.out) == [0, 1, 2, 3, 10, 11, 12, 13]
+    for mode, sample, out in zip(results.mode_id, results.sample_id, results.out):
+        assert test.seen[(mode, sample)] == out
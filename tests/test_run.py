@@ -19,6 +19,55 @@ def test_simple_amp_direct():
     r(circuit_fname)
 
 
+def test_simple_amp_parallel(tmp_path, monkeypatch):
+    # checkpoints and run folders go in the cwd
+    monkeypatch.chdir(tmp_path)
+    circuit_fname = file_relative_to_test('./configs/simple_amp.yaml')
+
+    import fixture.run as r
+    r(circuit_fname, num_workers=2)
+
+
+def test_simple_amp_sharded(tmp_path, monkeypatch):
+    # checkpoints and run folders go in the cwd
+    monkeypatch.chdir(tmp_path)
+    circuit_fname = file_relative_to_test('./configs/simple_amp.yaml')
+
+    import fixture.run as r
+    r(circuit_fname, num_shards=2)
+
+
+def test_simple_amp_sim_cache(tmp_path, monkeypatch):
+    # checkpoints and run folders go in the cwd
+    monkeypatch.chdir(tmp_path)
+    circuit_fname = file_relative_to_test('./configs/simple_amp.yaml')
+
+    import fixture.run as r
+    # the second run should reuse the simulation from the first
+    r(circuit_fname, sim_cache=True)
+    r(circuit_fname, sim_cache=True)
+
+
+def test_simple_amp_incremental(tmp_path, monkeypatch):
+    # checkpoints and run folders go in the cwd
+    monkeypatch.chdir(tmp_path)
+    circuit_fname = file_relative_to_test('./configs/simple_amp.yaml')
+
+    import fixture.run as r
+    # nothing changed, so the second run should only redo the regression
+    r(circuit_fname, incremental=True)
+    r(circuit_fname, incremental=True)
+
+
+def test_simple_amp_adaptive(tmp_path, monkeypatch):
+    # checkpoints and run folders go in the cwd
+    monkeypatch.chdir(tmp_path)
+    circuit_fname = file_relative_to_test('./configs/simple_amp.yaml')
+
+    import fixture.run as r
+    r(circuit_fname, adaptive=True, adaptive_tol=0.05)
+
+
 def test_parameterized_amp():
     circuit_fname = file_relative_to_test('./configs/parameterized_amp.yaml')
     command = 'python -m fixture.run %s' % (circuit_fname)
@@ -3,6 +3,7 @@ import math
 from fixture import Sampler
 import pytest
 import random
+import numpy as np
 
 from fixture.signals import create_input_domain_signal
 
@@ -36,6 +37,35 @@ def test_analog():
         assert len(s) == N
         Sampler.assert_lhs(s)
 
+def test_analog_orthogonal():
+    for test in range(100):
+        d = random.randrange(1, 10)
+        N = random.randrange(d+1, 300)
+        s = Sampler.get_orthogonal_samples(d, N, np.random.default_rng(test))
+
+        # the first rpd^d points should land in different regions
+        rpd = Sampler.regions_per_dim(d, N)
+        num_regions = rpd**d
+        edges = np.round(np.arange(rpd+1) * N / rpd) / N
+        regions = np.searchsorted(edges, s[:num_regions], side='right') - 1
+        assert len(set(map(tuple, regions))) == num_regions
+
+    # same generator state gives the same samples
+    a = Sampler.get_orthogonal_samples(3, 50, np.random.default_rng(1))
+    b = Sampler.get_orthogonal_samples(3, 50, np.random.default_rng(1))
+    assert np.array_equal(a, b)
+
+def test_extend_analog():
+    for test in range(100):
+        d = random.randrange(1, 10)
+        N = random.randrange(d+1, 150)
+        s = Sampler.get_orthogonal_samples(d, N)
+        new = Sampler.extend_orthogonal_samples(s, 2*N)
+        assert new.shape == (N, d)
+        Sampler.assert_lhs(np.concatenate([s, new]))
+        # when doubling, the new points are an LHS design on their own too
+        Sampler.assert_lhs(new)
+
 def test_analog_signals():
     for test in range(100):
         d = random.randrange(1, 10)
@@ -124,6 +154,14 @@ def test_qa_therm_random():
         # each bit should turn on half the time
         Sampler.assert_fifty_fifty(bs)
 
+def test_qa_therm_random_wide():
+    for W, N in [(64, 2000), (256, 1001)]:
+        xs = Sampler.get_orthogonal_samples(1, N)[:, 0]
+        bs = Sampler.convert_qa_therm_random(xs, W)
+        assert bs.dtype == np.uint8
+        assert bs.shape == (N, W)
+        Sampler.assert_fifty_fifty(bs)
+
 def test_qa_binary():
     for test in range(100):
         W = random.randrange(1, 12)
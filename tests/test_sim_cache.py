@@ -0,0 +1,30 @@
+import types
+
+from fixture.sim_cache import SimCache
+
+
+def test_circuit_hash_follows_includes(tmp_path):
+    (tmp_path / 'models').mkdir()
+    top = tmp_path / 'top.sp'
+    top.write_text('* top\n.include "models/corner.sp"\n.LIB \'models/lib.sp\' tt\n')
+    corner = tmp_path / 'models' / 'corner.sp'
+    corner.write_text('.inc corner.sp\n.param vth=0.3\n')
+    lib = tmp_path / 'models' / 'lib.sp'
+    lib.write_text('.lib tt\n.include nested.sp\n.endl tt\n')
+    nested = tmp_path / 'models' / 'nested.sp'
+    nested.write_text('.param tox=1n\n')
+
+    simulator = types.SimpleNamespace(simulator_dict={'model_paths': [str(top)]},
+                                      test_config_dict={})
+    template = types.SimpleNamespace(simulator=simulator, extras={})
+
+    def circuit_hash():
+        return SimCache(str(tmp_path), template).circuit_hash()
+
+    before = circuit_hash()
+    assert circuit_hash() == before
+    nested.write_text('.param tox=2n\n')
+    after = circuit_hash()
+    assert after != before
+    corner.write_text('.inc corner.sp\n.param vth=0.4\n')
+    assert circuit_hash() != after
@@ -31,5 +31,18 @@ def test_invert_function(plot=False):
     for i in range(len(xs_test) - 1):
         assert xs_test[i+1] >= xs_test[i]
 
+def test_make_nondecreasing():
+    make_nondecreasing = fixture.template_creation_utils.make_nondecreasing
+    assert list(make_nondecreasing([1, 3, 2, 4])) == [1, 2.5, 2.5, 4]
+    assert list(make_nondecreasing([1, 3, 2], weights=[1, 1, 3])) == [1, 2.25, 2.25]
+    assert list(make_nondecreasing([4, 2, 3, 1], decreasing=True)) == [4, 2.5, 2.5, 1]
+
+def test_invert_function_decreasing():
+    xs = [i/50 for i in range(51)]
+    ys = [1 - x**2 for x in xs]
+    inv = fixture.template_creation_utils.invert_function(xs, ys)
+    for x in [0.1, 0.5, 0.9]:
+        assert abs(inv(1 - x**2) - x) < 1e-2
+
 if __name__ == '__main__':
     test_invert_function(plot=True)
\ No newline at end of file
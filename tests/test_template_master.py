@@ -79,6 +79,31 @@ def test_required_port_info():
     for port_name in SimpleBufTemplate.required_ports:
         assert port_name in text
 
+def test_debug_reads_only_with_debug():
+    signals = [
+        get_test_signal('in_single', 'myin'),
+        get_test_signal('out_single', 'myout')
+    ]
+    mapping = {'in_single': signals[0], 'out_single': signals[1]}
+    t = SimpleBufTemplate(SimpleBufCirc, None, SignalManager(signals, mapping))
+    test = SimpleBufTemplate.Test1(t)
+
+    class FakeTester:
+        def __init__(self):
+            self.reads = []
+        def get_value(self, signal, params):
+            self.reads.append((signal, params))
+            return object()
+
+    tester = FakeTester()
+    test.debug(tester, signals[1], 1)
+    assert tester.reads == [] and test.debug_dict == {}
+
+    t.debug = True
+    test.debug(tester, signals[1], 1)
+    assert tester.reads == [(signals[1], {'style': 'block', 'duration': 1})]
+    assert list(test.debug_dict) == [signals[1]]
+
 # TODO maybe do a full test on a circuit defined here
 
 if __name__ == '__main__':
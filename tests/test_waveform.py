@@ -0,0 +1,66 @@
+import numpy as np
+import scipy.interpolate
+
+from fixture.waveform import Waveform
+
+
+def test_waveform():
+    t = np.linspace(0, 1, 1001)
+    v = np.sin(10*t)
+    w = Waveform(t, v)
+
+    # still unpacks like the old (t, v) tuple
+    t2, v2 = w
+    assert t2 is not t and np.shares_memory(t2, t)
+    assert np.array_equal(w[1], v)
+
+    window = w.window(0.25, 0.5)
+    assert window.t[0] == 0.25 and window.t[-1] == 0.5
+    assert np.shares_memory(window.v, v)
+
+    ts = [0.3, 0.3337, 0.49]
+    assert np.allclose(window(ts), scipy.interpolate.interp1d(t, v)(ts))
+    try:
+        window(0.6)
+        assert False, 'should be out of range'
+    except ValueError:
+        pass
+
+    assert np.array_equal(np.concatenate([c.v for c in w.chunks(300)]), v)
+
+    # lazy values only get computed for the indices asked for
+    asked = []
+    def double(index):
+        asked.append(index)
+        return 2*v[index]
+    lazy = Waveform(t, double).window(0.5, 0.6)
+    assert np.allclose(lazy(0.55), 2*np.sin(5.5))
+    assert all(not isinstance(i, slice) for i in asked)
+
+    small = w.decimate(100)
+    assert small.num_points <= 100
+    assert max(small.v) == max(v) and min(small.v) == min(v)
+
+
+def test_waveform_memmap(tmp_path):
+    t = np.linspace(0, 1, 1001)
+    w = Waveform(t, lambda index: t[index]**2)
+    saved = w.window(0.1, 0.9).to_memmap(str(tmp_path / 'w'), chunk_size=64)
+    assert isinstance(saved.t, np.memmap)
+    assert np.allclose(saved.v, saved.t**2)
+    assert saved.t[0] == w.window(0.1, 0.9).t[0]
+
+
+def test_waveform_offset():
+    t = np.linspace(0, 1, 1001)
+    v = np.sin(10*t)
+    # a block read starting at 0.4, with its own time axis starting at 0
+    w = Waveform(t, v, 400, 601, offset=0.4)
+    assert np.allclose(w.t, t[400:601] - 0.4)
+    assert np.isclose(w(0.1), np.sin(5))
+
+    window = w.window(0.05, 0.1)
+    assert np.isclose(window.t[0], 0.05) and np.isclose(window.t[-1], 0.1)
+    assert np.shares_memory(window.v, v)
+    assert np.allclose(np.concatenate([c.t for c in w.chunks(64)]), w.t)
+    assert np.allclose(w.decimate(50).t[[0, -1]], [0, 0.2])